@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark da gravação de presenças: ORM linha a linha e apagar/reinserir
+(implementação antiga) contra INSERT em lote e atualização por diferença.
+
+Uso: python benchmarks/attendance_writes.py [--repeat N]
+
+Roda em um SQLite temporário; outro banco só com --database-url e
+--drop-database (ver benchmarks/common.py).
+"""
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+import common
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--repeat', type=int, default=20)
+# Antes de importar a aplicação, que lê DATABASE_URL
+args = common.parse_args(parser)
+
+from src.main import app
+from src.migrations import runner as migrations
+from src.models.models import db, User, Network, Cell, Member, AttendanceReport, Attendance
+from src.services.attendance import insert_attendances, sync_attendances
+
+SIZES = (10, 25, 50, 100, 200)
+
+def setup():
+    migrations.reset()
+    user = User(username='bench', email='bench@example.com', full_name='Bench', role='pastor')
+    user.set_password('bench')
+    db.session.add(user)
+    db.session.flush()
+    network = Network(name='Bench', supervisor_id=user.id)
+    db.session.add(network)
+    db.session.flush()
+    cell = Cell(name='Bench', leader_id=user.id, network_id=network.id)
+    db.session.add(cell)
+    db.session.flush()
+    db.session.add_all([Member(full_name=f'Membro {i}', member_type='membro', cell_id=cell.id) for i in range(max(SIZES))])
+    db.session.commit()
+    member_ids = [member_id for (member_id,) in db.session.query(Member.id).order_by(Member.id)]
+    return user.id, cell.id, member_ids
+
+def attendance_list(member_ids, size):
+    return [{'member_id': member_id, 'attendance_type': 'membro'} for member_id in member_ids[:size]]
+
+def new_report(user_id, cell_id, meeting_date):
+    report = AttendanceReport(cell_id=cell_id, meeting_date=meeting_date, created_by=user_id)
+    db.session.add(report)
+    db.session.flush()
+    return report
+
+def create_orm(report_id, attendances):
+    for attendance_data in attendances:
+        db.session.add(Attendance(report_id=report_id, **attendance_data))
+
+def update_orm(report_id, attendances):
+    Attendance.query.filter_by(report_id=report_id).delete()
+    create_orm(report_id, attendances)
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    db.session.commit()
+    return (time.perf_counter() - start) * 1000
+
+def main():
+    with app.app_context():
+        user_id, cell_id, member_ids = setup()
+        meeting_date = date(2000, 1, 2)
+        print(f"{'presenças':>10} {'criar ORM':>11} {'criar lote':>11} {'editar ORM':>11} {'editar diff':>12}  (ms, mediana)")
+        for size in SIZES:
+            attendances = attendance_list(member_ids, size)
+            # Edição típica: um nome trocado na lista
+            edited = attendances[:-1] + [{'visitor_name': 'Visitante', 'attendance_type': 'visitante'}]
+            results = {'create_orm': [], 'create_bulk': [], 'update_orm': [], 'update_diff': []}
+            for _ in range(args.repeat):
+                for create, update, create_key, update_key in (
+                    (create_orm, update_orm, 'create_orm', 'update_orm'),
+                    (insert_attendances, sync_attendances, 'create_bulk', 'update_diff'),
+                ):
+                    meeting_date += timedelta(days=1)
+                    report_id = new_report(user_id, cell_id, meeting_date).id
+                    results[create_key].append(timed(lambda: create(report_id, attendances)))
+                    results[update_key].append(timed(lambda: update(report_id, edited)))
+            medians = {key: statistics.median(values) for key, values in results.items()}
+            print(f"{size:>10} {medians['create_orm']:>11.2f} {medians['create_bulk']:>11.2f} "
+                  f"{medians['update_orm']:>11.2f} {medians['update_diff']:>12.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Banco de dados dos benchmarks.
+
+Por padrão cada execução usa um SQLite temporário novo. Outro banco (um
+Postgres local, por exemplo) só com --database-url, e, como o esquema é
+recriado do zero, apagar os dados dele exige também --drop-database. A
+variável DATABASE_URL do ambiente nunca é usada, para que um benchmark
+rodado no shell de um servidor não apague o banco da aplicação.
+
+Deve ser chamado antes de importar a aplicação (src.main lê DATABASE_URL
+na importação).
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def add_database_arguments(parser):
+    parser.add_argument('--database-url', help='banco a usar no lugar do SQLite temporário')
+    parser.add_argument('--drop-database', action='store_true',
+                        help='confirma que as tabelas de --database-url podem ser apagadas e recriadas')
+
+def parse_args(parser, keep_data=lambda args: False):
+    """Lê os argumentos e aponta DATABASE_URL para o banco do benchmark.
+
+    `keep_data(args)` diz se a execução usa os dados existentes (sem recriar
+    o esquema), o que só faz sentido com --database-url.
+    """
+    add_database_arguments(parser)
+    args = parser.parse_args()
+    if args.database_url:
+        if not keep_data(args) and not args.drop_database:
+            parser.error('--database-url apaga todas as tabelas do banco; confirme com --drop-database')
+        url = args.database_url
+    else:
+        if keep_data(args):
+            parser.error('usar os dados existentes exige --database-url')
+        url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = url
+    return args
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga dos endpoints principais, com orçamentos de latência.
+
+Cada cenário (listagem de relatórios e de membros, dashboard, criação de
+relatório e envio de foto) é executado por usuários simulados de cada perfil
+(pastor, discipulador e líder), em threads concorrentes, cada um com a sua
+sessão. Para cada cenário e perfil são registrados p50, p95 e p99 da
+latência e o número de comandos SQL por requisição; o resultado vai para um
+arquivo JSON e é comparado com os orçamentos de latência de
+benchmarks/budgets.json e com o orçamento de comandos SQL da rota
+(@query_budget) (saída 1 se algum for excedido ou se houver requisições com
+erro). Os orçamentos de latência valem para os parâmetros padrão.
+
+Uso: python benchmarks/endpoints.py [--users N] [--requests N] [--output arquivo.json]
+
+Roda em um SQLite temporário populado pelo próprio script. Outro banco só
+com --database-url: populado do zero com --drop-database, ou com --no-seed
+usando os dados já existentes, que precisam ter usuários com a senha
+--password (ver benchmarks/common.py).
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import common
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BUDGETS_FILE = os.path.join(BENCHMARKS_DIR, 'budgets.json')
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--users', type=int, default=4, help='usuários simultâneos por cenário e perfil')
+parser.add_argument('--requests', type=int, default=25, help='requisições medidas por usuário')
+parser.add_argument('--warmup', type=int, default=2, help='requisições descartadas por usuário')
+parser.add_argument('--scenarios', help='cenários separados por vírgula (padrão: todos)')
+parser.add_argument('--networks', type=int, default=14)
+parser.add_argument('--cells', type=int, default=200)
+parser.add_argument('--members-per-cell', type=int, default=25)
+parser.add_argument('--weeks', type=int, default=52)
+parser.add_argument('--seed', type=int, default=42)
+parser.add_argument('--no-seed', action='store_true', help='usa os dados já existentes em --database-url')
+parser.add_argument('--password', default='bench', help='senha dos usuários simulados')
+parser.add_argument('--auth', choices=('session', 'token'), default='session',
+                    help='autenticação pelo cookie de sessão ou pelo token Bearer')
+parser.add_argument('--output', default=os.path.join(BENCHMARKS_DIR, 'results', 'endpoints.json'))
+parser.add_argument('--budgets', default=BUDGETS_FILE, help="arquivo de orçamentos ('' para não comparar)")
+# Antes de importar a aplicação, que lê DATABASE_URL
+args = common.parse_args(parser, keep_data=lambda args: args.no_seed)
+
+from PIL import Image
+from sqlalchemy import event, insert, update, select, func
+from werkzeug.security import generate_password_hash
+from src.main import app
+from src.migrations import runner as migrations
+from src.models.models import db, User, Network, Cell, Member, AttendanceReport, Attendance
+from src.routes import photos
+from src.services import dashboard_stats, retention
+from src.services.query_audit import route_budget
+
+ROLES = ('pastor', 'discipulador', 'lider')
+MEMBER_TYPES = ('membro', 'membro', 'membro', 'fa', 'visitante')
+
+# Comandos SQL da requisição em andamento em cada thread
+_queries = threading.local()
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    _queries.count = getattr(_queries, 'count', 0) + 1
+
+def seed(networks, cells, members_per_cell, weeks, rng, password):
+    """Popula o banco com dados sintéticos: um pastor, um discipulador para
+    cada duas redes e um líder por célula"""
+    migrations.reset()
+    password_hash = generate_password_hash(password)
+    users = [{'username': 'pastor', 'email': 'pastor@bench', 'full_name': 'Pastor', 'role': 'pastor',
+              'password_hash': password_hash}]
+    users += [{'username': f'disc{i}', 'email': f'disc{i}@bench', 'full_name': f'Discipulador {i}',
+               'role': 'discipulador', 'password_hash': password_hash} for i in range((networks + 1) // 2)]
+    users += [{'username': f'lider{i}', 'email': f'lider{i}@bench', 'full_name': f'Líder {i}',
+               'role': 'lider', 'password_hash': password_hash} for i in range(cells)]
+    db.session.execute(insert(User), users)
+    user_ids = dict(db.session.execute(select(User.username, User.id)).all())
+
+    db.session.execute(insert(Network), [{'name': f'Rede {i}', 'supervisor_id': user_ids[f'disc{i // 2}']}
+                                         for i in range(networks)])
+    network_ids = db.session.scalars(select(Network.id).order_by(Network.id)).all()
+    db.session.execute(insert(Cell), [{'name': f'Célula {i}', 'leader_id': user_ids[f'lider{i}'],
+                                       'network_id': network_ids[i % networks]} for i in range(cells)])
+    cell_ids = db.session.scalars(select(Cell.id).order_by(Cell.id)).all()
+
+    # Pelo ORM, para os validadores preencherem as colunas normalizadas
+    db.session.add_all([
+        Member(full_name=f'Membro {cell_id}-{i}', phone=f'(11) 9{cell_id:04d}-{i:04d}',
+               email=f'membro{cell_id}_{i}@bench', member_type=rng.choice(MEMBER_TYPES), cell_id=cell_id)
+        for cell_id in cell_ids for i in range(members_per_cell)
+    ])
+    db.session.flush()
+    members = {}
+    for member_id, cell_id, member_type in db.session.execute(
+        select(Member.id, Member.cell_id, Member.member_type).order_by(Member.id)
+    ):
+        members.setdefault(cell_id, []).append((member_id, member_type))
+
+    first_week = date.today() - timedelta(weeks=weeks)
+    reports = [{'cell_id': cell_id, 'meeting_date': first_week + timedelta(weeks=week),
+                'created_by': user_ids[f'lider{index}']}
+               for week in range(weeks) for index, cell_id in enumerate(cell_ids)]
+    db.session.execute(insert(AttendanceReport), reports)
+    attendances, totals = [], {}
+    for report_id, cell_id in db.session.execute(
+        select(AttendanceReport.id, AttendanceReport.cell_id).order_by(AttendanceReport.id)
+    ):
+        present = [member for member in members[cell_id] if rng.random() < 0.7]
+        attendances += [{'report_id': report_id, 'member_id': member_id, 'attendance_type': member_type}
+                        for member_id, member_type in present]
+        totals[report_id] = [sum(1 for _, kind in present if kind == member_type)
+                             for member_type in ('membro', 'fa', 'visitante')]
+    db.session.execute(insert(Attendance), attendances)
+    db.session.execute(update(AttendanceReport), [
+        {'id': report_id, 'members_present': m, 'fas_present': f, 'visitors_present': v}
+        for report_id, (m, f, v) in totals.items()
+    ])
+    db.session.commit()
+
+    dashboard_stats.rebuild()
+    retention.rebuild()
+    db.session.commit()
+
+def dataset():
+    return {name: db.session.scalar(select(func.count()).select_from(model)) for name, model in (
+        ('users', User), ('networks', Network), ('cells', Cell), ('members', Member),
+        ('reports', AttendanceReport), ('attendances', Attendance),
+    )}
+
+def role_users():
+    """Usuários de cada perfil e as células ativas no escopo de cada um"""
+    cells = db.session.execute(
+        select(Cell.id, Cell.leader_id, Network.supervisor_id).join(Network).where(Cell.is_active == True)
+    ).all()
+    result = {}
+    for role in ROLES:
+        users = db.session.execute(
+            select(User.id, User.username).where(User.role == role, User.is_active == True).order_by(User.id)
+        ).all()
+        result[role] = []
+        for user_id, username in users:
+            scope = [cell_id for cell_id, leader_id, supervisor_id in cells
+                     if role == 'pastor' or user_id in (leader_id, supervisor_id)]
+            if scope:
+                result[role].append((username, scope))
+    members = {}
+    for member_id, cell_id, member_type in db.session.execute(
+        select(Member.id, Member.cell_id, Member.member_type).where(Member.is_active == True)
+    ):
+        members.setdefault(cell_id, []).append({'member_id': member_id, 'attendance_type': member_type})
+    return result, members
+
+# Datas das reuniões criadas pelo benchmark, únicas e fora do intervalo dos dados
+_meeting_days = itertools.count()
+FIRST_BENCH_DATE = date(2100, 1, 1)
+
+def create_report_request(rng, scope, members):
+    cell_id = rng.choice(scope)
+    meeting_date = FIRST_BENCH_DATE + timedelta(days=next(_meeting_days))
+    attendances = [attendance for attendance in members.get(cell_id, []) if rng.random() < 0.7]
+    return 'POST', '/api/reports/', {'json': {
+        'cell_id': cell_id, 'meeting_date': meeting_date.isoformat(), 'attendances': attendances,
+    }}
+
+def upload_photo_request(rng, scope, members):
+    # Conteúdo único a cada envio, para não cair na deduplicação de arquivos
+    image = Image.effect_noise((640, 480), 40).convert('RGB')
+    image.putpixel((0, 0), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    buffer.seek(0)
+    return 'POST', '/api/photos/upload', {'data': {
+        'file': (buffer, 'bench.jpg'), 'cell_id': str(rng.choice(scope)), 'description': 'Benchmark',
+    }, 'content_type': 'multipart/form-data'}
+
+SCENARIOS = {
+    'get_reports': lambda rng, scope, members: ('GET', '/api/reports/', {}),
+    'get_members': lambda rng, scope, members: ('GET', '/api/members/', {}),
+    'get_dashboard_data': lambda rng, scope, members: ('GET', '/api/reports/dashboard', {}),
+    'create_report': create_report_request,
+    'upload_photo': upload_photo_request,
+}
+SUCCESS = {'GET': 200, 'POST': 201}
+
+def simulated_user(username, password, auth, scope, members, build_request, requests, warmup, seed_value, samples):
+    rng = random.Random(seed_value)
+    client = app.test_client()
+    response = client.post('/api/auth/login', json={'username': username, 'password': password})
+    if response.status_code != 200:
+        raise RuntimeError(f'Login de {username} falhou: {response.status_code}')
+    if auth == 'token':
+        # Sem o cookie de sessão: autorização apenas pelo token
+        client = app.test_client()
+        client.environ_base['HTTP_AUTHORIZATION'] = f"Bearer {response.get_json()['token']}"
+    for index in range(warmup + requests):
+        method, path, options = build_request(rng, scope, members)
+        _queries.count = 0
+        started = time.perf_counter()
+        response = client.open(path, method=method, **options)
+        elapsed = time.perf_counter() - started
+        if index >= warmup:
+            samples.append((elapsed, _queries.count, response.status_code == SUCCESS[method],
+                            route_budget(app, method, path)))
+
+def percentile(cuts, value):
+    return round(cuts[value - 1] * 1000, 2)
+
+def run_scenario(name, role, users, members, concurrency, requests, warmup, password, auth):
+    samples, threads = [], []
+    for index in range(concurrency):
+        username, scope = users[index % len(users)]
+        threads.append(threading.Thread(target=simulated_user, args=(
+            username, password, auth, scope, members, SCENARIOS[name], requests, warmup,
+            f'{name}:{role}:{index}', samples,
+        )))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies = [elapsed for elapsed, _, _, _ in samples]
+    queries = [count for _, count, _, _ in samples]
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, _, ok, _ in samples if not ok),
+        'p50_ms': percentile(cuts, 50),
+        'p95_ms': percentile(cuts, 95),
+        'p99_ms': percentile(cuts, 99),
+        'queries_per_request': round(statistics.mean(queries), 2) if queries else 0,
+        'max_queries': max(queries, default=0),
+        'query_budget': min((budget for _, _, _, budget in samples), default=0),
+        'requests_per_second': round(len(samples) / wall, 1) if wall else 0,
+    }
+
+def check_budgets(results, budgets):
+    """Lista das violações dos orçamentos (por cenário, valem para todos os perfis).
+
+    Os orçamentos de latência vêm de budgets.json; o de comandos SQL é o da
+    rota (@query_budget), o mesmo verificado pelos testes.
+    """
+    violations = []
+    for name, by_role in results.items():
+        budget = budgets.get(name, {})
+        for role, result in by_role.items():
+            if result['errors']:
+                violations.append(f"{name} ({role}): {result['errors']} requisições com erro")
+            for field in ('p50_ms', 'p95_ms', 'p99_ms'):
+                if field in budget and result[field] > budget[field]:
+                    violations.append(f"{name} ({role}): {field} {result[field]} acima do orçamento {budget[field]}")
+            if result['max_queries'] > result['query_budget']:
+                violations.append(f"{name} ({role}): max_queries {result['max_queries']} acima do orçamento "
+                                  f"da rota {result['query_budget']}")
+    return violations
+
+def main():
+    # Fotos enviadas vão para uma pasta temporária, não para src/static
+    photos.UPLOAD_PATH = tempfile.mkdtemp(prefix='bench-photos-')
+
+    with app.app_context():
+        event.listen(db.engine, 'after_cursor_execute', _count_query)
+        if not args.no_seed:
+            started = time.perf_counter()
+            seed(args.networks, args.cells, args.members_per_cell, args.weeks, random.Random(args.seed), args.password)
+            print(f"Dados gerados em {time.perf_counter() - started:.1f}s")
+        sizes = dataset()
+        users, members = role_users()
+        db.session.remove()
+
+    print(', '.join(f'{count} {name}' for name, count in sizes.items()))
+    print(f"{'cenário':<20} {'perfil':<13} {'req':>5} {'erros':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'SQL/req':>8} {'req/s':>7}")
+    results = {}
+    for name in args.scenarios.split(',') if args.scenarios else SCENARIOS:
+        results[name] = {}
+        for role in ROLES:
+            if not users[role]:
+                continue
+            result = run_scenario(name, role, users[role], members, args.users, args.requests, args.warmup,
+                                  args.password, args.auth)
+            results[name][role] = result
+            print(f"{name:<20} {role:<13} {result['requests']:>5} {result['errors']:>5} {result['p50_ms']:>8.1f} "
+                  f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['queries_per_request']:>8.1f} "
+                  f"{result['requests_per_second']:>7.1f}")
+
+    with app.app_context():
+        backend = db.engine.dialect.name
+    report = {
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'database': backend,
+        'dataset': sizes,
+        'users': args.users,
+        'auth': args.auth,
+        'requests_per_user': args.requests,
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as target:
+        json.dump(report, target, indent=2)
+    print(f"Resultados em {args.output}")
+
+    if args.budgets:
+        with open(args.budgets) as source:
+            budgets = json.load(source)
+        violations = check_budgets(results, budgets)
+        for violation in violations:
+            print(f"ORÇAMENTO EXCEDIDO: {violation}")
+        if violations:
+            sys.exit(1)
+        print("Todos os orçamentos respeitados")
+
+if __name__ == '__main__':
+    main()
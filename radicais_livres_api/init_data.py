@@ -1,20 +1,32 @@
 #!/usr/bin/env python3
 """
 Script para inicializar dados de exemplo no banco de dados
+
+Uso:
+    python init_data.py            dados de exemplo (poucos registros)
+    python init_data.py --scale    volume de produção (ver init_scale_data e --help)
 """
+import argparse
+import csv
+import io
 import os
 import sys
+import time
 sys.path.insert(0, os.path.dirname(__file__))
 
+import numpy as np
+from werkzeug.security import generate_password_hash
 from src.main import app
-from src.models.models import db, User, Network, Cell, Member
-from datetime import datetime
+from src.models.models import db, User, Network, Cell, Member, AttendanceReport, Attendance
+from src.services import dashboard_stats, retention
+from src.migrations import runner as migrations
+from src.services.normalization import strip_accents, normalize_phone, normalize_email, searchable_text
+from datetime import datetime, date, timedelta
 
 def init_sample_data():
     with app.app_context():
         # Limpar dados existentes
-        db.drop_all()
-        db.create_all()
+        migrations.reset()
         
         print("Criando usuários de exemplo...")
         
@@ -141,6 +153,8 @@ def init_sample_data():
         
         db.session.commit()
         
+        dashboard_stats.rebuild()
+        
         print("Dados de exemplo criados com sucesso!")
         print("\nCredenciais de acesso:")
         print("Pastor Admin: pastor_admin / admin123")
@@ -150,6 +164,248 @@ def init_sample_data():
         print("Líder 2: lider2 / lider123")
         print("Líder 3: lider3 / lider123")
 
-if __name__ == '__main__':
-    init_sample_data()
+# Modo de escala: dados sintéticos em volume de produção
+
+FIRST_NAMES = (
+    'Ana', 'Antônio', 'Beatriz', 'Bruno', 'Camila', 'Carlos', 'Cecília', 'Daniel', 'Débora', 'Eduardo',
+    'Elaine', 'Fábio', 'Fernanda', 'Francisco', 'Gabriel', 'Gabriela', 'Helena', 'Igor', 'Isabela', 'João',
+    'Joana', 'José', 'Júlia', 'Larissa', 'Lucas', 'Luíza', 'Marcos', 'Maria', 'Mariana', 'Mateus',
+    'Natália', 'Otávio', 'Patrícia', 'Paulo', 'Pedro', 'Rafael', 'Raquel', 'Renata', 'Ricardo', 'Rodrigo',
+    'Sabrina', 'Samuel', 'Sérgio', 'Sônia', 'Tatiane', 'Thiago', 'Valéria', 'Vinícius', 'Vitória', 'Wagner',
+)
+SURNAMES = (
+    'Almeida', 'Alves', 'Araújo', 'Barbosa', 'Cardoso', 'Carvalho', 'Castro', 'Conceição', 'Costa', 'Cunha',
+    'Dias', 'Fernandes', 'Ferreira', 'Freitas', 'Gomes', 'Gonçalves', 'Lima', 'Lopes', 'Machado', 'Martins',
+    'Melo', 'Mendes', 'Monteiro', 'Moreira', 'Nascimento', 'Nunes', 'Oliveira', 'Pereira', 'Pinto', 'Ribeiro',
+    'Rocha', 'Rodrigues', 'Santos', 'Silva', 'Soares', 'Sousa', 'Teixeira', 'Vieira', 'da Silva', 'dos Santos',
+)
+NETWORK_NAMES = ('Reset', 'Revayah', 'Tetelestai', 'Kadosh', 'Ekbalo', 'Nazireus', 'Nexteens')
+WEEKDAYS = ('Segunda-feira', 'Terça-feira', 'Quarta-feira', 'Quinta-feira', 'Sexta-feira', 'Sábado', 'Domingo')
+MEETING_TIMES = ('19:00', '19:30', '20:00', '20:30')
+EMAIL_DOMAINS = ('gmail.com', 'hotmail.com', 'outlook.com', 'yahoo.com.br', 'uol.com.br')
+MEMBER_TYPES = ('membro', 'fa', 'visitante')
+MEMBER_TYPE_WEIGHTS = (0.6, 0.25, 0.15)
+# Assiduidade (distribuição beta) por tipo de membro
+ATTENDANCE_BETA = {'membro': (4, 2), 'fa': (2, 3), 'visitante': (1, 4)}
+# Fração das células que já existiam no início do período (as demais surgem ao longo dele)
+FOUNDING_CELLS = 0.4
+CLOSED_CELLS = 0.08
+INACTIVE_MEMBERS = 0.06
+REPORT_RATE = 0.92
+VISITORS_PER_MEETING = 0.8
+# Linhas acumuladas antes de gravar um lote
+CHUNK_ROWS = 200000
+
+def _bulk_writer(conn):
+    """Grava tuplas em uma tabela: COPY no Postgres, executemany no SQLite e
+    INSERT em lote do SQLAlchemy nos demais bancos"""
+    dialect = conn.dialect.name
+    if dialect == 'postgresql':
+        def write(table, columns, rows):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            with conn.connection.dbapi_connection.cursor() as cursor:
+                cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    elif dialect == 'sqlite':
+        def write(table, columns, rows):
+            placeholders = ', '.join('?' * len(columns))
+            conn.exec_driver_sql(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+    else:
+        def write(table, columns, rows):
+            conn.execute(db.metadata.tables[table].insert(), [dict(zip(columns, row)) for row in rows])
+    return write
+
+def _person_name(rng):
+    first, surname, other, double = rng.random(4)
+    name = f'{FIRST_NAMES[int(first * len(FIRST_NAMES))]} {SURNAMES[int(surname * len(SURNAMES))]}'
+    # Um terço dos nomes com dois sobrenomes (diferentes)
+    if double < 0.33:
+        name += ' ' + SURNAMES[(int(surname * len(SURNAMES)) + 1 + int(other * (len(SURNAMES) - 1))) % len(SURNAMES)]
+    return name
+
+def _member_row(rng, member_id, cell_id, member_type, is_active, joined):
+    full_name = _person_name(rng)
+    phone = f'(11) 9{rng.integers(1000, 10000)}-{rng.integers(10000):04d}' if rng.random() < 0.9 else None
+    email = None
+    if rng.random() < 0.6:
+        local = strip_accents(full_name).lower().replace(' ', '.')
+        email = f'{local}{member_id}@{EMAIL_DOMAINS[rng.integers(len(EMAIL_DOMAINS))]}'
+    phone_key, email_key = normalize_phone(phone), normalize_email(email)
+    return (member_id, full_name, phone, email, member_type, cell_id, is_active, f'{joined} 20:00:00',
+            phone_key, email_key, searchable_text(full_name, email, phone_key))
+
+MEMBER_COLUMNS = ('id', 'full_name', 'phone', 'email', 'member_type', 'cell_id', 'is_active', 'created_at',
+                  'phone_normalized', 'email_normalized', 'search_text')
+REPORT_COLUMNS = ('id', 'cell_id', 'meeting_date', 'members_present', 'fas_present', 'visitors_present',
+                  'created_by', 'created_at')
+ATTENDANCE_COLUMNS = ('report_id', 'member_id', 'visitor_name', 'attendance_type')
+
+def _meeting_days(rng, first_day, weekday, start, end):
+    """Dias (desde first_day) das reuniões semanais com relatório entre `start` e `end`"""
+    first = start + (weekday - (first_day + timedelta(days=start)).weekday()) % 7
+    days = np.arange(first, end + 1, 7)
+    return days[rng.random(len(days)) < REPORT_RATE]
+
+def init_scale_data(networks=50, cells=2000, members=100000, years=5, seed=42, password='senha123'):
+    """Gera dados realistas em volume de produção, de forma determinística
+    (mesma semente, mesmos dados, relativos à data de hoje).
+
+    Cada célula tem um líder e reuniões semanais desde a sua criação (parte
+    delas já existia no início do período, as demais surgem ao longo dele e
+    algumas são encerradas). Os membros entram nas células ao longo do tempo
+    e comparecem conforme a sua assiduidade; cada reunião recebe também
+    visitantes avulsos. As linhas são gravadas em lotes (executemany no
+    SQLite, COPY no Postgres) e os agregados recalculados no final.
+    """
+    rng = np.random.default_rng(seed)
+    last_day = date.today()
+    first_day = last_day - timedelta(days=int(365 * years))
+    period = (last_day - first_day).days
+    started = time.perf_counter()
+
+    with app.app_context():
+        migrations.reset()
+
+        # Os defaults das colunas são do SQLAlchemy: as linhas levam is_active e created_at
+        created_at = f'{first_day} 12:00:00'
+        password_hash = generate_password_hash(password)
+        users = [(1, 'pastor_admin', 'pastor@videira.com.br', password_hash, 'Pastor Administrador', 'pastor')]
+        supervisors = list(range(2, networks + 2))
+        users += [(user_id, f'discipulador{index}', f'disc{index}@videira.com.br', password_hash,
+                   _person_name(rng), 'discipulador') for index, user_id in enumerate(supervisors, 1)]
+        leaders = list(range(networks + 2, networks + 2 + cells))
+        users += [(user_id, f'lider{index}', f'lider{index}@videira.com.br', password_hash,
+                   _person_name(rng), 'lider') for index, user_id in enumerate(leaders, 1)]
+        users = [user + (True, created_at) for user in users]
+
+        network_rows = [(index + 1, NETWORK_NAMES[index] if index < len(NETWORK_NAMES) else f'Rede {index + 1}',
+                         supervisors[index], True, created_at) for index in range(networks)]
+
+        # Células: data de criação, encerramento, rede e dia da semana
+        cell_network = rng.integers(1, networks + 1, cells)
+        cell_start = np.where(rng.random(cells) < FOUNDING_CELLS, 0, rng.integers(0, period - 30, cells))
+        cell_closed = np.where(rng.random(cells) < CLOSED_CELLS,
+                               cell_start + (rng.random(cells) * (period - cell_start)).astype(int), -1)
+        cell_weekday = rng.integers(0, 7, cells)
+        cell_rows = [(
+            index + 1, f'Célula {SURNAMES[index % len(SURNAMES)]} {index + 1}', leaders[index],
+            int(cell_network[index]), WEEKDAYS[cell_weekday[index]],
+            MEETING_TIMES[rng.integers(len(MEETING_TIMES))],
+            f'Casa de {FIRST_NAMES[rng.integers(len(FIRST_NAMES))]}', bool(cell_closed[index] < 0),
+            f'{first_day + timedelta(days=int(cell_start[index]))} 12:00:00',
+        ) for index in range(cells)]
 
+        # Tamanho das células varia (gama), somando exatamente `members`
+        weights = rng.gamma(2.0, 1.0, cells)
+        cell_sizes = rng.multinomial(members, weights / weights.sum())
+
+        with db.engine.begin() as conn:
+            write = _bulk_writer(conn)
+            write('users', ('id', 'username', 'email', 'password_hash', 'full_name', 'role', 'is_active',
+                            'created_at'), users)
+            write('networks', ('id', 'name', 'supervisor_id', 'is_active', 'created_at'), network_rows)
+            write('cells', ('id', 'name', 'leader_id', 'network_id', 'meeting_day', 'meeting_time', 'location',
+                            'is_active', 'created_at'), cell_rows)
+
+            # Índices das tabelas grandes são criados depois da carga, de uma vez
+            deferred = [index for model in (Member, AttendanceReport, Attendance) for index in model.__table__.indexes]
+            for index in deferred:
+                index.drop(conn)
+
+            totals = {'members': 0, 'reports': 0, 'attendances': 0}
+            member_rows, report_rows, attendance_rows = [], [], []
+            next_member, next_report = 1, 1
+
+            def flush():
+                write('members', MEMBER_COLUMNS, member_rows)
+                write('attendance_reports', REPORT_COLUMNS, report_rows)
+                write('attendances', ATTENDANCE_COLUMNS, attendance_rows)
+                totals['members'] += len(member_rows)
+                totals['reports'] += len(report_rows)
+                totals['attendances'] += len(attendance_rows)
+                member_rows.clear()
+                report_rows.clear()
+                attendance_rows.clear()
+
+            for index in range(cells):
+                cell_id, size = index + 1, int(cell_sizes[index])
+                start = int(cell_start[index])
+                end = int(cell_closed[index]) if cell_closed[index] >= 0 else period
+
+                # Membros: fundadores entram com a célula, os demais ao longo da sua vida
+                types = rng.choice(len(MEMBER_TYPES), size, p=MEMBER_TYPE_WEIGHTS)
+                joined = np.where(rng.random(size) < 0.3, start, rng.integers(start, end + 1, size))
+                left = np.where(rng.random(size) < INACTIVE_MEMBERS,
+                                joined + (rng.random(size) * (end - joined)).astype(int), period + 1)
+                assiduity = np.array([rng.beta(*ATTENDANCE_BETA[MEMBER_TYPES[kind]]) for kind in types])
+                member_ids = np.arange(next_member, next_member + size)
+                next_member += size
+                for member_id, kind, joined_day, left_day in zip(member_ids.tolist(), types.tolist(),
+                                                                 joined.tolist(), left.tolist()):
+                    member_rows.append(_member_row(rng, member_id, cell_id, MEMBER_TYPES[kind], left_day > period,
+                                                   first_day + timedelta(days=joined_day)))
+
+                # Reuniões e presenças (matriz membro x reunião)
+                days = _meeting_days(rng, first_day, int(cell_weekday[index]), start, end)
+                if not len(days):
+                    continue
+                present = (rng.random((size, len(days))) < assiduity[:, None]) & \
+                          (joined[:, None] <= days) & (days < left[:, None])
+                visitors = rng.poisson(VISITORS_PER_MEETING, len(days))
+                counts = np.stack([present[types == kind].sum(axis=0) for kind in range(len(MEMBER_TYPES))], axis=1)
+
+                report_ids = range(next_report, next_report + len(days))
+                next_report += len(days)
+                for report_id, day, (members_present, fas_present, visitors_present), extra in zip(
+                    report_ids, days.tolist(), counts.tolist(), visitors.tolist()
+                ):
+                    meeting_date = first_day + timedelta(days=day)
+                    report_rows.append((report_id, cell_id, meeting_date.isoformat(), members_present,
+                                        fas_present, visitors_present + extra, leaders[index],
+                                        f'{meeting_date + timedelta(days=1)} 21:00:00'))
+                    attendance_rows.extend((report_id, None, _person_name(rng), 'visitante') for _ in range(extra))
+
+                member_index, meeting_index = np.nonzero(present)
+                attendance_rows.extend(zip(
+                    (report_ids.start + meeting_index).tolist(), member_ids[member_index].tolist(),
+                    [None] * len(member_index), [MEMBER_TYPES[kind] for kind in types[member_index].tolist()],
+                ))
+                if len(attendance_rows) >= CHUNK_ROWS:
+                    flush()
+            flush()
+            for index in deferred:
+                index.create(conn)
+
+            if conn.dialect.name == 'postgresql':
+                for table in ('users', 'networks', 'cells', 'members', 'attendance_reports'):
+                    conn.exec_driver_sql(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                                         f"(SELECT max(id) FROM {table}))")
+        loaded = time.perf_counter() - started
+        print(f"{len(users)} usuários, {networks} redes, {cells} células, {totals['members']} membros, "
+              f"{totals['reports']} relatórios e {totals['attendances']} presenças gravados em {loaded:.1f}s")
+
+        dashboard_stats.rebuild()
+        retention.rebuild()
+        db.session.commit()
+        print(f"Estatísticas e retenção recalculadas em {time.perf_counter() - started - loaded:.1f}s")
+        print(f"\nTodos os usuários usam a senha '{password}': pastor_admin, "
+              f"discipulador1..{networks}, lider1..{cells}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', action='store_true', help='gera dados sintéticos em volume de produção')
+    parser.add_argument('--networks', type=int, default=50)
+    parser.add_argument('--cells', type=int, default=2000)
+    parser.add_argument('--members', type=int, default=100000)
+    parser.add_argument('--years', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--password', default='senha123', help='senha de todos os usuários gerados')
+    args = parser.parse_args()
+    if args.scale:
+        init_scale_data(args.networks, args.cells, args.members, args.years, args.seed, args.password)
+    else:
+        init_sample_data()
+
+if __name__ == '__main__':
+    main()
@@ -3,23 +3,39 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask
+from werkzeug.exceptions import NotFound
 from flask_cors import CORS
-from src.models.models import db
+from src.models.models import db, Photo
 from src.routes.user import user_bp
 from src.routes.auth import auth_bp
 from src.routes.cells import cells_bp
 from src.routes.networks import networks_bp
 from src.routes.reports import reports_bp
 from src.routes.members import members_bp
-from src.routes.photos import photos_bp
+from src.routes.photos import photos_bp, ensure_upload_folder
 from src.routes.pastors import pastors_bp
+from src.services import dashboard_stats, retention, photo_variants, photo_storage, chunked_uploads, compression, member_dedup, database, metrics, query_audit, auth_tokens
+from src.services.static_files import send_static
+from src.migrations import runner as migrations
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
 
 # Habilitar CORS para permitir requisições do frontend
-CORS(app)
+CORS(app, expose_headers=['X-Auth-Token'])
+
+# Comprimir respostas JSON grandes (gzip/brotli)
+app.after_request(compression.compress_response)
+
+# Latência e SQL por rota, expostos em /api/metrics
+metrics.init_app(app)
+
+# N+1, consultas lentas e orçamento de consultas por rota (SQL_AUDIT=log|strict)
+query_audit.init_app(app)
+
+# Token renovado (X-Auth-Token) quando a versão de escopo do token mudou
+auth_tokens.init_app(app)
 
 # Registrar blueprints
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -34,9 +50,99 @@ app.register_blueprint(pastors_bp, url_prefix='/api/pastors')
 # uncomment if you need to use database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL") or f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database.engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 db.init_app(app)
 with app.app_context():
-    db.create_all()
+    database.install(db.engine)
+    metrics.install(db.engine)
+    query_audit.install(db.engine)
+
+@app.cli.command('rebuild-dashboard-stats')
+def rebuild_dashboard_stats():
+    """Recalcula do zero as estatísticas materializadas do dashboard"""
+    rows = dashboard_stats.rebuild()
+    print(f"{rows} escopos recalculados")
+
+@app.cli.command('rebuild-retention')
+def rebuild_retention():
+    """Recalcula do zero a frequência e retenção de todos os membros"""
+    rows = retention.rebuild()
+    db.session.commit()
+    print(f"{rows} membros recalculados")
+
+@app.cli.command('detect-duplicates')
+def detect_duplicates():
+    """Recalcula as sugestões de membros duplicados"""
+    found = member_dedup.detect()
+    db.session.commit()
+    print(f"{found} pares de possíveis duplicados")
+
+@app.cli.command('generate-photo-variants')
+def generate_photo_variants():
+    """Gera as variantes que faltam (fotos enviadas antes do pool ou com falha)"""
+    upload_path = ensure_upload_folder()
+    pending = Photo.query.filter((Photo.thumbnail_filename == None) | (Photo.webp_filename == None)).all()
+    generated = {}
+    for photo in pending:
+        try:
+            # Fotos com o mesmo conteúdo compartilham arquivo e variantes
+            if photo.filename not in generated:
+                generated[photo.filename] = photo_variants.generate(upload_path, photo.filename)
+            for column, filename in generated[photo.filename].items():
+                setattr(photo, column, filename)
+        except (OSError, ValueError) as e:
+            print(f"Foto {photo.id} ({photo.filename}): {e}")
+    db.session.commit()
+    print(f"{len(pending)} fotos processadas")
+
+@app.cli.command('migrate-photo-blobs')
+def migrate_photo_blobs():
+    """Passa as fotos antigas para o armazenamento por conteúdo, juntando as repetidas"""
+    upload_path = ensure_upload_folder()
+    migrated = 0
+    for photo in Photo.query.filter(Photo.blob_sha256 == None).all():
+        try:
+            photo_storage.migrate_legacy(photo, upload_path)
+            db.session.commit()
+            migrated += 1
+        except OSError as e:
+            db.session.rollback()
+            print(f"Foto {photo.id}: {e}")
+    print(f"{migrated} fotos migradas; rode `flask generate-photo-variants` para as variantes")
+
+@app.cli.command('purge-uploads')
+def purge_uploads():
+    """Remove uploads em partes abandonados"""
+    removed = chunked_uploads.purge_expired()
+    db.session.commit()
+    print(f"{removed} uploads removidos")
+
+@app.cli.command('compress-static')
+def compress_static():
+    """Gera os arquivos .gz/.br do build em src/static (rodar após copiar o build)"""
+    written = compression.compress_folder(app.static_folder)
+    print(f"{written} arquivos comprimidos gerados")
+
+@app.cli.command('db-upgrade')
+def db_upgrade():
+    """Aplica as migrações de esquema pendentes"""
+    applied = migrations.upgrade()
+    for version, name in applied:
+        print(f"Migração {version:03d} ({name}) aplicada")
+    if not applied:
+        print("Nenhuma migração pendente")
+
+@app.cli.command('db-stats')
+def db_stats():
+    """Mostra a configuração do pool e as esperas por lock (deste processo)"""
+    for key, value in database.stats(db.engine).items():
+        print(f"{key}: {value}")
+
+@app.cli.command('db-status')
+def db_status():
+    """Lista as migrações de esquema e se já foram aplicadas"""
+    for version, name, applied in migrations.status():
+        print(f"{version:03d} {name}: {'aplicada' if applied else 'pendente'}")
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -45,15 +151,16 @@ def serve(path):
     if static_folder_path is None:
             return "Static folder not configured", 404
 
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
-
+    # send_from_directory já confere a existência do arquivo (um único stat)
+    if path != "":
+        try:
+            return send_static(static_folder_path, path)
+        except NotFound:
+            pass
+    try:
+        return send_static(static_folder_path, 'index.html', immutable=False)
+    except NotFound:
+        return "index.html not found", 404
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=os.environ.get('PORT', 5000), debug=False)
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""
+Migrações versionadas do esquema.
+
+Cada migração é um módulo `vNNN_descricao.py` neste diretório com uma função
+`upgrade(conn)`. As versões aplicadas ficam na tabela `schema_migrations` e
+cada migração roda na sua própria transação. As migrações são executadas
+apenas pelo comando `flask db-upgrade`, nunca na importação da aplicação.
+"""
+import importlib
+import os
+import re
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, select, insert
+from src.models.models import db
+
+MIGRATION_PATTERN = re.compile(r'^v(\d{3})_(\w+)\.py$')
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('name', String(100), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+def available_migrations():
+    """Lista (versão, nome, módulo) das migrações em ordem"""
+    migrations = []
+    for filename in sorted(os.listdir(os.path.dirname(__file__))):
+        match = MIGRATION_PATTERN.match(filename)
+        if match:
+            module = importlib.import_module(f'src.migrations.{filename[:-3]}')
+            migrations.append((int(match.group(1)), match.group(2), module))
+    return migrations
+
+def applied_versions(conn):
+    schema_migrations.create(conn, checkfirst=True)
+    return {row.version for row in conn.execute(select(schema_migrations.c.version))}
+
+def upgrade():
+    """Aplica as migrações pendentes e retorna a lista das aplicadas"""
+    applied = []
+    with db.engine.connect() as conn:
+        with conn.begin():
+            done = applied_versions(conn)
+        for version, name, module in available_migrations():
+            if version in done:
+                continue
+            with conn.begin():
+                module.upgrade(conn)
+                conn.execute(insert(schema_migrations).values(
+                    version=version, name=name, applied_at=datetime.utcnow()
+                ))
+            applied.append((version, name))
+    return applied
+
+def reset():
+    """Apaga as tabelas e recria o esquema pelas migrações (scripts de dados, benchmarks e testes)"""
+    db.drop_all()
+    with db.engine.begin() as conn:
+        schema_migrations.drop(conn, checkfirst=True)
+    return upgrade()
+
+def status():
+    """Retorna (versão, nome, aplicada) de cada migração conhecida"""
+    with db.engine.connect() as conn:
+        with conn.begin():
+            done = applied_versions(conn)
+    return [(version, name, version in done) for version, name, _ in available_migrations()]
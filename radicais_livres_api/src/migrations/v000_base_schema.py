@@ -0,0 +1,96 @@
+"""
+Esquema inicial: as tabelas da aplicação antes das migrações versionadas.
+
+As definições ficam congeladas aqui (e não vêm dos modelos) para que as
+migrações seguintes encontrem sempre o mesmo ponto de partida. Bancos criados
+antes das migrações já têm as tabelas e não são alterados.
+"""
+from sqlalchemy import (MetaData, Table, Column, Integer, String, Text, Boolean, Date, DateTime,
+                        ForeignKey)
+
+metadata = MetaData()
+
+Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(80), unique=True, nullable=False),
+    Column('email', String(120), unique=True, nullable=False),
+    Column('password_hash', String(255), nullable=False),
+    Column('full_name', String(150), nullable=False),
+    Column('role', String(20), nullable=False),
+    Column('is_active', Boolean),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'networks', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(50), nullable=False),
+    Column('description', Text),
+    Column('supervisor_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('is_active', Boolean),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'cells', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('leader_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('network_id', Integer, ForeignKey('networks.id'), nullable=False),
+    Column('meeting_day', String(20)),
+    Column('meeting_time', String(10)),
+    Column('location', String(200)),
+    Column('is_active', Boolean),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'members', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('full_name', String(150), nullable=False),
+    Column('phone', String(20)),
+    Column('email', String(120)),
+    Column('member_type', String(20), nullable=False),
+    Column('cell_id', Integer, ForeignKey('cells.id')),
+    Column('is_active', Boolean),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'attendance_reports', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('cell_id', Integer, ForeignKey('cells.id'), nullable=False),
+    Column('meeting_date', Date, nullable=False),
+    Column('members_present', Integer),
+    Column('fas_present', Integer),
+    Column('visitors_present', Integer),
+    Column('observations', Text),
+    Column('testimony', Text),
+    Column('created_by', Integer, ForeignKey('users.id'), nullable=False),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'attendances', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('report_id', Integer, ForeignKey('attendance_reports.id'), nullable=False),
+    Column('member_id', Integer, ForeignKey('members.id')),
+    Column('visitor_name', String(150)),
+    Column('attendance_type', String(20), nullable=False)
+)
+
+Table(
+    'photos', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('filename', String(255), nullable=False),
+    Column('original_filename', String(255), nullable=False),
+    Column('description', Text),
+    Column('uploaded_by', Integer, ForeignKey('users.id'), nullable=False),
+    Column('event_date', Date),
+    Column('cell_id', Integer, ForeignKey('cells.id')),
+    Column('created_at', DateTime)
+)
+
+def upgrade(conn):
+    metadata.create_all(conn, checkfirst=True)
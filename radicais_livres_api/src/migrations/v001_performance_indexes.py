@@ -0,0 +1,40 @@
+"""
+Índices dos filtros mais usados e unicidade de relatório por célula e data.
+
+No Postgres os índices de células e membros são parciais (apenas linhas
+ativas), já que as listagens sempre filtram por is_active.
+"""
+from sqlalchemy import text
+
+INDEXES = [
+    # (nome, tabela, colunas, condição do índice parcial no Postgres)
+    ('ix_attendance_reports_created_at', 'attendance_reports', 'created_at', None),
+    ('ix_members_cell_active_type', 'members', 'cell_id, is_active, member_type', 'is_active'),
+    ('ix_photos_cell_created_at', 'photos', 'cell_id, created_at', None),
+    ('ix_attendances_report_id', 'attendances', 'report_id', None),
+    ('ix_attendances_member_id', 'attendances', 'member_id', None),
+    ('ix_cells_network_active', 'cells', 'network_id, is_active', 'is_active'),
+]
+
+def _check_duplicate_reports(conn):
+    duplicates = conn.execute(text(
+        'SELECT cell_id, meeting_date, COUNT(*) FROM attendance_reports '
+        'GROUP BY cell_id, meeting_date HAVING COUNT(*) > 1'
+    )).all()
+    if duplicates:
+        listed = ', '.join(f'célula {cell_id} em {meeting_date} ({count}x)' for cell_id, meeting_date, count in duplicates)
+        raise RuntimeError(f'Relatórios duplicados impedem a criação do índice único: {listed}')
+
+def upgrade(conn):
+    postgres = conn.dialect.name == 'postgresql'
+
+    # Também atende aos filtros por (cell_id, meeting_date)
+    _check_duplicate_reports(conn)
+    conn.execute(text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_reports_cell_date '
+        'ON attendance_reports (cell_id, meeting_date)'
+    ))
+
+    for name, table, columns, partial in INDEXES:
+        where = f' WHERE {partial}' if postgres and partial else ''
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns}){where}'))
@@ -0,0 +1,13 @@
+"""
+Colunas das variantes das fotos (miniatura e WebP para a web).
+"""
+from sqlalchemy import inspect, text
+
+COLUMNS = ('thumbnail_filename', 'webp_filename')
+
+def upgrade(conn):
+    # Bancos criados pelo create_all (antes das migrações) já têm as colunas
+    existing = {column['name'] for column in inspect(conn).get_columns('photos')}
+    for column in COLUMNS:
+        if column not in existing:
+            conn.execute(text(f'ALTER TABLE photos ADD COLUMN {column} VARCHAR(255)'))
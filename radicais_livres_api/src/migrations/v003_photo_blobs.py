@@ -0,0 +1,23 @@
+"""
+Arquivos de foto endereçados pelo conteúdo (photo_blobs) e a referência a
+eles em photos.
+
+As fotos antigas continuam com blob nulo até rodar `flask migrate-photo-blobs`.
+"""
+from sqlalchemy import MetaData, Table, Column, Integer, BigInteger, String, DateTime, inspect, text
+
+photo_blobs = Table(
+    'photo_blobs', MetaData(),
+    Column('sha256', String(64), primary_key=True),
+    Column('filename', String(255), unique=True, nullable=False),
+    Column('size', BigInteger, nullable=False),
+    Column('ref_count', Integer, nullable=False),
+    Column('created_at', DateTime)
+)
+
+def upgrade(conn):
+    photo_blobs.create(conn, checkfirst=True)
+    existing = {column['name'] for column in inspect(conn).get_columns('photos')}
+    if 'blob_sha256' not in existing:
+        conn.execute(text('ALTER TABLE photos ADD COLUMN blob_sha256 VARCHAR(64) REFERENCES photo_blobs (sha256)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_photos_blob_sha256 ON photos (blob_sha256)'))
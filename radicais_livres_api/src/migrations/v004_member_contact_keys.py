@@ -0,0 +1,26 @@
+"""
+Telefone e email normalizados dos membros (importação e deduplicação).
+
+Adiciona as colunas, preenche a partir dos dados atuais e cria os índices.
+"""
+from sqlalchemy import inspect, text, bindparam
+from src.services.normalization import normalize_phone, normalize_email
+
+COLUMNS = (('phone_normalized', 'VARCHAR(20)'), ('email_normalized', 'VARCHAR(120)'))
+
+def upgrade(conn):
+    existing = {column['name'] for column in inspect(conn).get_columns('members')}
+    for column, column_type in COLUMNS:
+        if column not in existing:
+            conn.execute(text(f'ALTER TABLE members ADD COLUMN {column} {column_type}'))
+
+    rows = conn.execute(text('SELECT id, phone, email FROM members')).all()
+    updates = [{'member_id': row.id, 'phone': normalize_phone(row.phone), 'email': normalize_email(row.email)}
+               for row in rows]
+    if updates:
+        conn.execute(text(
+            'UPDATE members SET phone_normalized = :phone, email_normalized = :email WHERE id = :member_id'
+        ).bindparams(bindparam('member_id'), bindparam('phone'), bindparam('email')), updates)
+
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_members_phone_normalized ON members (phone_normalized)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_members_email_normalized ON members (email_normalized)'))
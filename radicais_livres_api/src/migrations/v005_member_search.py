@@ -0,0 +1,50 @@
+"""
+Busca de membros: coluna `search_text` e índice (FTS5 no SQLite, trigramas no Postgres).
+
+Adiciona a coluna, preenche a partir dos dados atuais e cria o índice.
+"""
+from sqlalchemy import inspect, text, bindparam
+from src.services.normalization import normalize_phone, searchable_text
+
+# Cópia congelada do DDL de src/services/member_search.py nesta versão: uma
+# mudança no serviço não pode alterar o que a migração faz em bancos novos
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS members_fts USING fts5("
+    "search_text, content='members', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')",
+    "CREATE TRIGGER IF NOT EXISTS members_fts_insert AFTER INSERT ON members BEGIN "
+    "INSERT INTO members_fts(rowid, search_text) VALUES (new.id, new.search_text); END",
+    "CREATE TRIGGER IF NOT EXISTS members_fts_delete AFTER DELETE ON members BEGIN "
+    "INSERT INTO members_fts(members_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+    "CREATE TRIGGER IF NOT EXISTS members_fts_update AFTER UPDATE OF search_text ON members BEGIN "
+    "INSERT INTO members_fts(members_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+    "INSERT INTO members_fts(rowid, search_text) VALUES (new.id, new.search_text); END",
+)
+
+POSTGRES_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_members_search_trgm ON members USING gin (search_text gin_trgm_ops)",
+)
+
+def upgrade(conn):
+    existing = {column['name'] for column in inspect(conn).get_columns('members')}
+    if 'search_text' not in existing:
+        conn.execute(text('ALTER TABLE members ADD COLUMN search_text VARCHAR(400)'))
+
+    rows = conn.execute(text('SELECT id, full_name, phone, email FROM members')).all()
+    updates = [{'member_id': row.id,
+                'search_text': searchable_text(row.full_name, row.email, normalize_phone(row.phone))}
+               for row in rows]
+    if updates:
+        conn.execute(text(
+            'UPDATE members SET search_text = :search_text WHERE id = :member_id'
+        ).bindparams(bindparam('member_id'), bindparam('search_text')), updates)
+
+    # No SQLite o FTS é criado depois do preenchimento e reindexado de uma vez
+    if conn.dialect.name == 'sqlite':
+        for statement in SQLITE_DDL:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql("INSERT INTO members_fts(members_fts) VALUES ('rebuild')")
+    elif conn.dialect.name == 'postgresql':
+        for statement in POSTGRES_DDL:
+            conn.exec_driver_sql(statement)
@@ -0,0 +1,86 @@
+"""
+Tabelas dos agregados e do controle de alterações: estatísticas do dashboard,
+frequência dos membros, uploads em partes, versões das tabelas e sugestões
+de membros duplicados. Também cria a linha de versão de cada tabela.
+
+Bancos em que essas tabelas já foram criadas pelo create_all ficam como estão
+e recebem apenas as linhas de versão que faltam.
+"""
+from sqlalchemy import (MetaData, Table, Column, Index, Integer, BigInteger, String, Text, Boolean, Float,
+                        Date, DateTime, ForeignKey, select, insert)
+
+metadata = MetaData()
+
+# Referências das chaves estrangeiras (as tabelas já existem)
+for name, key in (('users', 'id'), ('cells', 'id'), ('members', 'id')):
+    Table(name, metadata, Column(key, Integer, primary_key=True))
+
+Table(
+    'dashboard_stats', metadata,
+    Column('scope', String(10), primary_key=True),
+    Column('scope_id', Integer, primary_key=True, autoincrement=False),
+    Column('active_cells', Integer, nullable=False),
+    Column('active_members', Integer, nullable=False),
+    Column('active_networks', Integer, nullable=False),
+    Column('total_reports', Integer, nullable=False)
+)
+
+Table(
+    'member_retention', metadata,
+    Column('member_id', Integer, ForeignKey('members.id'), primary_key=True, autoincrement=False),
+    Column('last_attended', Date),
+    Column('current_streak', Integer, nullable=False),
+    Column('history', BigInteger, nullable=False),
+    Column('meetings_tracked', Integer, nullable=False),
+    Column('updated_at', DateTime)
+)
+
+Table(
+    'photo_uploads', metadata,
+    Column('id', String(32), primary_key=True),
+    Column('uploaded_by', Integer, ForeignKey('users.id'), nullable=False),
+    Column('original_filename', String(255), nullable=False),
+    Column('total_size', BigInteger, nullable=False),
+    Column('sha256', String(64)),
+    Column('description', Text),
+    Column('event_date', Date),
+    Column('cell_id', Integer, ForeignKey('cells.id')),
+    Column('created_at', DateTime)
+)
+
+table_versions = Table(
+    'table_versions', metadata,
+    Column('table_name', String(64), primary_key=True),
+    Column('version', BigInteger, nullable=False)
+)
+
+Table(
+    'member_duplicates', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('member_id', Integer, ForeignKey('members.id'), nullable=False),
+    Column('duplicate_id', Integer, ForeignKey('members.id'), nullable=False),
+    Column('score', Float, nullable=False),
+    Column('reasons', String(50), nullable=False),
+    Column('dismissed', Boolean, nullable=False),
+    Column('created_at', DateTime),
+    Index('uq_member_duplicates_pair', 'member_id', 'duplicate_id', unique=True),
+    Index('ix_member_duplicates_duplicate_id', 'duplicate_id'),
+    Index('ix_member_duplicates_score', 'score', 'id')
+)
+
+# Tabelas com contador em table_versions (src/services/table_versions.py);
+# migrações que criarem tabelas novas devem incluir as suas linhas
+VERSIONED_TABLES = (
+    'users', 'networks', 'cells', 'members', 'attendance_reports', 'attendances', 'photos', 'photo_blobs',
+    'dashboard_stats', 'member_retention', 'photo_uploads', 'member_duplicates',
+)
+
+NEW_TABLES = ('dashboard_stats', 'member_retention', 'photo_uploads', 'table_versions', 'member_duplicates')
+
+def upgrade(conn):
+    metadata.create_all(conn, tables=[metadata.tables[name] for name in NEW_TABLES], checkfirst=True)
+
+    existing = set(conn.scalars(select(table_versions.c.table_name)))
+    missing = [name for name in VERSIONED_TABLES if name not in existing]
+    if missing:
+        conn.execute(insert(table_versions), [{'table_name': name, 'version': 0} for name in missing])
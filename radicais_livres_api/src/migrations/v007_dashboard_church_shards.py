@@ -0,0 +1,31 @@
+"""
+Totais da igreja em dashboard_stats divididos em faixas (uma linha por faixa).
+
+Os totais atuais ficam na faixa 0; as demais começam zeradas. Bancos sem as
+estatísticas ainda não geradas recebem todas as linhas na migração v010.
+"""
+from sqlalchemy import MetaData, Table, Column, Integer, String, select, insert
+
+CHURCH_SHARDS = 16
+
+dashboard_stats = Table(
+    'dashboard_stats', MetaData(),
+    Column('scope', String(10), primary_key=True),
+    Column('scope_id', Integer, primary_key=True, autoincrement=False),
+    Column('active_cells', Integer, nullable=False),
+    Column('active_members', Integer, nullable=False),
+    Column('active_networks', Integer, nullable=False),
+    Column('total_reports', Integer, nullable=False)
+)
+
+def upgrade(conn):
+    existing = set(conn.scalars(select(dashboard_stats.c.scope_id).where(dashboard_stats.c.scope == 'church')))
+    if 0 not in existing:
+        return
+    missing = [shard for shard in range(1, CHURCH_SHARDS) if shard not in existing]
+    if missing:
+        conn.execute(insert(dashboard_stats), [
+            {'scope': 'church', 'scope_id': shard, 'active_cells': 0, 'active_members': 0,
+             'active_networks': 0, 'total_reports': 0}
+            for shard in missing
+        ])
@@ -0,0 +1,12 @@
+"""
+Versão dos tokens de cada usuário (users.token_version).
+
+Os tokens carregam a versão com que foram emitidos; incrementá-la (logout,
+troca de senha, desativação) invalida os tokens anteriores.
+"""
+from sqlalchemy import inspect, text
+
+def upgrade(conn):
+    existing = {column['name'] for column in inspect(conn).get_columns('users')}
+    if 'token_version' not in existing:
+        conn.execute(text('ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0'))
@@ -0,0 +1,11 @@
+"""
+Membro em que um duplicado foi unido (members.merged_into_id).
+
+A junção de duplicados passa a desativar o duplicado em vez de excluí-lo.
+"""
+from sqlalchemy import inspect, text
+
+def upgrade(conn):
+    existing = {column['name'] for column in inspect(conn).get_columns('members')}
+    if 'merged_into_id' not in existing:
+        conn.execute(text('ALTER TABLE members ADD COLUMN merged_into_id INTEGER REFERENCES members (id)'))
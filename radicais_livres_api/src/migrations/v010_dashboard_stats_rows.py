@@ -0,0 +1,99 @@
+"""
+Linhas de dashboard_stats para bancos que ainda não as têm.
+
+Até aqui as estatísticas eram geradas na primeira leitura do dashboard; agora
+só a migração e o comando `flask rebuild-dashboard-stats` as recalculam. Em um
+banco novo as linhas da igreja nascem zeradas e o listener de after_flush as
+mantém a partir daí. Bancos que já têm as estatísticas ficam como estão.
+"""
+from collections import Counter
+from sqlalchemy import MetaData, Table, Column, Integer, String, Boolean, select, insert, func
+
+CHURCH_SHARDS = 16
+COUNTERS = ('active_cells', 'active_members', 'active_networks', 'total_reports')
+
+metadata = MetaData()
+
+dashboard_stats = Table(
+    'dashboard_stats', metadata,
+    Column('scope', String(10), primary_key=True),
+    Column('scope_id', Integer, primary_key=True, autoincrement=False),
+    Column('active_cells', Integer, nullable=False),
+    Column('active_members', Integer, nullable=False),
+    Column('active_networks', Integer, nullable=False),
+    Column('total_reports', Integer, nullable=False)
+)
+
+networks = Table('networks', metadata, Column('id', Integer, primary_key=True))
+
+cells = Table(
+    'cells', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('network_id', Integer),
+    Column('is_active', Boolean)
+)
+
+members = Table(
+    'members', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('cell_id', Integer),
+    Column('member_type', String(20)),
+    Column('is_active', Boolean)
+)
+
+attendance_reports = Table(
+    'attendance_reports', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('cell_id', Integer)
+)
+
+def upgrade(conn):
+    church = select(dashboard_stats.c.scope_id).where(
+        dashboard_stats.c.scope == 'church', dashboard_stats.c.scope_id == 0
+    )
+    if conn.execute(church).first() is not None:
+        return
+
+    # Mesmo cálculo de dashboard_stats.rebuild() nesta versão
+    active_members = (members.c.is_active == True) & (members.c.member_type == 'membro')
+    members_by_cell = dict(conn.execute(
+        select(members.c.cell_id, func.count(members.c.id))
+        .where(active_members, members.c.cell_id.isnot(None))
+        .group_by(members.c.cell_id)
+    ).all())
+    reports_by_cell = dict(conn.execute(
+        select(attendance_reports.c.cell_id, func.count(attendance_reports.c.id))
+        .group_by(attendance_reports.c.cell_id)
+    ).all())
+
+    rows = {}
+    def row(scope, scope_id):
+        return rows.setdefault((scope, scope_id), Counter())
+
+    totals = row('church', 0)
+    for shard in range(1, CHURCH_SHARDS):
+        row('church', shard)
+    totals['active_members'] = conn.scalar(select(func.count()).select_from(members).where(active_members))
+    totals['total_reports'] = conn.scalar(select(func.count()).select_from(attendance_reports))
+    for network_id in conn.scalars(select(networks.c.id)):
+        row('network', network_id)
+    for cell_id, network_id, is_active in conn.execute(select(cells.c.id, cells.c.network_id, cells.c.is_active)):
+        cell = row('cell', cell_id)
+        cell['active_members'] = members_by_cell.get(cell_id, 0)
+        cell['total_reports'] = reports_by_cell.get(cell_id, 0)
+        if is_active is not False:
+            cell['active_cells'] = 1
+            totals['active_cells'] += 1
+            network = row('network', network_id)
+            network['active_cells'] += 1
+            network['active_members'] += cell['active_members']
+            network['total_reports'] += cell['total_reports']
+    totals['active_networks'] = len([key for key, counters in rows.items()
+                                     if key[0] == 'network' and counters['active_cells'] > 0])
+
+    # Linhas de rede e célula que já existam (sem a da igreja) são substituídas
+    conn.execute(dashboard_stats.delete())
+    conn.execute(insert(dashboard_stats), [
+        dict({column: counters[column] for column in COUNTERS}, scope=scope, scope_id=scope_id)
+        for (scope, scope_id), counters in rows.items()
+    ])
@@ -0,0 +1,64 @@
+"""
+photos.created_at passa a ser obrigatório.
+
+A coluna faz parte da chave da paginação por cursor (src/services/pagination.py)
+e uma linha com data nula interrompia a listagem. As fotos sem data recebem a
+mais antiga das datas existentes, ficando no fim da listagem como já ficavam
+no SQLite. O SQLite não altera a nulidade de uma coluna: a tabela é recriada
+com os mesmos índices.
+"""
+from datetime import datetime
+from sqlalchemy import (MetaData, Table, Column, Integer, String, Text, Date, DateTime, ForeignKey,
+                        inspect, select, update, func, text)
+
+COLUMNS = ('id', 'filename', 'original_filename', 'description', 'uploaded_by', 'event_date', 'cell_id',
+           'blob_sha256', 'thumbnail_filename', 'webp_filename', 'created_at')
+
+metadata = MetaData()
+
+Table('users', metadata, Column('id', Integer, primary_key=True))
+Table('cells', metadata, Column('id', Integer, primary_key=True))
+Table('photo_blobs', metadata, Column('sha256', String(64), primary_key=True))
+
+photos = Table(
+    'photos', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('created_at', DateTime)
+)
+
+photos_new = Table(
+    'photos_new', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('filename', String(255), nullable=False),
+    Column('original_filename', String(255), nullable=False),
+    Column('description', Text),
+    Column('uploaded_by', Integer, ForeignKey('users.id'), nullable=False),
+    Column('event_date', Date),
+    Column('cell_id', Integer, ForeignKey('cells.id')),
+    Column('blob_sha256', String(64), ForeignKey('photo_blobs.sha256')),
+    Column('thumbnail_filename', String(255)),
+    Column('webp_filename', String(255)),
+    Column('created_at', DateTime, nullable=False)
+)
+
+def upgrade(conn):
+    column = next(column for column in inspect(conn).get_columns('photos') if column['name'] == 'created_at')
+    if not column['nullable']:
+        return
+
+    oldest = conn.scalar(select(func.min(photos.c.created_at))) or datetime.utcnow()
+    conn.execute(update(photos).where(photos.c.created_at.is_(None)).values(created_at=oldest))
+
+    if conn.dialect.name != 'sqlite':
+        conn.execute(text('ALTER TABLE photos ALTER COLUMN created_at SET NOT NULL'))
+        return
+
+    indexes = inspect(conn).get_indexes('photos')
+    photos_new.create(conn)
+    names = ', '.join(COLUMNS)
+    conn.execute(text(f'INSERT INTO photos_new ({names}) SELECT {names} FROM photos'))
+    conn.execute(text('DROP TABLE photos'))
+    conn.execute(text('ALTER TABLE photos_new RENAME TO photos'))
+    for index in indexes:
+        unique = 'UNIQUE ' if index['unique'] else ''
+        conn.execute(text(f"CREATE {unique}INDEX {index['name']} ON photos ({', '.join(index['column_names'])})"))
@@ -1,5 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import validates
 from datetime import datetime
+from src.services.normalization import normalize_phone, normalize_email, searchable_text
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
@@ -15,6 +17,9 @@ class User(db.Model):
     role = db.Column(db.String(20), nullable=False, default='lider')  # lider, discipulador, pastor
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Incrementado no logout, na troca de senha e na desativação: invalida os
+    # tokens já emitidos (src/services/auth_tokens.py)
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relacionamentos
     led_cells = db.relationship('Cell', backref='leader', lazy=True, foreign_keys='Cell.leader_id')
@@ -22,6 +27,16 @@ class User(db.Model):
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
+        self.revoke_tokens()
+
+    def revoke_tokens(self):
+        self.token_version = (self.token_version or 0) + 1
+
+    @validates('is_active')
+    def _revoke_on_deactivate(self, key, value):
+        if value is False:
+            self.revoke_tokens()
+        return value
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -50,20 +65,30 @@ class Network(db.Model):
     # Relacionamentos
     cells = db.relationship('Cell', backref='network', lazy=True)
 
-    def to_dict(self):
+    def to_dict(self, related=None):
+        # `related` permite que os serializadores em lote forneçam os dados
+        # relacionados já carregados, evitando consultas por linha
+        if related is None:
+            related = {
+                'supervisor_name': self.supervisor.full_name if self.supervisor else None,
+                'cells_count': len(self.cells)
+            }
         return {
             'id': self.id,
             'name': self.name,
             'description': self.description,
             'supervisor_id': self.supervisor_id,
-            'supervisor_name': self.supervisor.full_name if self.supervisor else None,
+            'supervisor_name': related['supervisor_name'],
             'is_active': self.is_active,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'cells_count': len(self.cells)
+            'cells_count': related['cells_count']
         }
 
 class Cell(db.Model):
     __tablename__ = 'cells'
+    __table_args__ = (
+        db.Index('ix_cells_network_active', 'network_id', 'is_active', postgresql_where=db.text('is_active')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -79,24 +104,33 @@ class Cell(db.Model):
     attendance_reports = db.relationship('AttendanceReport', backref='cell', lazy=True)
     members = db.relationship('Member', backref='cell', lazy=True)
 
-    def to_dict(self):
+    def to_dict(self, related=None):
+        if related is None:
+            related = {
+                'leader_name': self.leader.full_name if self.leader else None,
+                'network_name': self.network.name if self.network else None,
+                'members_count': len(self.members)
+            }
         return {
             'id': self.id,
             'name': self.name,
             'leader_id': self.leader_id,
-            'leader_name': self.leader.full_name if self.leader else None,
+            'leader_name': related['leader_name'],
             'network_id': self.network_id,
-            'network_name': self.network.name if self.network else None,
+            'network_name': related['network_name'],
             'meeting_day': self.meeting_day,
             'meeting_time': self.meeting_time,
             'location': self.location,
             'is_active': self.is_active,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'members_count': len(self.members)
+            'members_count': related['members_count']
         }
 
 class Member(db.Model):
     __tablename__ = 'members'
+    __table_args__ = (
+        db.Index('ix_members_cell_active_type', 'cell_id', 'is_active', 'member_type', postgresql_where=db.text('is_active')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     full_name = db.Column(db.String(150), nullable=False)
@@ -106,8 +140,33 @@ class Member(db.Model):
     cell_id = db.Column(db.Integer, db.ForeignKey('cells.id'), nullable=True)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Telefone e email normalizados, para reconhecer a mesma pessoa
+    phone_normalized = db.Column(db.String(20), index=True)
+    email_normalized = db.Column(db.String(120), index=True)
 
-    def to_dict(self):
+    # Texto da busca (nome, email e telefone normalizados), indexado por
+    # FTS5 no SQLite e por trigramas no Postgres (ver services/member_search)
+    search_text = db.Column(db.String(400))
+
+    # Membro em que este foi unido (services/member_dedup.merge); o duplicado
+    # fica inativo, e não excluído, para que uma junção errada possa ser desfeita
+    merged_into_id = db.Column(db.Integer, db.ForeignKey('members.id'), nullable=True)
+
+    @validates('full_name', 'phone', 'email')
+    def _normalize_contact(self, key, value):
+        if key == 'phone':
+            self.phone_normalized = normalize_phone(value)
+        elif key == 'email':
+            self.email_normalized = normalize_email(value)
+        values = {'full_name': self.full_name, 'email': self.email, key: value}
+        self.search_text = searchable_text(values['full_name'], values['email'], self.phone_normalized)
+        return value
+
+    def to_dict(self, related=None):
+        if related is None:
+            related = {
+                'cell_name': self.cell.name if self.cell else None
+            }
         return {
             'id': self.id,
             'full_name': self.full_name,
@@ -115,13 +174,19 @@ class Member(db.Model):
             'email': self.email,
             'member_type': self.member_type,
             'cell_id': self.cell_id,
-            'cell_name': self.cell.name if self.cell else None,
+            'cell_name': related['cell_name'],
             'is_active': self.is_active,
+            'merged_into_id': self.merged_into_id,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
 class AttendanceReport(db.Model):
     __tablename__ = 'attendance_reports'
+    __table_args__ = (
+        # Um relatório por célula e data
+        db.Index('uq_attendance_reports_cell_date', 'cell_id', 'meeting_date', unique=True),
+        db.Index('ix_attendance_reports_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     cell_id = db.Column(db.Integer, db.ForeignKey('cells.id'), nullable=False)
@@ -138,13 +203,20 @@ class AttendanceReport(db.Model):
     attendances = db.relationship('Attendance', backref='report', lazy=True, cascade='all, delete-orphan')
     creator = db.relationship('User', backref='created_reports', foreign_keys=[created_by])
 
-    def to_dict(self):
+    def to_dict(self, related=None):
+        if related is None:
+            related = {
+                'cell_name': self.cell.name if self.cell else None,
+                'network_name': self.cell.network.name if self.cell and self.cell.network else None,
+                'leader_name': self.cell.leader.full_name if self.cell and self.cell.leader else None,
+                'creator_name': self.creator.full_name if self.creator else None
+            }
         return {
             'id': self.id,
             'cell_id': self.cell_id,
-            'cell_name': self.cell.name if self.cell else None,
-            'network_name': self.cell.network.name if self.cell and self.cell.network else None,
-            'leader_name': self.cell.leader.full_name if self.cell and self.cell.leader else None,
+            'cell_name': related['cell_name'],
+            'network_name': related['network_name'],
+            'leader_name': related['leader_name'],
             'meeting_date': self.meeting_date.isoformat() if self.meeting_date else None,
             'members_present': self.members_present,
             'fas_present': self.fas_present,
@@ -153,12 +225,16 @@ class AttendanceReport(db.Model):
             'observations': self.observations,
             'testimony': self.testimony,
             'created_by': self.created_by,
-            'creator_name': self.creator.full_name if self.creator else None,
+            'creator_name': related['creator_name'],
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
 class Attendance(db.Model):
     __tablename__ = 'attendances'
+    __table_args__ = (
+        db.Index('ix_attendances_report_id', 'report_id'),
+        db.Index('ix_attendances_member_id', 'member_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     report_id = db.Column(db.Integer, db.ForeignKey('attendance_reports.id'), nullable=False)
@@ -169,17 +245,24 @@ class Attendance(db.Model):
     # Relacionamentos
     member = db.relationship('Member', backref='attendances')
 
-    def to_dict(self):
+    def to_dict(self, related=None):
+        if related is None:
+            related = {
+                'member_name': self.member.full_name if self.member else self.visitor_name
+            }
         return {
             'id': self.id,
             'report_id': self.report_id,
             'member_id': self.member_id,
-            'member_name': self.member.full_name if self.member else self.visitor_name,
+            'member_name': related['member_name'],
             'attendance_type': self.attendance_type
         }
 
 class Photo(db.Model):
     __tablename__ = 'photos'
+    __table_args__ = (
+        db.Index('ix_photos_cell_created_at', 'cell_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
@@ -188,23 +271,124 @@ class Photo(db.Model):
     uploaded_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     event_date = db.Column(db.Date)
     cell_id = db.Column(db.Integer, db.ForeignKey('cells.id'), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Arquivo endereçado pelo conteúdo (src/services/photo_storage.py); nulo
+    # para fotos antigas, gravadas com nome aleatório
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('photo_blobs.sha256'), nullable=True, index=True)
+    # Variantes geradas em segundo plano (src/services/photo_variants.py)
+    thumbnail_filename = db.Column(db.String(255))
+    webp_filename = db.Column(db.String(255))
+    # Chave da paginação por cursor: não pode ser nula (migração v011)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     # Relacionamentos
     uploader = db.relationship('User', backref='uploaded_photos')
     cell = db.relationship('Cell', backref='photos')
 
-    def to_dict(self):
+    def to_dict(self, related=None):
+        if related is None:
+            related = {
+                'uploader_name': self.uploader.full_name if self.uploader else None,
+                'cell_name': self.cell.name if self.cell else None
+            }
         return {
             'id': self.id,
             'filename': self.filename,
+            'thumbnail_filename': self.thumbnail_filename,
+            'webp_filename': self.webp_filename,
             'original_filename': self.original_filename,
             'description': self.description,
             'uploaded_by': self.uploaded_by,
-            'uploader_name': self.uploader.full_name if self.uploader else None,
+            'uploader_name': related['uploader_name'],
             'event_date': self.event_date.isoformat() if self.event_date else None,
             'cell_id': self.cell_id,
-            'cell_name': self.cell.name if self.cell else None,
+            'cell_name': related['cell_name'],
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class PhotoBlob(db.Model):
+    __tablename__ = 'photo_blobs'
+    
+    # Conteúdo de foto gravado uma única vez, com o número de fotos que o usam
+    sha256 = db.Column(db.String(64), primary_key=True)
+    filename = db.Column(db.String(255), unique=True, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+    
+    # Contador de alterações por tabela, incrementado a cada escrita
+    # (src/services/table_versions.py); compõe o ETag das listagens
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class DashboardStats(db.Model):
+    __tablename__ = 'dashboard_stats'
+    
+    # Estatísticas materializadas do dashboard, mantidas a cada flush
+    # (src/services/dashboard_stats.py)
+    scope = db.Column(db.String(10), primary_key=True)  # church, network, cell
+    scope_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 0 para church
+    active_cells = db.Column(db.Integer, nullable=False, default=0)
+    active_members = db.Column(db.Integer, nullable=False, default=0)
+    active_networks = db.Column(db.Integer, nullable=False, default=0)  # apenas church
+    total_reports = db.Column(db.Integer, nullable=False, default=0)
+
+class MemberRetention(db.Model):
+    __tablename__ = 'member_retention'
+    
+    # Frequência de cada membro nas reuniões da sua célula, mantida por
+    # src/services/retention.py. O bit 0 de `history` é a reunião mais recente.
+    member_id = db.Column(db.Integer, db.ForeignKey('members.id'), primary_key=True, autoincrement=False)
+    last_attended = db.Column(db.Date)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)
+    history = db.Column(db.BigInteger, nullable=False, default=0)
+    meetings_tracked = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class PhotoUpload(db.Model):
+    __tablename__ = 'photo_uploads'
+    
+    # Upload em partes em andamento; os bytes recebidos ficam em um arquivo
+    # parcial (src/services/chunked_uploads.py) cujo tamanho é o offset atual
+    id = db.Column(db.String(32), primary_key=True)
+    uploaded_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    original_filename = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    sha256 = db.Column(db.String(64))
+    description = db.Column(db.Text)
+    event_date = db.Column(db.Date)
+    cell_id = db.Column(db.Integer, db.ForeignKey('cells.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self, offset=0):
+        return {
+            'id': self.id,
+            'original_filename': self.original_filename,
+            'total_size': self.total_size,
+            'offset': offset,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class MemberDuplicate(db.Model):
+    __tablename__ = 'member_duplicates'
+    __table_args__ = (
+        db.Index('uq_member_duplicates_pair', 'member_id', 'duplicate_id', unique=True),
+        db.Index('ix_member_duplicates_duplicate_id', 'duplicate_id'),
+        db.Index('ix_member_duplicates_score', 'score', 'id'),
+    )
+    
+    # Par de membros que parecem ser a mesma pessoa, gerado pela detecção
+    # (src/services/member_dedup.py); member_id < duplicate_id
+    id = db.Column(db.Integer, primary_key=True)
+    member_id = db.Column(db.Integer, db.ForeignKey('members.id'), nullable=False)
+    duplicate_id = db.Column(db.Integer, db.ForeignKey('members.id'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    reasons = db.Column(db.String(50), nullable=False)  # phone,email,name
+    dismissed = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -1,5 +1,7 @@
 from flask import Blueprint, request, jsonify, session
 from src.models.models import db, User
+from src.services import auth_tokens
+from src.services.scope import check_auth
 from datetime import datetime
 
 auth_bp = Blueprint('auth', __name__)
@@ -19,9 +21,12 @@ def login():
         if user and user.check_password(password) and user.is_active:
             session['user_id'] = user.id
             session['user_role'] = user.role
+            token, expires_in = auth_tokens.issue(user)
             return jsonify({
                 'message': 'Login realizado com sucesso',
-                'user': user.to_dict()
+                'user': user.to_dict(),
+                'token': token,
+                'expires_in': expires_in
             }), 200
         else:
             return jsonify({'error': 'Credenciais inválidas'}), 401
@@ -32,19 +37,43 @@ def login():
 @auth_bp.route('/logout', methods=['POST'])
 def logout():
     try:
+        # Revoga os tokens do usuário (de todos os dispositivos), não só o cookie
+        current_user = check_auth()
+        user = db.session.get(User, current_user.id) if current_user else None
+        if user:
+            user.revoke_tokens()
+            db.session.commit()
         session.clear()
         return jsonify({'message': 'Logout realizado com sucesso'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@auth_bp.route('/refresh', methods=['POST'])
+def refresh_token():
+    try:
+        # Token atual (mesmo vencido há pouco) ou cookie de sessão
+        authorization = request.headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            user = auth_tokens.refresh(authorization[len('Bearer '):])
+        else:
+            user = check_auth()
+        if not user or not user.is_active:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        token, expires_in = auth_tokens.issue(user)
+        return jsonify({'token': token, 'expires_in': expires_in}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/me', methods=['GET'])
 def get_current_user():
     try:
-        user_id = session.get('user_id')
-        if not user_id:
+        current_user = check_auth()
+        if not current_user:
             return jsonify({'error': 'Usuário não autenticado'}), 401
         
-        user = User.query.get(user_id)
+        user = User.query.get(current_user.id)
         if not user or not user.is_active:
             session.clear()
             return jsonify({'error': 'Usuário não encontrado'}), 404
@@ -56,12 +85,10 @@ def get_current_user():
 @auth_bp.route('/register', methods=['POST'])
 def register():
     try:
-        # Verificar se o usuário atual é pastor/admin
-        user_id = session.get('user_id')
-        if user_id:
-            current_user = User.query.get(user_id)
-            if not current_user or current_user.role != 'pastor':
-                return jsonify({'error': 'Apenas pastores podem cadastrar novos usuários'}), 403
+        # Verificar se o usuário atual (cookie ou token) é pastor/admin
+        current_user = check_auth()
+        if current_user and current_user.role != 'pastor':
+            return jsonify({'error': 'Apenas pastores podem cadastrar novos usuários'}), 403
         
         data = request.get_json()
         username = data.get('username')
@@ -1,34 +1,27 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify
 from src.models.models import db, Cell, Network, User
+from src.services.serializers import list_options, serialize_cells
+from src.services.scope import check_auth, filter_by_scope, can_access_cell
+from src.services.table_versions import conditional
+from src.services.query_audit import query_budget
 
 cells_bp = Blueprint('cells', __name__)
 
-def check_auth():
-    user_id = session.get('user_id')
-    if not user_id:
-        return None
-    return User.query.get(user_id)
-
 @cells_bp.route('/', methods=['GET'])
+@query_budget(10)
+@conditional('cells', 'networks', 'users', 'members')
 def get_cells():
     try:
         current_user = check_auth()
         if not current_user:
             return jsonify({'error': 'Usuário não autenticado'}), 401
         
-        if current_user.role == 'pastor':
-            # Pastor vê todas as células
-            cells = Cell.query.filter_by(is_active=True).all()
-        elif current_user.role == 'discipulador':
-            # Discipulador vê células das suas redes
-            network_ids = [network.id for network in current_user.supervised_networks]
-            cells = Cell.query.filter(Cell.network_id.in_(network_ids), Cell.is_active == True).all()
-        else:
-            # Líder vê apenas suas células
-            cells = Cell.query.filter_by(leader_id=current_user.id, is_active=True).all()
+        # Pastor vê todas as células, discipulador as das suas redes e líder as suas
+        query = Cell.query.options(*list_options()).filter_by(is_active=True)
+        cells = filter_by_scope(query, Cell.id, current_user).all()
         
         return jsonify({
-            'cells': [cell.to_dict() for cell in cells]
+            'cells': serialize_cells(cells)
         }), 200
         
     except Exception as e:
@@ -97,15 +90,7 @@ def update_cell(cell_id):
         cell = Cell.query.get_or_404(cell_id)
         
         # Verificar permissões
-        can_edit = False
-        if current_user.role == 'pastor':
-            can_edit = True
-        elif current_user.role == 'discipulador' and cell.network.supervisor_id == current_user.id:
-            can_edit = True
-        elif current_user.role == 'lider' and cell.leader_id == current_user.id:
-            can_edit = True
-        
-        if not can_edit:
+        if not can_access_cell(current_user, cell.id):
             return jsonify({'error': 'Sem permissão para editar esta célula'}), 403
         
         data = request.get_json()
@@ -152,7 +137,7 @@ def delete_cell(cell_id):
         cell = Cell.query.get_or_404(cell_id)
         
         # Verificar permissões
-        if current_user.role == 'discipulador' and cell.network.supervisor_id != current_user.id:
+        if not can_access_cell(current_user, cell.id):
             return jsonify({'error': 'Sem permissão para excluir esta célula'}), 403
         
         cell.is_active = False
@@ -1,15 +1,23 @@
-from flask import Blueprint, request, jsonify, session
-from src.models.models import db, Member, Cell, User
+import time
+from flask import Blueprint, request, jsonify
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from src.models.models import db, Member, Cell, MemberRetention, MemberDuplicate
+from src.services.serializers import list_options, serialize_members
+from src.services.pagination import Keyset, parse_page_args, paginate, parse_offset_args, offset_cursor
+from src.services.scope import check_auth, filter_by_scope, can_access_cell
+from src.services.table_versions import conditional
+from src.services.query_audit import query_budget
+from src.services import retention, export, member_import, member_search, member_dedup
 
 members_bp = Blueprint('members', __name__)
 
-def check_auth():
-    user_id = session.get('user_id')
-    if not user_id:
-        return None
-    return User.query.get(user_id)
+MEMBERS_KEYSET = Keyset((Member.full_name, str), (Member.id, int))
+DUPLICATES_KEYSET = Keyset((MemberDuplicate.score, float), (MemberDuplicate.id, int), descending=True)
 
 @members_bp.route('/', methods=['GET'])
+@query_budget(8)
+@conditional('members', 'cells', 'networks')
 def get_members():
     try:
         current_user = check_auth()
@@ -19,6 +27,11 @@ def get_members():
         cell_id = request.args.get('cell_id')
         member_type = request.args.get('type')  # membro, fa, visitante
         
+        try:
+            limit, after = parse_page_args(request.args, MEMBERS_KEYSET)
+        except ValueError:
+            return jsonify({'error': 'Parâmetros de paginação inválidos'}), 400
+        
         query = Member.query.filter_by(is_active=True)
         
         if cell_id:
@@ -28,28 +41,273 @@ def get_members():
             query = query.filter_by(member_type=member_type)
         
         # Filtrar por permissões
-        if current_user.role == 'pastor':
-            # Pastor vê todos os membros
-            pass
-        elif current_user.role == 'discipulador':
-            # Discipulador vê membros das células das suas redes
-            network_ids = [network.id for network in current_user.supervised_networks]
-            cell_ids = [cell.id for cell in Cell.query.filter(Cell.network_id.in_(network_ids)).all()]
-            query = query.filter(Member.cell_id.in_(cell_ids))
-        else:
-            # Líder vê apenas membros das suas células
-            cell_ids = [cell.id for cell in current_user.led_cells]
-            query = query.filter(Member.cell_id.in_(cell_ids))
-        
-        members = query.all()
+        query = filter_by_scope(query, Member.cell_id, current_user)
+        
+        members, next_cursor = paginate(query.options(*list_options()), MEMBERS_KEYSET, limit, after)
+        
+        return jsonify({
+            'members': serialize_members(members),
+            'next_cursor': next_cursor
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@members_bp.route('/search', methods=['GET'])
+@query_budget(8)
+@conditional('members', 'cells', 'networks')
+def search_members():
+    """Busca por nome, email ou telefone, sem diferenciar acentos, por relevância"""
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        text_query = request.args.get('q', '').strip()
+        cell_id = request.args.get('cell_id')
+        member_type = request.args.get('type')
+        
+        try:
+            limit, offset = parse_offset_args(request.args)
+        except ValueError:
+            return jsonify({'error': 'Parâmetros de paginação inválidos'}), 400
+        
+        query = Member.query.filter(Member.is_active == True)
+        
+        if cell_id:
+            query = query.filter(Member.cell_id == cell_id)
+        
+        if member_type:
+            query = query.filter(Member.member_type == member_type)
+        
+        query = filter_by_scope(query, Member.cell_id, current_user)
+        
+        members = member_search.search(query.options(*list_options()), text_query, limit + 1, offset)
+        members, next_cursor = offset_cursor(members, limit, offset)
+        
+        return jsonify({
+            'members': serialize_members(members),
+            'next_cursor': next_cursor
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@members_bp.route('/export', methods=['GET'])
+def export_members():
+    """Exporta os membros filtrados em CSV (padrão) ou XLSX (?format=xlsx)"""
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        export_format = request.args.get('format', 'csv')
+        if export_format not in export.FORMATS:
+            return jsonify({'error': 'Formato inválido. Use csv ou xlsx'}), 400
+        
+        cell_id = request.args.get('cell_id')
+        member_type = request.args.get('type')  # membro, fa, visitante
+        
+        query = select(
+            Member.id, Member.full_name, Member.phone, Member.email, Member.member_type,
+            Cell.name, Member.created_at
+        ).outerjoin(Cell, Cell.id == Member.cell_id).where(Member.is_active == True)
+        
+        if cell_id:
+            query = query.where(Member.cell_id == cell_id)
+        
+        if member_type:
+            query = query.where(Member.member_type == member_type)
+        
+        # Filtrar por permissões
+        query = filter_by_scope(query, Member.cell_id, current_user)
+        query = query.order_by(Member.full_name, Member.id)
+        
+        header = ['ID', 'Nome', 'Telefone', 'Email', 'Tipo', 'Célula', 'Cadastrado em']
+        return export.export_response(header, export.stream_rows(query), export_format, 'membros', 'Membros')
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@members_bp.route('/retention', methods=['GET'])
+@query_budget(5)
+def get_retention():
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        cell_id = request.args.get('cell_id')
+        at_risk = request.args.get('at_risk', '').lower() in ('1', 'true')
+        
+        try:
+            weeks = int(request.args.get('weeks', retention.DEFAULT_WEEKS))
+            absences = int(request.args.get('absences', retention.DEFAULT_ABSENCES))
+            limit, after = parse_page_args(request.args, MEMBERS_KEYSET)
+        except ValueError:
+            return jsonify({'error': 'Parâmetros inválidos'}), 400
+        
+        if not 1 <= weeks <= retention.HISTORY_MEETINGS or not 1 <= absences <= retention.HISTORY_MEETINGS:
+            return jsonify({'error': f'weeks e absences devem estar entre 1 e {retention.HISTORY_MEETINGS}'}), 400
+        
+        # Uma consulta: membro, célula e linha de retenção (pré-calculada)
+        query = db.session.query(Member.id, Member.full_name, Member.member_type, Member.cell_id,
+                                 Cell.name.label('cell_name'), MemberRetention).join(
+            MemberRetention, MemberRetention.member_id == Member.id
+        ).join(Cell, Cell.id == Member.cell_id).filter(Member.is_active == True)
+        
+        if cell_id:
+            query = query.filter(Member.cell_id == cell_id)
+        
+        if at_risk:
+            query = query.filter(retention.at_risk_condition(absences))
+        
+        # Filtrar por permissões
+        query = filter_by_scope(query, Member.cell_id, current_user)
+        
+        rows, next_cursor = paginate(query, MEMBERS_KEYSET, limit, after)
         
         return jsonify({
-            'members': [member.to_dict() for member in members]
+            'members': [dict(retention.describe(row.MemberRetention, weeks, absences),
+                             member_id=row.id, full_name=row.full_name, member_type=row.member_type,
+                             cell_id=row.cell_id, cell_name=row.cell_name)
+                        for row in rows],
+            'weeks': weeks,
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@members_bp.route('/import', methods=['POST'])
+def import_members():
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+
+        # Aceita multipart (campo "file") ou o CSV direto no corpo
+        upload = request.files.get('file')
+        stream = upload.stream if upload else request.stream
+        dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+        on_match = request.args.get('on_match', 'update')
+        if on_match not in ('update', 'skip'):
+            return jsonify({'error': 'on_match deve ser update ou skip'}), 400
+
+        try:
+            rows = member_import.read_rows(stream)
+        except member_import.InvalidFile as e:
+            return jsonify({'error': f'Arquivo inválido: {e}'}), 400
+
+        summary, report = member_import.import_members(
+            current_user, rows,
+            default_cell_id=request.args.get('cell_id'),
+            update_existing=on_match == 'update',
+            dry_run=dry_run
+        )
+        if not dry_run:
+            db.session.commit()
+
+        return jsonify({'summary': summary, 'rows': report, 'dry_run': dry_run}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@members_bp.route('/duplicates', methods=['GET'])
+@query_budget(8)
+@conditional('member_duplicates', 'members', 'cells', 'networks')
+def get_duplicates():
+    """Sugestões de membros duplicados, da maior pontuação para a menor"""
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        try:
+            min_score = float(request.args.get('min_score', member_dedup.MIN_SCORE))
+            limit, after = parse_page_args(request.args, DUPLICATES_KEYSET)
+        except ValueError:
+            return jsonify({'error': 'Parâmetros inválidos'}), 400
+        
+        kept, duplicate = aliased(Member), aliased(Member)
+        query = db.session.query(
+            MemberDuplicate.id, MemberDuplicate.score, MemberDuplicate.reasons,
+            MemberDuplicate.member_id, MemberDuplicate.duplicate_id
+        ).join(kept, kept.id == MemberDuplicate.member_id).join(
+            duplicate, duplicate.id == MemberDuplicate.duplicate_id
+        ).filter(MemberDuplicate.dismissed == False, MemberDuplicate.score >= min_score)
+        
+        # Apenas pares em que os dois membros estão no escopo do usuário
+        query = filter_by_scope(query, kept.cell_id, current_user)
+        query = filter_by_scope(query, duplicate.cell_id, current_user)
+        
+        rows, next_cursor = paginate(query, DUPLICATES_KEYSET, limit, after)
+        member_ids = {row.member_id for row in rows} | {row.duplicate_id for row in rows}
+        members = {member['id']: member for member in serialize_members(
+            Member.query.options(*list_options()).filter(Member.id.in_(member_ids)).all()
+        )} if member_ids else {}
+        
+        return jsonify({
+            'duplicates': [{
+                'id': row.id,
+                'score': row.score,
+                'reasons': row.reasons.split(','),
+                'member': members[row.member_id],
+                'duplicate': members[row.duplicate_id]
+            } for row in rows],
+            'next_cursor': next_cursor
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@members_bp.route('/duplicates/detect', methods=['POST'])
+def detect_duplicates():
+    """Recalcula as sugestões de duplicados de toda a igreja"""
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        if current_user.role != 'pastor':
+            return jsonify({'error': 'Apenas pastores podem executar a detecção de duplicados'}), 403
+        
+        started = time.perf_counter()
+        found = member_dedup.detect()
+        db.session.commit()
+        
+        return jsonify({
+            'duplicates': found,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000)
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@members_bp.route('/duplicates/<int:duplicate_id>/dismiss', methods=['POST'])
+def dismiss_duplicate(duplicate_id):
+    """Marca a sugestão como falsa: o par não volta a ser sugerido"""
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        suggestion = MemberDuplicate.query.get_or_404(duplicate_id)
+        members = Member.query.filter(Member.id.in_([suggestion.member_id, suggestion.duplicate_id])).all()
+        if not all(_can_edit(current_user, member) for member in members):
+            return jsonify({'error': 'Sem permissão para alterar estes membros'}), 403
+        
+        suggestion.dismissed = True
+        db.session.commit()
+        
+        return jsonify({'message': 'Sugestão descartada'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @members_bp.route('/', methods=['POST'])
 def create_member():
     try:
@@ -76,15 +334,7 @@ def create_member():
             if not cell or not cell.is_active:
                 return jsonify({'error': 'Célula não encontrada'}), 404
             
-            can_add = False
-            if current_user.role == 'pastor':
-                can_add = True
-            elif current_user.role == 'discipulador' and cell.network.supervisor_id == current_user.id:
-                can_add = True
-            elif current_user.role == 'lider' and cell.leader_id == current_user.id:
-                can_add = True
-            
-            if not can_add:
+            if not can_access_cell(current_user, cell.id):
                 return jsonify({'error': 'Sem permissão para adicionar membros nesta célula'}), 403
         
         new_member = Member(
@@ -92,7 +342,7 @@ def create_member():
             phone=phone,
             email=email,
             member_type=member_type,
-            cell_id=cell_id
+            cell_id=cell.id if cell_id else None
         )
         
         db.session.add(new_member)
@@ -117,19 +367,13 @@ def update_member(member_id):
         member = Member.query.get_or_404(member_id)
         
         # Verificar permissões
-        can_edit = False
-        if current_user.role == 'pastor':
-            can_edit = True
-        elif member.cell:
-            if current_user.role == 'discipulador' and member.cell.network.supervisor_id == current_user.id:
-                can_edit = True
-            elif current_user.role == 'lider' and member.cell.leader_id == current_user.id:
-                can_edit = True
+        can_edit = current_user.role == 'pastor' or (member.cell_id and can_access_cell(current_user, member.cell_id))
         
         if not can_edit:
             return jsonify({'error': 'Sem permissão para editar este membro'}), 403
         
         data = request.get_json()
+        old_cell_id = member.cell_id
         
         if 'full_name' in data:
             member.full_name = data['full_name']
@@ -142,19 +386,21 @@ def update_member(member_id):
         if 'cell_id' in data:
             # Verificar permissões para a nova célula
             if data['cell_id']:
-                new_cell = Cell.query.get(data['cell_id'])
+                try:
+                    new_cell_id = int(data['cell_id'])
+                except (TypeError, ValueError):
+                    return jsonify({'error': 'Célula inválida'}), 400
+                new_cell = Cell.query.get(new_cell_id)
                 if new_cell and new_cell.is_active:
-                    can_move = False
-                    if current_user.role == 'pastor':
-                        can_move = True
-                    elif current_user.role == 'discipulador' and new_cell.network.supervisor_id == current_user.id:
-                        can_move = True
-                    
-                    if can_move:
-                        member.cell_id = data['cell_id']
+                    if can_access_cell(current_user, new_cell.id, roles=('pastor', 'discipulador')):
+                        member.cell_id = new_cell.id
             else:
                 member.cell_id = None
         
+        # O histórico de presenças é o da célula atual
+        if member.cell_id != old_cell_id:
+            retention.refresh_members([member.id], {old_cell_id, member.cell_id})
+        
         db.session.commit()
         
         return jsonify({
@@ -176,19 +422,13 @@ def delete_member(member_id):
         member = Member.query.get_or_404(member_id)
         
         # Verificar permissões
-        can_delete = False
-        if current_user.role == 'pastor':
-            can_delete = True
-        elif member.cell:
-            if current_user.role == 'discipulador' and member.cell.network.supervisor_id == current_user.id:
-                can_delete = True
-            elif current_user.role == 'lider' and member.cell.leader_id == current_user.id:
-                can_delete = True
+        can_delete = current_user.role == 'pastor' or (member.cell_id and can_access_cell(current_user, member.cell_id))
         
         if not can_delete:
             return jsonify({'error': 'Sem permissão para excluir este membro'}), 403
         
         member.is_active = False
+        retention.refresh_members([member.id], ())
         
         db.session.commit()
         
@@ -198,3 +438,46 @@ def delete_member(member_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+
+@members_bp.route('/<int:member_id>/merge', methods=['POST'])
+def merge_member(member_id):
+    """Junta o membro `duplicate_id` neste: as presenças passam para este e o duplicado é desativado"""
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        data = request.get_json() or {}
+        try:
+            duplicate_id = int(data.get('duplicate_id'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Informe o membro duplicado'}), 400
+        if duplicate_id == member_id:
+            return jsonify({'error': 'Informe o membro duplicado'}), 400
+        
+        keep = Member.query.get_or_404(member_id)
+        duplicate = Member.query.get_or_404(duplicate_id)
+        
+        if not (_can_edit(current_user, keep) and _can_edit(current_user, duplicate)):
+            return jsonify({'error': 'Sem permissão para alterar estes membros'}), 403
+        
+        if not keep.is_active:
+            return jsonify({'error': 'O membro mantido está inativo'}), 400
+        if duplicate.merged_into_id:
+            return jsonify({'error': 'O membro duplicado já foi unido a outro'}), 400
+        
+        moved = member_dedup.merge(keep, duplicate)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Membros unidos com sucesso',
+            'member': keep.to_dict(),
+            'attendances_moved': moved
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+def _can_edit(user, member):
+    return user.role == 'pastor' or bool(member.cell_id and can_access_cell(user, member.cell_id))
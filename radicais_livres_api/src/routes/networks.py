@@ -1,15 +1,15 @@
-from flask import Blueprint, request, jsonify, session
-from src.models.models import db, Network, User
+from flask import Blueprint, request, jsonify
+from src.models.models import db, Network, Cell, User
+from src.services.serializers import list_options, serialize_networks
+from src.services.scope import check_auth
+from src.services.table_versions import conditional
+from src.services.query_audit import query_budget
 
 networks_bp = Blueprint('networks', __name__)
 
-def check_auth():
-    user_id = session.get('user_id')
-    if not user_id:
-        return None
-    return User.query.get(user_id)
-
 @networks_bp.route('/', methods=['GET'])
+@query_budget(8)
+@conditional('networks', 'cells', 'users')
 def get_networks():
     try:
         current_user = check_auth()
@@ -18,19 +18,17 @@ def get_networks():
         
         if current_user.role == 'pastor':
             # Pastor vê todas as redes
-            networks = Network.query.filter_by(is_active=True).all()
+            networks = Network.query.options(*list_options()).filter_by(is_active=True).all()
         elif current_user.role == 'discipulador':
             # Discipulador vê apenas suas redes
-            networks = Network.query.filter_by(supervisor_id=current_user.id, is_active=True).all()
+            networks = Network.query.options(*list_options()).filter_by(supervisor_id=current_user.id, is_active=True).all()
         else:
             # Líder vê apenas a rede da sua célula
-            networks = []
-            for cell in current_user.led_cells:
-                if cell.network and cell.network not in networks:
-                    networks.append(cell.network)
+            led_network_ids = db.session.query(Cell.network_id).filter(Cell.leader_id == current_user.id)
+            networks = Network.query.options(*list_options()).filter(Network.id.in_(led_network_ids)).all()
         
         return jsonify({
-            'networks': [network.to_dict() for network in networks]
+            'networks': serialize_networks(networks)
         }), 200
         
     except Exception as e:
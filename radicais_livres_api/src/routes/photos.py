@@ -1,6 +1,14 @@
-from flask import Blueprint, request, jsonify, session, send_from_directory
+from flask import Blueprint, request, jsonify
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 from werkzeug.utils import secure_filename
-from src.models.models import db, Photo, User, Cell
+from src.models.models import db, Photo, PhotoUpload, Cell
+from src.services.serializers import list_options, serialize_photos
+from src.services.pagination import Keyset, parse_datetime, parse_page_args, paginate
+from src.services.scope import check_auth, filter_by_scope, can_access_cell
+from src.services.table_versions import conditional
+from src.services.query_audit import query_budget
+from src.services.static_files import send_static
+from src.services import photo_variants, photo_storage, chunked_uploads
 import os
 import uuid
 from datetime import datetime
@@ -11,21 +19,47 @@ photos_bp = Blueprint('photos', __name__)
 UPLOAD_FOLDER = 'uploads/photos'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
-def check_auth():
-    user_id = session.get('user_id')
-    if not user_id:
-        return None
-    return User.query.get(user_id)
+PHOTOS_KEYSET = Keyset((Photo.created_at, parse_datetime), (Photo.id, int), descending=True)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+UPLOAD_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', UPLOAD_FOLDER)
+
 def ensure_upload_folder():
-    upload_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', UPLOAD_FOLDER)
-    os.makedirs(upload_path, exist_ok=True)
-    return upload_path
+    os.makedirs(UPLOAD_PATH, exist_ok=True)
+    return UPLOAD_PATH
+
+def parse_photo_data(current_user, data):
+    """Valida a célula e a data do evento de uma foto nova.
+
+    Retorna (cell_id, event_date, resposta de erro ou None).
+    """
+    cell_id = data.get('cell_id')
+    event_date = data.get('event_date')
+    
+    # Verificar permissões para a célula
+    if cell_id:
+        cell = Cell.query.get(cell_id)
+        if not cell or not cell.is_active:
+            return None, None, (jsonify({'error': 'Célula não encontrada'}), 404)
+        
+        if not can_access_cell(current_user, cell.id):
+            return None, None, (jsonify({'error': 'Sem permissão para enviar fotos para esta célula'}), 403)
+    
+    # Processar data do evento
+    event_date_obj = None
+    if event_date:
+        try:
+            event_date_obj = datetime.strptime(event_date, '%Y-%m-%d').date()
+        except ValueError:
+            return None, None, (jsonify({'error': 'Formato de data inválido. Use YYYY-MM-DD'}), 400)
+    
+    return (int(cell_id) if cell_id else None), event_date_obj, None
 
 @photos_bp.route('/', methods=['GET'])
+@query_budget(8)
+@conditional('photos', 'cells', 'networks', 'users')
 def get_photos():
     try:
         current_user = check_auth()
@@ -36,6 +70,11 @@ def get_photos():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
+        try:
+            limit, after = parse_page_args(request.args, PHOTOS_KEYSET)
+        except ValueError:
+            return jsonify({'error': 'Parâmetros de paginação inválidos'}), 400
+        
         query = Photo.query
         
         if cell_id:
@@ -47,30 +86,21 @@ def get_photos():
         if end_date:
             query = query.filter(Photo.event_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
         
-        # Filtrar por permissões
-        if current_user.role == 'pastor':
-            # Pastor vê todas as fotos
-            pass
-        elif current_user.role == 'discipulador':
-            # Discipulador vê fotos das células das suas redes
-            network_ids = [network.id for network in current_user.supervised_networks]
-            cell_ids = [cell.id for cell in Cell.query.filter(Cell.network_id.in_(network_ids)).all()]
-            query = query.filter((Photo.cell_id.in_(cell_ids)) | (Photo.cell_id.is_(None)))
-        else:
-            # Líder vê fotos das suas células e fotos gerais
-            cell_ids = [cell.id for cell in current_user.led_cells]
-            query = query.filter((Photo.cell_id.in_(cell_ids)) | (Photo.cell_id.is_(None)))
-        
-        photos = query.order_by(Photo.created_at.desc()).all()
+        # Filtrar por permissões (fotos gerais, sem célula, são visíveis a todos)
+        query = filter_by_scope(query, Photo.cell_id, current_user, include_null=True)
+        
+        photos, next_cursor = paginate(query.options(*list_options()), PHOTOS_KEYSET, limit, after)
         
         return jsonify({
-            'photos': [photo.to_dict() for photo in photos]
+            'photos': serialize_photos(photos),
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @photos_bp.route('/upload', methods=['POST'])
+@query_budget(20)
 def upload_photo():
     try:
         current_user = check_auth()
@@ -89,56 +119,37 @@ def upload_photo():
         
         # Dados adicionais
         description = request.form.get('description', '')
-        event_date = request.form.get('event_date')
-        cell_id = request.form.get('cell_id')
+        cell_id, event_date, error = parse_photo_data(current_user, request.form)
+        if error:
+            return error
         
-        # Verificar permissões para a célula
-        if cell_id:
-            cell = Cell.query.get(cell_id)
-            if not cell or not cell.is_active:
-                return jsonify({'error': 'Célula não encontrada'}), 404
-            
-            can_upload = False
-            if current_user.role == 'pastor':
-                can_upload = True
-            elif current_user.role == 'discipulador' and cell.network.supervisor_id == current_user.id:
-                can_upload = True
-            elif current_user.role == 'lider' and cell.leader_id == current_user.id:
-                can_upload = True
-            
-            if not can_upload:
-                return jsonify({'error': 'Sem permissão para enviar fotos para esta célula'}), 403
-        
-        # Processar data do evento
-        event_date_obj = None
-        if event_date:
-            try:
-                event_date_obj = datetime.strptime(event_date, '%Y-%m-%d').date()
-            except ValueError:
-                return jsonify({'error': 'Formato de data inválido. Use YYYY-MM-DD'}), 400
-        
-        # Salvar arquivo
+        # Salvar arquivo (conteúdo repetido reaproveita o arquivo já gravado)
         upload_path = ensure_upload_folder()
         original_filename = secure_filename(file.filename)
         file_extension = original_filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
         
-        file_path = os.path.join(upload_path, unique_filename)
-        file.save(file_path)
+        # O temporário vai para o destino no commit, ou é apagado no rollback
+        temp_path, sha256, size = photo_storage.save_stream(file.stream, upload_path)
+        filename, _ = photo_storage.store(temp_path, sha256, file_extension, size, upload_path)
         
         # Salvar no banco de dados
         new_photo = Photo(
-            filename=unique_filename,
+            filename=filename,
             original_filename=original_filename,
             description=description,
             uploaded_by=current_user.id,
-            event_date=event_date_obj,
-            cell_id=int(cell_id) if cell_id else None
+            event_date=event_date,
+            cell_id=cell_id
         )
+        has_variants = photo_storage.attach(new_photo, sha256)
         
         db.session.add(new_photo)
         db.session.commit()
         
+        # Miniatura e WebP são gerados em segundo plano
+        if not has_variants:
+            photo_variants.enqueue(new_photo, upload_path)
+        
         return jsonify({
             'message': 'Foto enviada com sucesso',
             'photo': new_photo.to_dict()
@@ -148,6 +159,195 @@ def upload_photo():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def get_own_upload(current_user, upload_id):
+    upload = db.session.get(PhotoUpload, upload_id)
+    if not upload or upload.uploaded_by != current_user.id:
+        return None
+    return upload
+
+@photos_bp.route('/uploads', methods=['POST'])
+def start_chunked_upload():
+    """Inicia um upload em partes; os metadados da foto são informados aqui"""
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        data = request.get_json()
+        original_filename = secure_filename(data.get('filename') or '')
+        total_size = data.get('size')
+        
+        if not original_filename or not allowed_file(original_filename):
+            return jsonify({'error': 'Tipo de arquivo não permitido'}), 400
+        
+        if not isinstance(total_size, int) or not 0 < total_size <= chunked_uploads.MAX_UPLOAD_SIZE:
+            return jsonify({'error': f'Tamanho inválido (máximo {chunked_uploads.MAX_UPLOAD_SIZE} bytes)'}), 400
+        
+        cell_id, event_date, error = parse_photo_data(current_user, data)
+        if error:
+            return error
+        
+        upload = PhotoUpload(
+            id=uuid.uuid4().hex,
+            uploaded_by=current_user.id,
+            original_filename=original_filename,
+            total_size=total_size,
+            sha256=(data.get('sha256') or '').lower() or None,
+            description=data.get('description', ''),
+            event_date=event_date,
+            cell_id=cell_id
+        )
+        db.session.add(upload)
+        chunked_uploads.start(upload)
+        db.session.commit()
+        
+        return jsonify({
+            'upload': upload.to_dict(offset=0),
+            'chunk_size': chunked_uploads.CHUNK_SIZE
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@photos_bp.route('/uploads/<upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    """Offset atual do upload, para retomar após uma queda de conexão"""
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        upload = get_own_upload(current_user, upload_id)
+        if not upload:
+            return jsonify({'error': 'Upload não encontrado'}), 404
+        
+        return jsonify({'upload': upload.to_dict(offset=chunked_uploads.current_offset(upload))}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@photos_bp.route('/uploads/<upload_id>', methods=['PATCH'])
+def append_chunk(upload_id):
+    """Grava uma parte: corpo bruto (application/octet-stream) e cabeçalho Upload-Offset"""
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        upload = get_own_upload(current_user, upload_id)
+        if not upload:
+            return jsonify({'error': 'Upload não encontrado'}), 404
+        
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return jsonify({'error': 'Cabeçalho Upload-Offset obrigatório'}), 400
+        
+        length = request.content_length
+        if not length:
+            return jsonify({'error': 'Content-Length obrigatório'}), 411
+        if length > chunked_uploads.MAX_CHUNK_SIZE:
+            return jsonify({'error': f'Parte maior que {chunked_uploads.MAX_CHUNK_SIZE} bytes'}), 413
+        
+        # Libera a conexão com o banco enquanto os bytes chegam
+        db.session.expunge(upload)
+        db.session.commit()
+        
+        try:
+            new_offset = chunked_uploads.append(upload, request.stream, offset, length)
+        except chunked_uploads.OffsetMismatch as e:
+            return jsonify({'error': 'Offset não confere', 'offset': e.offset}), 409
+        except chunked_uploads.UploadBusy:
+            return jsonify({'error': 'Outra parte deste upload está sendo gravada'}), 409
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = jsonify({'offset': new_offset, 'complete': new_offset == upload.total_size})
+        response.headers['Upload-Offset'] = str(new_offset)
+        return response, 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@photos_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """Confere tamanho e checksum e grava a foto"""
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        upload = get_own_upload(current_user, upload_id)
+        if not upload:
+            return jsonify({'error': 'Upload não encontrado'}), 404
+        
+        offset = chunked_uploads.current_offset(upload)
+        if offset != upload.total_size:
+            return jsonify({'error': 'Upload incompleto', 'offset': offset}), 400
+        
+        checksum = chunked_uploads.checksum(upload)
+        if upload.sha256 and upload.sha256 != checksum:
+            chunked_uploads.discard(upload)
+            db.session.commit()
+            return jsonify({'error': 'Checksum não confere; envie o arquivo novamente'}), 422
+        
+        # Salvar arquivo (conteúdo repetido reaproveita o arquivo já gravado)
+        upload_path = ensure_upload_folder()
+        file_extension = upload.original_filename.rsplit('.', 1)[1].lower()
+        # Se a transação for desfeita o arquivo parcial fica, para uma nova tentativa
+        filename, _ = photo_storage.store(chunked_uploads.partial_path(upload.id), checksum,
+                                          file_extension, upload.total_size, upload_path,
+                                          discard_source=False)
+        chunked_uploads.complete(upload)
+        
+        new_photo = Photo(
+            filename=filename,
+            original_filename=upload.original_filename,
+            description=upload.description,
+            uploaded_by=current_user.id,
+            event_date=upload.event_date,
+            cell_id=upload.cell_id
+        )
+        has_variants = photo_storage.attach(new_photo, checksum)
+        db.session.add(new_photo)
+        db.session.commit()
+        
+        # Miniatura e WebP são gerados em segundo plano
+        if not has_variants:
+            photo_variants.enqueue(new_photo, upload_path)
+        
+        return jsonify({
+            'message': 'Foto enviada com sucesso',
+            'photo': new_photo.to_dict(),
+            'sha256': checksum
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@photos_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+def cancel_chunked_upload(upload_id):
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        upload = get_own_upload(current_user, upload_id)
+        if not upload:
+            return jsonify({'error': 'Upload não encontrado'}), 404
+        
+        chunked_uploads.discard(upload)
+        db.session.commit()
+        
+        return jsonify({'message': 'Upload cancelado'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @photos_bp.route('/<int:photo_id>', methods=['PUT'])
 def update_photo(photo_id):
     try:
@@ -158,13 +358,8 @@ def update_photo(photo_id):
         photo = Photo.query.get_or_404(photo_id)
         
         # Verificar permissões
-        can_edit = False
-        if current_user.role == 'pastor':
-            can_edit = True
-        elif photo.uploaded_by == current_user.id:
-            can_edit = True
-        elif photo.cell and current_user.role == 'discipulador' and photo.cell.network.supervisor_id == current_user.id:
-            can_edit = True
+        can_edit = (current_user.role == 'pastor' or photo.uploaded_by == current_user.id or
+                    (photo.cell_id and can_access_cell(current_user, photo.cell_id, roles=('discipulador',))))
         
         if not can_edit:
             return jsonify({'error': 'Sem permissão para editar esta foto'}), 403
@@ -187,13 +382,7 @@ def update_photo(photo_id):
             if data['cell_id']:
                 cell = Cell.query.get(data['cell_id'])
                 if cell and cell.is_active:
-                    can_move = False
-                    if current_user.role == 'pastor':
-                        can_move = True
-                    elif current_user.role == 'discipulador' and cell.network.supervisor_id == current_user.id:
-                        can_move = True
-                    
-                    if can_move:
+                    if can_access_cell(current_user, cell.id, roles=('pastor', 'discipulador')):
                         photo.cell_id = data['cell_id']
             else:
                 photo.cell_id = None
@@ -219,25 +408,15 @@ def delete_photo(photo_id):
         photo = Photo.query.get_or_404(photo_id)
         
         # Verificar permissões
-        can_delete = False
-        if current_user.role == 'pastor':
-            can_delete = True
-        elif photo.uploaded_by == current_user.id:
-            can_delete = True
-        elif photo.cell and current_user.role == 'discipulador' and photo.cell.network.supervisor_id == current_user.id:
-            can_delete = True
+        can_delete = (current_user.role == 'pastor' or photo.uploaded_by == current_user.id or
+                      (photo.cell_id and can_access_cell(current_user, photo.cell_id, roles=('discipulador',))))
         
         if not can_delete:
             return jsonify({'error': 'Sem permissão para excluir esta foto'}), 403
         
-        # Remover arquivo físico
+        # Remover do banco de dados; o arquivo só sai com a última foto que o usa
         upload_path = ensure_upload_folder()
-        file_path = os.path.join(upload_path, photo.filename)
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        # Remover do banco de dados
-        db.session.delete(photo)
+        photo_storage.delete_photo(photo, upload_path)
         db.session.commit()
         
         return jsonify({'message': 'Foto excluída com sucesso'}), 200
@@ -248,10 +427,15 @@ def delete_photo(photo_id):
 
 @photos_bp.route('/file/<filename>')
 def get_photo_file(filename):
-    """Servir arquivos de foto"""
+    """Servir arquivos de foto (?size=thumb|web para as variantes)"""
     try:
-        upload_path = ensure_upload_folder()
-        return send_from_directory(upload_path, filename)
+        size = request.args.get('size')
+        resolved = photo_variants.resolve(filename, size, UPLOAD_PATH)
+        # Enquanto a variante não existe, a mesma URL entrega o original: sem cache longo
+        fallback = size in photo_variants.VARIANTS and resolved == filename
+        return send_static(UPLOAD_PATH, resolved, immutable=False if fallback else None)
+    except RequestedRangeNotSatisfiable:
+        raise
     except Exception as e:
         return jsonify({'error': 'Arquivo não encontrado'}), 404
 
@@ -1,16 +1,28 @@
-from flask import Blueprint, request, jsonify, session
-from src.models.models import db, AttendanceReport, Attendance, Cell, Member, User
+from flask import Blueprint, request, jsonify
+from sqlalchemy.exc import IntegrityError
+from src.models.models import db, AttendanceReport, Attendance, Cell, Network, User, Member
+from src.services.serializers import list_options, serialize_reports, serialize_attendances
+from src.services.pagination import Keyset, parse_date, parse_page_args, paginate
+from src.services.dashboard_stats import get_totals
+from src.services.scope import check_auth, filter_by_scope, can_access_cell
+from src.services.table_versions import conditional
+from src.services.query_audit import query_budget
+from src.services.attendance import (count_by_type, insert_attendances, insert_attendances_many, sync_attendances,
+                                     attendance_error, member_ids)
+from src.services import analytics, retention, export
+from sqlalchemy import tuple_, select, func
 from datetime import datetime, date
 
 reports_bp = Blueprint('reports', __name__)
 
-def check_auth():
-    user_id = session.get('user_id')
-    if not user_id:
-        return None
-    return User.query.get(user_id)
+REPORTS_KEYSET = Keyset((AttendanceReport.meeting_date, parse_date), (AttendanceReport.id, int), descending=True)
+
+# Número máximo de relatórios por envio em lote
+MAX_BATCH_SIZE = 100
 
 @reports_bp.route('/', methods=['GET'])
+@query_budget(10)
+@conditional('attendance_reports', 'cells', 'networks', 'users')
 def get_reports():
     try:
         current_user = check_auth()
@@ -21,6 +33,11 @@ def get_reports():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
+        try:
+            limit, after = parse_page_args(request.args, REPORTS_KEYSET)
+        except ValueError:
+            return jsonify({'error': 'Parâmetros de paginação inválidos'}), 400
+        
         query = AttendanceReport.query
         
         if cell_id:
@@ -33,29 +50,70 @@ def get_reports():
             query = query.filter(AttendanceReport.meeting_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
         
         # Filtrar por permissões
-        if current_user.role == 'pastor':
-            # Pastor vê todos os relatórios
-            pass
-        elif current_user.role == 'discipulador':
-            # Discipulador vê relatórios das células das suas redes
-            network_ids = [network.id for network in current_user.supervised_networks]
-            cell_ids = [cell.id for cell in Cell.query.filter(Cell.network_id.in_(network_ids)).all()]
-            query = query.join(Cell).filter(Cell.id.in_(cell_ids))
-        else:
-            # Líder vê apenas relatórios das suas células
-            cell_ids = [cell.id for cell in current_user.led_cells]
-            query = query.filter(AttendanceReport.cell_id.in_(cell_ids))
-        
-        reports = query.order_by(AttendanceReport.meeting_date.desc()).all()
+        query = filter_by_scope(query, AttendanceReport.cell_id, current_user)
+        
+        reports, next_cursor = paginate(query.options(*list_options()), REPORTS_KEYSET, limit, after)
         
         return jsonify({
-            'reports': [report.to_dict() for report in reports]
+            'reports': serialize_reports(reports),
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@reports_bp.route('/export', methods=['GET'])
+def export_reports():
+    """Exporta os relatórios filtrados em CSV (padrão) ou XLSX (?format=xlsx)"""
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        export_format = request.args.get('format', 'csv')
+        if export_format not in export.FORMATS:
+            return jsonify({'error': 'Formato inválido. Use csv ou xlsx'}), 400
+        
+        cell_id = request.args.get('cell_id')
+        try:
+            start_date = parse_date(request.args['start_date']) if request.args.get('start_date') else None
+            end_date = parse_date(request.args['end_date']) if request.args.get('end_date') else None
+        except ValueError:
+            return jsonify({'error': 'Formato de data inválido. Use YYYY-MM-DD'}), 400
+        
+        total = (func.coalesce(AttendanceReport.members_present, 0) + func.coalesce(AttendanceReport.fas_present, 0) +
+                 func.coalesce(AttendanceReport.visitors_present, 0))
+        query = select(
+            AttendanceReport.id, AttendanceReport.meeting_date, Cell.name, Network.name,
+            AttendanceReport.members_present, AttendanceReport.fas_present, AttendanceReport.visitors_present,
+            total, AttendanceReport.observations, AttendanceReport.testimony, User.full_name,
+            AttendanceReport.created_at
+        ).join(Cell, Cell.id == AttendanceReport.cell_id).outerjoin(
+            Network, Network.id == Cell.network_id
+        ).outerjoin(User, User.id == AttendanceReport.created_by)
+        
+        if cell_id:
+            query = query.where(AttendanceReport.cell_id == cell_id)
+        
+        if start_date:
+            query = query.where(AttendanceReport.meeting_date >= start_date)
+        
+        if end_date:
+            query = query.where(AttendanceReport.meeting_date <= end_date)
+        
+        # Filtrar por permissões
+        query = filter_by_scope(query, AttendanceReport.cell_id, current_user)
+        query = query.order_by(AttendanceReport.meeting_date, AttendanceReport.id)
+        
+        header = ['ID', 'Data da reunião', 'Célula', 'Rede', 'Membros', 'FAs', 'Visitantes', 'Total',
+                  'Observações', 'Testemunho', 'Criado por', 'Criado em']
+        return export.export_response(header, export.stream_rows(query), export_format, 'relatorios', 'Relatórios')
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @reports_bp.route('/', methods=['POST'])
+@query_budget(26)
 def create_report():
     try:
         current_user = check_auth()
@@ -77,15 +135,7 @@ def create_report():
         if not cell or not cell.is_active:
             return jsonify({'error': 'Célula não encontrada'}), 404
         
-        can_create = False
-        if current_user.role == 'pastor':
-            can_create = True
-        elif current_user.role == 'discipulador' and cell.network.supervisor_id == current_user.id:
-            can_create = True
-        elif current_user.role == 'lider' and cell.leader_id == current_user.id:
-            can_create = True
-        
-        if not can_create:
+        if not can_access_cell(current_user, cell.id):
             return jsonify({'error': 'Sem permissão para criar relatórios para esta célula'}), 403
         
         # Converter string de data
@@ -94,19 +144,8 @@ def create_report():
         except ValueError:
             return jsonify({'error': 'Formato de data inválido. Use YYYY-MM-DD'}), 400
         
-        # Verificar se já existe relatório para esta célula nesta data
-        existing_report = AttendanceReport.query.filter_by(
-            cell_id=cell_id,
-            meeting_date=meeting_date
-        ).first()
-        
-        if existing_report:
-            return jsonify({'error': 'Já existe relatório para esta célula nesta data'}), 409
-        
         # Contar presenças por tipo
-        members_present = len([a for a in attendances if a.get('attendance_type') == 'membro'])
-        fas_present = len([a for a in attendances if a.get('attendance_type') == 'fa'])
-        visitors_present = len([a for a in attendances if a.get('attendance_type') == 'visitante'])
+        members_present, fas_present, visitors_present = count_by_type(attendances)
         
         # Criar relatório
         new_report = AttendanceReport(
@@ -121,17 +160,16 @@ def create_report():
         )
         
         db.session.add(new_report)
-        db.session.flush()  # Para obter o ID do relatório
-        
-        # Criar registros de presença
-        for attendance_data in attendances:
-            attendance = Attendance(
-                report_id=new_report.id,
-                member_id=attendance_data.get('member_id'),
-                visitor_name=attendance_data.get('visitor_name'),
-                attendance_type=attendance_data.get('attendance_type')
-            )
-            db.session.add(attendance)
+        try:
+            # O índice único (cell_id, meeting_date) impede relatórios duplicados
+            db.session.flush()  # Para obter o ID do relatório
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'Já existe relatório para esta célula nesta data'}), 409
+        
+        # Criar registros de presença em lote
+        insert_attendances(new_report.id, attendances)
+        retention.record_report(new_report, [a['member_id'] for a in attendances if a.get('member_id')])
         
         db.session.commit()
         
@@ -144,6 +182,197 @@ def create_report():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@reports_bp.route('/batch', methods=['POST'])
+def create_reports_batch():
+    """Cria vários relatórios em uma transação.
+
+    Corpo: {"reports": [...], "mode": "atomic" | "best_effort"}. No modo
+    atomic (padrão) nada é gravado se algum item for inválido; no modo
+    best_effort os itens válidos são gravados e os inválidos (inclusive os
+    que conflitam com um envio simultâneo) são apontados no resultado.
+    """
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        data = request.get_json() or {}
+        items = data.get('reports')
+        mode = data.get('mode', 'atomic')
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'Lista de relatórios é obrigatória'}), 400
+        if len(items) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'Máximo de {MAX_BATCH_SIZE} relatórios por envio'}), 400
+        if mode not in ['atomic', 'best_effort']:
+            return jsonify({'error': 'Modo inválido. Use atomic ou best_effort'}), 400
+        
+        results = [None] * len(items)
+        def fail(index, error, status):
+            results[index] = {'index': index, 'status': 'error', 'error': error, 'code': status}
+        
+        # Validar campos e converter datas
+        parsed = {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not item.get('cell_id') or not item.get('meeting_date'):
+                fail(index, 'Célula e data da reunião são obrigatórios', 400)
+                continue
+            try:
+                meeting_date = datetime.strptime(item['meeting_date'], '%Y-%m-%d').date()
+            except (TypeError, ValueError):
+                fail(index, 'Formato de data inválido. Use YYYY-MM-DD', 400)
+                continue
+            try:
+                cell_id = int(item['cell_id'])
+            except (TypeError, ValueError):
+                fail(index, 'Célula inválida', 400)
+                continue
+            error = attendance_error(item.get('attendances', []))
+            if error:
+                fail(index, error, 400)
+                continue
+            parsed[index] = (cell_id, meeting_date)
+        
+        # Membros citados nas presenças que existem, em uma consulta
+        cited = set().union(*(member_ids(items[index].get('attendances', [])) for index in parsed))
+        known_members = {member_id for (member_id,) in db.session.query(Member.id).filter(
+            Member.id.in_(cited)
+        )} if cited else set()
+        
+        # Células existentes e ativas, em uma consulta
+        cell_ids = {cell_id for cell_id, _ in parsed.values()}
+        active_cells = {cell_id for (cell_id,) in db.session.query(Cell.id).filter(
+            Cell.id.in_(cell_ids), Cell.is_active == True
+        )} if cell_ids else set()
+        
+        # Relatórios já existentes para os pares (célula, data), em uma consulta
+        pairs = set(parsed.values())
+        existing = set(db.session.query(AttendanceReport.cell_id, AttendanceReport.meeting_date).filter(
+            tuple_(AttendanceReport.cell_id, AttendanceReport.meeting_date).in_(pairs)
+        ).all()) if pairs else set()
+        
+        seen = set()
+        for index, (cell_id, meeting_date) in parsed.items():
+            if not member_ids(items[index].get('attendances', [])) <= known_members:
+                fail(index, 'Membro não encontrado na lista de presenças', 400)
+            elif cell_id not in active_cells:
+                fail(index, 'Célula não encontrada', 404)
+            elif not can_access_cell(current_user, cell_id):
+                fail(index, 'Sem permissão para criar relatórios para esta célula', 403)
+            elif (cell_id, meeting_date) in existing or (cell_id, meeting_date) in seen:
+                fail(index, 'Já existe relatório para esta célula nesta data', 409)
+            seen.add((cell_id, meeting_date))
+        
+        failed = [result for result in results if result is not None]
+        if failed and mode == 'atomic':
+            return jsonify({'created': 0, 'results': results}), 400
+        
+        # Gravar relatórios e presenças válidos em uma única transação
+        new_reports = {}
+        for index, (cell_id, meeting_date) in parsed.items():
+            if results[index] is not None:
+                continue
+            attendances = items[index].get('attendances', [])
+            members_present, fas_present, visitors_present = count_by_type(attendances)
+            new_reports[index] = AttendanceReport(
+                cell_id=cell_id,
+                meeting_date=meeting_date,
+                members_present=members_present,
+                fas_present=fas_present,
+                visitors_present=visitors_present,
+                observations=items[index].get('observations', ''),
+                testimony=items[index].get('testimony', ''),
+                created_by=current_user.id
+            )
+        
+        # Outro envio pode gravar um dos relatórios entre a verificação e a escrita
+        if mode == 'best_effort':
+            # Um savepoint por relatório: o conflito descarta só o item
+            for index, report in list(new_reports.items()):
+                try:
+                    with db.session.begin_nested():
+                        db.session.add(report)
+                except IntegrityError:
+                    del new_reports[index]
+                    fail(index, 'Já existe relatório para esta célula nesta data', 409)
+        elif new_reports:
+            db.session.add_all(new_reports.values())
+            try:
+                db.session.flush()
+            except IntegrityError:
+                db.session.rollback()
+                return jsonify({'error': 'Já existe relatório para esta célula nesta data'}), 409
+        
+        if new_reports:
+            insert_attendances_many([(report.id, items[index].get('attendances', []))
+                                     for index, report in new_reports.items()])
+            retention.rebuild({report.cell_id for report in new_reports.values()})
+            
+            # Serializar antes do commit, que expira os objetos
+            serialized = serialize_reports(list(new_reports.values()))
+            for (index, report), report_data in zip(new_reports.items(), serialized):
+                results[index] = {'index': index, 'status': 'created', 'report': report_data}
+            
+            db.session.commit()
+        
+        status = 201 if new_reports else 400
+        return jsonify({'created': len(new_reports), 'results': results}), status
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@reports_bp.route('/analytics', methods=['GET'])
+def get_analytics():
+    """Séries semanais de presença por rede (padrão) ou por célula"""
+    try:
+        current_user = check_auth()
+        if not current_user:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+        
+        group_by = request.args.get('group_by', 'network')
+        cell_id = request.args.get('cell_id')
+        network_id = request.args.get('network_id')
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        window = request.args.get('window', analytics.DEFAULT_WINDOW, type=int)
+        
+        if group_by not in ['cell', 'network']:
+            return jsonify({'error': 'Agrupamento inválido. Use cell ou network'}), 400
+        if window < 1:
+            return jsonify({'error': 'Janela da média móvel inválida'}), 400
+        
+        query = analytics.grouped_query(group_by)
+        
+        if cell_id:
+            query = query.where(AttendanceReport.cell_id == cell_id)
+        
+        if network_id:
+            query = query.where(Cell.network_id == network_id)
+        
+        try:
+            if start_date:
+                query = query.where(AttendanceReport.meeting_date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+            if end_date:
+                query = query.where(AttendanceReport.meeting_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+        except ValueError:
+            return jsonify({'error': 'Formato de data inválido. Use YYYY-MM-DD'}), 400
+        
+        # Filtrar por permissões
+        query = filter_by_scope(query, AttendanceReport.cell_id, current_user)
+        
+        rows = db.session.execute(query).all()
+        names = analytics.group_names(group_by, {row[0] for row in rows})
+        
+        data = analytics.weekly_series(rows, names, window)
+        data['group_by'] = group_by
+        data['window'] = window
+        
+        return jsonify(data), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @reports_bp.route('/<int:report_id>', methods=['GET'])
 def get_report_details(report_id):
     try:
@@ -154,22 +383,14 @@ def get_report_details(report_id):
         report = AttendanceReport.query.get_or_404(report_id)
         
         # Verificar permissões
-        can_view = False
-        if current_user.role == 'pastor':
-            can_view = True
-        elif current_user.role == 'discipulador' and report.cell.network.supervisor_id == current_user.id:
-            can_view = True
-        elif current_user.role == 'lider' and report.cell.leader_id == current_user.id:
-            can_view = True
-        
-        if not can_view:
+        if not can_access_cell(current_user, report.cell_id):
             return jsonify({'error': 'Sem permissão para visualizar este relatório'}), 403
         
         # Buscar detalhes das presenças
-        attendances = Attendance.query.filter_by(report_id=report_id).all()
+        attendances = Attendance.query.options(*list_options()).filter_by(report_id=report_id).all()
         
         report_data = report.to_dict()
-        report_data['attendances'] = [attendance.to_dict() for attendance in attendances]
+        report_data['attendances'] = serialize_attendances(attendances)
         
         return jsonify({'report': report_data}), 200
         
@@ -186,15 +407,7 @@ def update_report(report_id):
         report = AttendanceReport.query.get_or_404(report_id)
         
         # Verificar permissões
-        can_edit = False
-        if current_user.role == 'pastor':
-            can_edit = True
-        elif current_user.role == 'discipulador' and report.cell.network.supervisor_id == current_user.id:
-            can_edit = True
-        elif current_user.role == 'lider' and report.cell.leader_id == current_user.id:
-            can_edit = True
-        
-        if not can_edit:
+        if not can_access_cell(current_user, report.cell_id):
             return jsonify({'error': 'Sem permissão para editar este relatório'}), 403
         
         data = request.get_json()
@@ -206,27 +419,13 @@ def update_report(report_id):
         
         # Atualizar presenças se fornecidas
         if 'attendances' in data:
-            # Remover presenças antigas
-            Attendance.query.filter_by(report_id=report_id).delete()
-            
-            # Adicionar novas presenças
             attendances = data['attendances']
-            members_present = len([a for a in attendances if a.get('attendance_type') == 'membro'])
-            fas_present = len([a for a in attendances if a.get('attendance_type') == 'fa'])
-            visitors_present = len([a for a in attendances if a.get('attendance_type') == 'visitante'])
-            
-            report.members_present = members_present
-            report.fas_present = fas_present
-            report.visitors_present = visitors_present
+            report.members_present, report.fas_present, report.visitors_present = count_by_type(attendances)
             
-            for attendance_data in attendances:
-                attendance = Attendance(
-                    report_id=report_id,
-                    member_id=attendance_data.get('member_id'),
-                    visitor_name=attendance_data.get('visitor_name'),
-                    attendance_type=attendance_data.get('attendance_type')
-                )
-                db.session.add(attendance)
+            # Alterar apenas as presenças que mudaram
+            changes = sync_attendances(report_id, attendances)
+            if any(changes.values()):
+                retention.rebuild([report.cell_id])
         
         db.session.commit()
         
@@ -249,13 +448,7 @@ def delete_report(report_id):
         report = AttendanceReport.query.get_or_404(report_id)
         
         # Verificar permissões (apenas pastores e discipuladores podem excluir)
-        can_delete = False
-        if current_user.role == 'pastor':
-            can_delete = True
-        elif current_user.role == 'discipulador' and report.cell.network.supervisor_id == current_user.id:
-            can_delete = True
-        
-        if not can_delete:
+        if not can_access_cell(current_user, report.cell_id, roles=('pastor', 'discipulador')):
             return jsonify({'error': 'Sem permissão para excluir este relatório'}), 403
         
         # Excluir presenças associadas
@@ -263,6 +456,8 @@ def delete_report(report_id):
         
         # Excluir relatório
         db.session.delete(report)
+        db.session.flush()
+        retention.rebuild([report.cell_id])
         db.session.commit()
         
         return jsonify({'message': 'Relatório excluído com sucesso'}), 200
@@ -272,55 +467,24 @@ def delete_report(report_id):
         return jsonify({'error': str(e)}), 500
 
 @reports_bp.route('/dashboard', methods=['GET'])
+@query_budget(10)
+@conditional('dashboard_stats', 'attendance_reports', 'cells', 'networks', 'members', 'users')
 def get_dashboard_data():
     try:
         current_user = check_auth()
         if not current_user:
             return jsonify({'error': 'Usuário não autenticado'}), 401
         
-        # Dados do dashboard baseados no perfil do usuário
-        data = {}
+        # Totais materializados do escopo do usuário
+        data = get_totals(current_user)
         
-        if current_user.role == 'pastor':
-            # Estatísticas gerais
-            total_cells = Cell.query.filter_by(is_active=True).count()
-            total_members = Member.query.filter_by(is_active=True, member_type='membro').count()
-            total_networks = db.session.query(Cell.network_id).filter(Cell.is_active == True).distinct().count()
-            
-            # Relatórios recentes
-            recent_reports = AttendanceReport.query.order_by(AttendanceReport.created_at.desc()).limit(5).all()
-            
-        elif current_user.role == 'discipulador':
-            # Estatísticas das redes supervisionadas
-            network_ids = [network.id for network in current_user.supervised_networks]
-            cells = Cell.query.filter(Cell.network_id.in_(network_ids), Cell.is_active == True).all()
-            cell_ids = [cell.id for cell in cells]
-            
-            total_cells = len(cells)
-            total_members = Member.query.filter(Member.cell_id.in_(cell_ids), Member.is_active == True, Member.member_type == 'membro').count()
-            total_networks = len(current_user.supervised_networks)
-            
-            # Relatórios recentes das células supervisionadas
-            recent_reports = AttendanceReport.query.filter(AttendanceReport.cell_id.in_(cell_ids)).order_by(AttendanceReport.created_at.desc()).limit(5).all()
-            
-        else:  # líder
-            # Estatísticas das células lideradas
-            cells = current_user.led_cells
-            cell_ids = [cell.id for cell in cells if cell.is_active]
-            
-            total_cells = len([cell for cell in cells if cell.is_active])
-            total_members = Member.query.filter(Member.cell_id.in_(cell_ids), Member.is_active == True, Member.member_type == 'membro').count()
-            total_networks = len(set([cell.network_id for cell in cells if cell.is_active]))
-            
-            # Relatórios recentes das células lideradas
-            recent_reports = AttendanceReport.query.filter(AttendanceReport.cell_id.in_(cell_ids)).order_by(AttendanceReport.created_at.desc()).limit(5).all()
-        
-        data = {
-            'total_cells': total_cells,
-            'total_members': total_members,
-            'total_networks': total_networks,
-            'recent_reports': [report.to_dict() for report in recent_reports]
-        }
+        # Relatórios recentes
+        recent_query = AttendanceReport.query.options(*list_options())
+        if current_user.role != 'pastor':
+            recent_query = filter_by_scope(recent_query, AttendanceReport.cell_id, current_user, active_only=True)
+        
+        recent_reports = recent_query.order_by(AttendanceReport.created_at.desc()).limit(5).all()
+        data['recent_reports'] = serialize_reports(recent_reports)
         
         return jsonify(data), 200
         
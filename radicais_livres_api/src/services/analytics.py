@@ -0,0 +1,110 @@
+"""
+Séries semanais de presença por célula ou por rede.
+
+Os totais vêm de uma única consulta agrupada por (grupo, semana), que
+devolve apenas inteiros; as médias móveis e as taxas de crescimento são
+calculadas com arrays NumPy, sem laços por linha em Python.
+"""
+import numpy as np
+from sqlalchemy import Integer, func, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from src.models.models import db, AttendanceReport, Cell, Network
+
+DEFAULT_WINDOW = 4
+CATEGORIES = ('members', 'fas', 'visitors')
+
+class epoch_days(FunctionElement):
+    """Dias desde 1970-01-01 de uma coluna de data"""
+    type = Integer()
+    inherit_cache = True
+
+@compiles(epoch_days)
+def _epoch_days_sqlite(element, compiler, **kw):
+    return 'CAST(julianday(%s) - 2440587.5 AS INTEGER)' % compiler.process(element.clauses, **kw)
+
+@compiles(epoch_days, 'postgresql')
+def _epoch_days_postgresql(element, compiler, **kw):
+    return "(%s - DATE '1970-01-01')" % compiler.process(element.clauses, **kw)
+
+def week_index(column):
+    # 1970-01-01 foi uma quinta-feira: a semana começa na segunda, 3 dias antes
+    return (epoch_days(column) + 3) // 7
+
+def grouped_query(group_by):
+    """Consulta com (grupo, semana, membros, fas, visitantes)"""
+    key = AttendanceReport.cell_id if group_by == 'cell' else Cell.network_id
+    week = week_index(AttendanceReport.meeting_date)
+
+    query = select(
+        key, week,
+        func.coalesce(func.sum(AttendanceReport.members_present), 0),
+        func.coalesce(func.sum(AttendanceReport.fas_present), 0),
+        func.coalesce(func.sum(AttendanceReport.visitors_present), 0)
+    ).join(Cell, Cell.id == AttendanceReport.cell_id)
+    return query.group_by(key, week)
+
+def group_names(group_by, ids):
+    model = Cell if group_by == 'cell' else Network
+    if not ids:
+        return {}
+    return dict(db.session.query(model.id, model.name).filter(model.id.in_(ids)).all())
+
+def moving_average(values, window):
+    """Média móvel das últimas `window` semanas com dados (NaN = sem relatório)"""
+    valid = ~np.isnan(values)
+    sums = np.cumsum(np.where(valid, values, 0.0), axis=-1)
+    counts = np.cumsum(valid, axis=-1)
+    sums[..., window:] = sums[..., window:] - sums[..., :-window]
+    counts[..., window:] = counts[..., window:] - counts[..., :-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+def growth_rate(values):
+    """Variação percentual em relação à semana anterior"""
+    rates = np.full(values.shape, np.nan)
+    previous, current = values[..., :-1], values[..., 1:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rates[..., 1:] = np.where(previous > 0, (current - previous) / previous * 100, np.nan)
+    return rates
+
+def weekly_series(rows, names, window=DEFAULT_WINDOW):
+    """Monta as séries a partir das linhas da consulta agrupada"""
+    if not rows:
+        return {'weeks': [], 'series': [], 'overall': None}
+
+    # Row não é uma tupla: converter antes evita que o NumPy inspecione cada linha
+    data = np.array([tuple(row) for row in rows], dtype=np.int64)
+    group_ids, group_index = np.unique(data[:, 0], return_inverse=True)
+    first_week = data[:, 1].min()
+    weeks = data[:, 1] - first_week
+    n_weeks = int(weeks.max()) + 1
+
+    # Matriz grupo × semana × categoria; semanas sem relatório ficam NaN
+    matrix = np.full((len(group_ids), n_weeks, len(CATEGORIES)), np.nan)
+    matrix[group_index, weeks] = data[:, 2:]
+    reported = ~np.isnan(matrix[..., 0])
+
+    overall = np.nansum(matrix, axis=0)
+    overall[~reported.any(axis=0)] = np.nan
+
+    week_starts = ((np.arange(n_weeks) + first_week) * 7 - 3).astype('datetime64[D]')
+
+    return {
+        'weeks': week_starts.astype(str).tolist(),
+        'series': [dict(_describe(matrix[i], window), id=group_id, name=names.get(group_id))
+                   for i, group_id in enumerate(group_ids.tolist())],
+        'overall': _describe(overall, window)
+    }
+
+def _describe(values, window):
+    total = values.sum(axis=-1)
+    result = {category: _to_list(values[:, i]) for i, category in enumerate(CATEGORIES)}
+    result['total'] = _to_list(total)
+    result['moving_average'] = _to_list(moving_average(total, window))
+    result['growth_rate'] = _to_list(growth_rate(total))
+    return result
+
+def _to_list(values):
+    # NaN (semana sem relatório ou taxa indefinida) vira null no JSON
+    return [None if value != value else value for value in np.round(values, 2).tolist()]
@@ -0,0 +1,103 @@
+"""
+Escrita das presenças de um relatório.
+
+As presenças novas são gravadas com um único INSERT em lote (executemany) e
+a edição de um relatório compara a lista recebida com as linhas gravadas,
+alterando apenas as presenças que mudaram.
+"""
+from collections import defaultdict
+from sqlalchemy import insert, delete, update, select
+from src.models.models import db, Attendance
+
+ATTENDANCE_TYPES = ('membro', 'fa', 'visitante')
+
+def count_by_type(attendances):
+    """Retorna (membros, fas, visitantes) presentes"""
+    counts = dict.fromkeys(ATTENDANCE_TYPES, 0)
+    for attendance in attendances:
+        attendance_type = attendance.get('attendance_type')
+        if attendance_type in counts:
+            counts[attendance_type] += 1
+    return counts['membro'], counts['fa'], counts['visitante']
+
+def attendance_error(attendances):
+    """Mensagem de erro se a lista de presenças tiver formato inválido, ou None.
+
+    Não confere se os membros existem (ver member_ids).
+    """
+    if not isinstance(attendances, list):
+        return 'Lista de presenças inválida'
+    for attendance in attendances:
+        if not isinstance(attendance, dict):
+            return 'Presença inválida'
+        if attendance.get('attendance_type') not in ATTENDANCE_TYPES:
+            return 'Tipo de presença inválido. Use membro, fa ou visitante'
+        member_id = attendance.get('member_id')
+        if member_id is not None and (isinstance(member_id, bool) or not isinstance(member_id, int)):
+            return 'Membro inválido na lista de presenças'
+    return None
+
+def member_ids(attendances):
+    """Ids dos membros cadastrados de uma lista de presenças já validada"""
+    return {attendance['member_id'] for attendance in attendances if attendance.get('member_id') is not None}
+
+def _row(report_id, attendance):
+    return {
+        'report_id': report_id,
+        'member_id': attendance.get('member_id'),
+        'visitor_name': attendance.get('visitor_name'),
+        'attendance_type': attendance.get('attendance_type')
+    }
+
+def _identity(member_id, visitor_name):
+    # Membros cadastrados são identificados pelo id; visitantes, pelo nome
+    return ('member', member_id) if member_id is not None else ('visitor', visitor_name)
+
+def insert_attendances(report_id, attendances):
+    """Grava as presenças de um relatório em um único INSERT em lote"""
+    return insert_attendances_many([(report_id, attendances)])
+
+def insert_attendances_many(reports):
+    """Grava as presenças de vários relatórios, dados como pares
+    (report_id, presenças), em um único INSERT em lote"""
+    rows = [_row(report_id, attendance) for report_id, attendances in reports for attendance in attendances]
+    if rows:
+        db.session.execute(insert(Attendance), rows)
+    return len(rows)
+
+def sync_attendances(report_id, attendances):
+    """Aplica a nova lista de presenças alterando apenas o que mudou.
+
+    Retorna um dicionário com o número de linhas inseridas, alteradas e
+    removidas.
+    """
+    stored = defaultdict(list)
+    rows = db.session.execute(
+        select(Attendance.id, Attendance.member_id, Attendance.visitor_name, Attendance.attendance_type)
+        .where(Attendance.report_id == report_id)
+        .order_by(Attendance.id)
+    ).all()
+    for row in rows:
+        stored[_identity(row.member_id, row.visitor_name)].append(row)
+
+    to_insert = []
+    to_update = []
+    for attendance in attendances:
+        row = _row(report_id, attendance)
+        matches = stored.get(_identity(row['member_id'], row['visitor_name']))
+        if not matches:
+            to_insert.append(row)
+            continue
+        existing = matches.pop(0)
+        if existing.attendance_type != row['attendance_type']:
+            to_update.append({'id': existing.id, 'attendance_type': row['attendance_type']})
+    to_delete = [row.id for matches in stored.values() for row in matches]
+
+    if to_delete:
+        db.session.execute(delete(Attendance).where(Attendance.id.in_(to_delete)))
+    if to_update:
+        db.session.execute(update(Attendance), to_update)
+    if to_insert:
+        db.session.execute(insert(Attendance), to_insert)
+
+    return {'inserted': len(to_insert), 'updated': len(to_update), 'deleted': len(to_delete)}
@@ -0,0 +1,121 @@
+"""
+Tokens de acesso assinados (Authorization: Bearer <token>).
+
+O login devolve, além do cookie de sessão, um token de curta duração
+(AUTH_TOKEN_TTL segundos) com o id do usuário, o perfil e a versão de escopo:
+a versão da tabela `users` em `table_versions`, que muda quando algum usuário
+é criado, alterado ou desativado. Com o token, check_auth() autoriza sem
+consultar o usuário no banco enquanto a versão do token não for antiga.
+
+A versão atual fica em cache no processo por AUTH_SCOPE_TTL segundos (uma
+consulta pequena por worker nesse intervalo) e é descartada na hora quando
+o próprio processo confirma a gravação de um usuário. Com a versão
+desatualizada, o usuário é relido do banco: se continua ativo, a requisição
+segue com o perfil atual e um token novo vai no cabeçalho X-Auth-Token da
+resposta.
+
+POST /api/auth/refresh troca um token (mesmo vencido há menos de
+AUTH_REFRESH_TTL segundos) por um novo, conferindo o usuário no banco.
+
+Cada token leva também a versão de tokens do usuário (users.token_version),
+incrementada no logout, na troca de senha e na desativação: a partir daí a
+renovação e a releitura do usuário recusam os tokens anteriores. Como a
+gravação muda a versão de escopo, os outros workers passam a reler o
+usuário em até AUTH_SCOPE_TTL segundos; até lá, um token revogado ainda
+dentro da validade continua aceito por eles (o worker que gravou recusa na
+hora).
+"""
+import os
+import time
+from collections import namedtuple
+from flask import current_app, g
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from sqlalchemy import event, select
+from src.models.models import db, User, TableVersion
+
+AUTH_TOKEN_TTL = int(os.environ.get('AUTH_TOKEN_TTL', 900))
+AUTH_REFRESH_TTL = int(os.environ.get('AUTH_REFRESH_TTL', 8 * 3600))
+AUTH_SCOPE_TTL = float(os.environ.get('AUTH_SCOPE_TTL', 10))
+
+# Usuário autorizado pelo token (as rotas usam apenas id e perfil)
+TokenUser = namedtuple('TokenUser', 'id role is_active', defaults=(True,))
+
+# (versão, validade) da versão de escopo atual
+_scope_version = None
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt='auth-token')
+
+def scope_version():
+    """Versão atual da tabela `users` (em cache por AUTH_SCOPE_TTL)"""
+    global _scope_version
+    now = time.monotonic()
+    if _scope_version is None or _scope_version[1] <= now:
+        version = db.session.scalar(select(TableVersion.version).where(TableVersion.table_name == User.__tablename__))
+        _scope_version = (version or 0, now + AUTH_SCOPE_TTL)
+    return _scope_version[0]
+
+def issue(user):
+    """Token novo para `user`; retorna (token, segundos de validade)"""
+    token = _serializer().dumps({'uid': user.id, 'role': user.role, 'sv': scope_version(),
+                                 'tv': user.token_version or 0})
+    return token, AUTH_TOKEN_TTL
+
+def _load(token, max_age):
+    try:
+        return _serializer().loads(token, max_age=max_age)
+    except (SignatureExpired, BadSignature):
+        return None
+
+def _active_user(claims):
+    """Usuário do token, se continua ativo e o token não foi revogado"""
+    user = db.session.get(User, claims['uid'])
+    if user and user.is_active and (user.token_version or 0) == claims.get('tv', 0):
+        return user
+    return None
+
+def authenticate(token):
+    """Usuário de um token válido, ou None; consulta o banco só com a versão desatualizada"""
+    claims = _load(token, AUTH_TOKEN_TTL)
+    if not claims:
+        return None
+    # Token emitido com uma versão mais nova que a do cache (por outro worker) também vale
+    if claims['sv'] >= scope_version():
+        return TokenUser(claims['uid'], claims['role'])
+
+    user = _active_user(claims)
+    if user:
+        g.refreshed_token = issue(user)[0]
+    return user
+
+def refresh(token):
+    """Usuário ativo de um token não revogado, vencido há menos de AUTH_REFRESH_TTL, ou None"""
+    claims = _load(token, AUTH_REFRESH_TTL)
+    return _active_user(claims) if claims else None
+
+def _after_request(response):
+    token = g.get('refreshed_token')
+    if token:
+        response.headers['X-Auth-Token'] = token
+    return response
+
+def _after_flush(session, flush_context):
+    if any(isinstance(obj, User) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['users_changed'] = True
+
+def _after_commit(session):
+    # A versão da tabela é incrementada depois do commit (src/services/table_versions.py)
+    global _scope_version
+    if not session.in_nested_transaction() and session.info.pop('users_changed', False):
+        _scope_version = None
+
+def _after_rollback(session):
+    if not session.in_nested_transaction():
+        session.info.pop('users_changed', None)
+
+event.listen(db.session, 'after_flush', _after_flush)
+event.listen(db.session, 'after_commit', _after_commit)
+event.listen(db.session, 'after_rollback', _after_rollback)
+
+def init_app(app):
+    app.after_request(_after_request)
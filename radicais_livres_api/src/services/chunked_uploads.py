@@ -0,0 +1,123 @@
+"""
+Upload de fotos em partes, retomável.
+
+O cliente abre o upload, envia as partes em sequência informando o offset
+de cada uma e finaliza. Cada parte é copiada do corpo da requisição direto
+para um arquivo parcial, em blocos, sem carregar o corpo inteiro em memória.
+O offset atual é o tamanho do arquivo parcial: se a conexão cair, o cliente
+consulta o offset e continua dali.
+
+O SHA-256 é calculado à medida que as partes chegam. Se uma parte cair em
+outro processo (outro worker do gunicorn), o hash incremental é descartado
+e recalculado a partir do arquivo na finalização.
+"""
+import fcntl
+import hashlib
+import os
+from datetime import datetime, timedelta
+from src.models.models import db, PhotoUpload
+
+PARTIAL_FOLDER = os.environ.get(
+    'PARTIAL_UPLOAD_FOLDER',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads', 'partial')
+)
+MAX_UPLOAD_SIZE = 25 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+BLOCK_SIZE = 64 * 1024
+# Uploads abandonados há mais tempo que isso são removidos por `flask purge-uploads`
+EXPIRATION = timedelta(hours=24)
+
+# upload_id -> (offset, hash incremental) deste processo
+_hashers = {}
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset):
+        super().__init__(f'Offset esperado: {offset}')
+        self.offset = offset
+
+class UploadBusy(Exception):
+    pass
+
+def partial_path(upload_id):
+    return os.path.join(PARTIAL_FOLDER, upload_id)
+
+def start(upload):
+    """Cria o arquivo parcial vazio de um upload novo"""
+    os.makedirs(PARTIAL_FOLDER, exist_ok=True)
+    open(partial_path(upload.id), 'wb').close()
+    _hashers[upload.id] = (0, hashlib.sha256())
+
+def current_offset(upload):
+    try:
+        return os.path.getsize(partial_path(upload.id))
+    except FileNotFoundError:
+        return None
+
+def append(upload, stream, offset, length):
+    """Grava `length` bytes de `stream` a partir de `offset` e retorna o novo offset"""
+    with open(partial_path(upload.id), 'ab') as partial:
+        # Um envio repetido da mesma parte não pode intercalar com o original
+        try:
+            fcntl.flock(partial, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadBusy()
+
+        current = partial.seek(0, os.SEEK_END)
+        if offset != current:
+            raise OffsetMismatch(current)
+        if current + length > upload.total_size:
+            raise ValueError('A parte ultrapassa o tamanho declarado do arquivo')
+
+        cached = _hashers.pop(upload.id, None)
+        hasher = cached[1] if cached and cached[0] == current else None
+
+        remaining = length
+        while remaining:
+            block = stream.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            partial.write(block)
+            if hasher:
+                hasher.update(block)
+            remaining -= len(block)
+        partial.flush()
+
+        new_offset = partial.tell()
+        if hasher:
+            _hashers[upload.id] = (new_offset, hasher)
+        return new_offset
+
+def checksum(upload):
+    """SHA-256 do arquivo completo (usa o hash incremental quando disponível)"""
+    cached = _hashers.get(upload.id)
+    if cached and cached[0] == upload.total_size:
+        return cached[1].hexdigest()
+
+    hasher = hashlib.sha256()
+    with open(partial_path(upload.id), 'rb') as partial:
+        for block in iter(lambda: partial.read(BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def complete(upload):
+    """Encerra o upload depois que o arquivo parcial foi levado ao destino"""
+    _hashers.pop(upload.id, None)
+    db.session.delete(upload)
+
+def discard(upload):
+    """Cancela o upload e apaga o arquivo parcial"""
+    _hashers.pop(upload.id, None)
+    try:
+        os.remove(partial_path(upload.id))
+    except FileNotFoundError:
+        pass
+    db.session.delete(upload)
+
+def purge_expired(now=None):
+    """Remove uploads abandonados; retorna quantos foram removidos"""
+    limit = (now or datetime.utcnow()) - EXPIRATION
+    expired = PhotoUpload.query.filter(PhotoUpload.created_at < limit).all()
+    for upload in expired:
+        discard(upload)
+    return len(expired)
@@ -0,0 +1,111 @@
+"""
+Compressão das respostas.
+
+Respostas JSON (e outros tipos de texto) acima de COMPRESS_MIN_SIZE bytes
+saem com gzip, ou brotli quando o pacote `brotli` está instalado e o
+cliente aceita. Respostas de arquivo (send_file) e em streaming não são
+tocadas: para os arquivos de src/static são servidos os irmãos `.br`/`.gz`
+gerados no build (`flask compress-static`), sem comprimir a cada requisição.
+
+Uma representação comprimida recebe ETag fraco, já que os bytes diferem do
+original; as comparações de If-None-Match usam comparação fraca.
+"""
+import gzip
+import mimetypes
+import os
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'text/javascript', 'text/html',
+    'text/css', 'text/plain', 'text/csv', 'image/svg+xml', 'application/manifest+json',
+}
+
+# Extensões dos irmãos pré-comprimidos, na ordem de preferência
+PRECOMPRESSED = [('br', '.br'), ('gzip', '.gz')]
+
+def available_encodings():
+    return ['br', 'gzip'] if brotli else ['gzip']
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+def compress_response(response):
+    """after_request: comprime respostas de texto grandes conforme o Accept-Encoding"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if response.content_length is not None and response.content_length < COMPRESS_MIN_SIZE:
+        return response
+
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if not encoding:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(_compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def precompressed_sibling(folder, path, mimetype):
+    """(codificação, caminho) do irmão pré-comprimido aceito pelo cliente, se existir"""
+    if mimetype not in COMPRESSIBLE_TYPES:
+        return None
+    for encoding, extension in PRECOMPRESSED:
+        if request.accept_encodings[encoding] and _exists(folder, path + extension):
+            return encoding, path + extension
+    return None
+
+# Os arquivos do build só mudam com um novo deploy (e um novo processo)
+MAX_CACHED_PATHS = 4096
+_exists_cache = {}
+
+def _exists(folder, path):
+    key = (folder, path)
+    if key not in _exists_cache:
+        if len(_exists_cache) >= MAX_CACHED_PATHS:
+            _exists_cache.clear()
+        _exists_cache[key] = os.path.isfile(os.path.join(folder, path))
+    return _exists_cache[key]
+
+def compress_folder(folder):
+    """Gera os irmãos `.gz` (e `.br`, se disponível) dos arquivos de texto de `folder`"""
+    written = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name.endswith(('.gz', '.br')):
+                continue
+            mimetype, _ = mimetypes.guess_type(name)
+            if mimetype not in COMPRESSIBLE_TYPES:
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as source:
+                data = source.read()
+            if len(data) < COMPRESS_MIN_SIZE:
+                continue
+            with open(path + '.gz', 'wb') as target:
+                target.write(gzip.compress(data, compresslevel=9, mtime=0))
+            written += 1
+            if brotli:
+                with open(path + '.br', 'wb') as target:
+                    target.write(brotli.compress(data, quality=11))
+                written += 1
+    return written
@@ -0,0 +1,259 @@
+"""
+Estatísticas materializadas do dashboard.
+
+A tabela `dashboard_stats` guarda uma linha por escopo (igreja, rede e
+célula). Um listener de `after_flush` aplica as variações de células,
+membros e relatórios na mesma transação da escrita, de modo que o dashboard
+lê contadores prontos em vez de rodar COUNTs a cada acesso.
+
+Semântica dos contadores (a mesma do cálculo antigo em get_dashboard_data):
+- cell: active_cells = 1 se a célula está ativa; active_members e
+  total_reports da célula, independentemente de ela estar ativa;
+- network: soma das células ativas da rede;
+- church: todas as células ativas, todos os membros ativos do tipo
+  'membro', todos os relatórios e as redes com ao menos uma célula ativa.
+
+Os totais da igreja ficam divididos em CHURCH_SHARDS linhas (scope_id é a
+faixa, pelo id da célula) e são somados na leitura: relatórios de células
+diferentes enviados ao mesmo tempo atualizam linhas diferentes em vez de
+esperarem todos pela mesma linha até o commit. As redes com célula ativa
+ficam apenas na faixa 0.
+
+As linhas são criadas pela migração v010; rebuild() só roda pelo comando
+`flask rebuild-dashboard-stats` (e pelos scripts de dados), nunca em uma
+requisição.
+"""
+from collections import Counter, defaultdict
+from sqlalchemy import event, func, inspect, select, update, insert, delete
+from src.models.models import db, DashboardStats, Network, Cell, Member, AttendanceReport
+
+CHURCH = ('church', 0)
+CHURCH_SHARDS = 16
+COUNTERS = ('active_cells', 'active_members', 'active_networks', 'total_reports')
+
+def _value(obj, attr, old):
+    history = inspect(obj).attrs[attr].history
+    if old and history.deleted:
+        return history.deleted[0]
+    return getattr(obj, attr)
+
+def _church(cell_id):
+    """Linha da igreja que recebe as variações da célula"""
+    return ('church', (cell_id or 0) % CHURCH_SHARDS)
+
+def _is_active(value):
+    # is_active recebe o default do banco (True) quando não informado
+    return value is not False
+
+def _member_weight(member, old):
+    if _is_active(_value(member, 'is_active', old)) and _value(member, 'member_type', old) == 'membro':
+        return 1
+    return 0
+
+def _changed(obj, attrs):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+def _insert_zero_rows(conn, keys):
+    if keys:
+        conn.execute(insert(DashboardStats), [
+            {'scope': scope, 'scope_id': scope_id, 'active_cells': 0, 'active_members': 0,
+             'active_networks': 0, 'total_reports': 0}
+            for scope, scope_id in keys
+        ])
+
+def _apply(conn, deltas):
+    for (scope, scope_id), delta in deltas.items():
+        values = {column: getattr(DashboardStats, column) + amount
+                  for column, amount in delta.items() if amount}
+        if values:
+            conn.execute(update(DashboardStats)
+                         .where(DashboardStats.scope == scope, DashboardStats.scope_id == scope_id)
+                         .values(**values))
+
+def _cell_rows(conn, cell_ids):
+    if not cell_ids:
+        return {}
+    rows = conn.execute(select(DashboardStats.scope_id, DashboardStats.active_members, DashboardStats.total_reports)
+                        .where(DashboardStats.scope == 'cell', DashboardStats.scope_id.in_(cell_ids))).all()
+    return {row.scope_id: row for row in rows}
+
+def _cells_state(conn, cell_ids):
+    if not cell_ids:
+        return {}
+    rows = conn.execute(select(Cell.id, Cell.network_id, Cell.is_active).where(Cell.id.in_(cell_ids))).all()
+    return {row.id: row for row in rows}
+
+def _refresh_active_networks(conn):
+    active_networks = select(func.count()).where(
+        DashboardStats.scope == 'network', DashboardStats.active_cells > 0
+    ).scalar_subquery()
+    conn.execute(update(DashboardStats)
+                 .where(DashboardStats.scope == CHURCH[0], DashboardStats.scope_id == CHURCH[1])
+                 .values(active_networks=active_networks))
+
+def _after_flush(session, flush_context):
+    new = [obj for obj in session.new if isinstance(obj, (Network, Cell, Member, AttendanceReport))]
+    dirty = [obj for obj in session.dirty if isinstance(obj, (Cell, Member, AttendanceReport))]
+    deleted = [obj for obj in session.deleted if isinstance(obj, (Cell, Member, AttendanceReport))]
+    if not (new or dirty or deleted):
+        return
+
+    conn = session.connection()
+    _insert_zero_rows(conn, [('network', obj.id) for obj in new if isinstance(obj, Network)] +
+                            [('cell', obj.id) for obj in new if isinstance(obj, Cell)])
+    deltas = defaultdict(Counter)
+
+    # 1. Células: retira a contribuição antiga e soma a nova
+    cell_changes = []
+    for obj in new:
+        if isinstance(obj, Cell):
+            cell_changes.append((obj, None))
+    for obj in dirty:
+        if isinstance(obj, Cell) and _changed(obj, ('is_active', 'network_id')):
+            cell_changes.append((obj, (_value(obj, 'network_id', True), _is_active(_value(obj, 'is_active', True)))))
+    for obj in deleted:
+        if isinstance(obj, Cell):
+            cell_changes.append((obj, (_value(obj, 'network_id', True), _is_active(_value(obj, 'is_active', True)))))
+
+    if cell_changes:
+        counts = _cell_rows(conn, [cell.id for cell, _ in cell_changes])
+        for cell, old in cell_changes:
+            row = counts.get(cell.id)
+            members = row.active_members if row else 0
+            reports = row.total_reports if row else 0
+            contributions = []
+            if old is not None:
+                contributions.append((-1, old))
+            if cell not in session.deleted:
+                contributions.append((1, (cell.network_id, _is_active(cell.is_active))))
+            for sign, (network_id, active) in contributions:
+                if not active:
+                    continue
+                deltas[('cell', cell.id)]['active_cells'] += sign
+                deltas[_church(cell.id)]['active_cells'] += sign
+                network = deltas[('network', network_id)]
+                network['active_cells'] += sign
+                network['active_members'] += sign * members
+                network['total_reports'] += sign * reports
+
+    # 2. Membros e relatórios: igreja, célula e rede (se a célula estiver ativa)
+    changes = []
+    for obj in new:
+        if isinstance(obj, Member):
+            changes.append((1, 'active_members', obj.cell_id, _member_weight(obj, False)))
+        elif isinstance(obj, AttendanceReport):
+            changes.append((1, 'total_reports', obj.cell_id, 1))
+    for obj in dirty:
+        if isinstance(obj, Member) and _changed(obj, ('cell_id', 'is_active', 'member_type')):
+            changes.append((-1, 'active_members', _value(obj, 'cell_id', True), _member_weight(obj, True)))
+            changes.append((1, 'active_members', obj.cell_id, _member_weight(obj, False)))
+        elif isinstance(obj, AttendanceReport) and _changed(obj, ('cell_id',)):
+            changes.append((-1, 'total_reports', _value(obj, 'cell_id', True), 1))
+            changes.append((1, 'total_reports', obj.cell_id, 1))
+    for obj in deleted:
+        if isinstance(obj, Member):
+            changes.append((-1, 'active_members', _value(obj, 'cell_id', True), _member_weight(obj, True)))
+        elif isinstance(obj, AttendanceReport):
+            changes.append((-1, 'total_reports', _value(obj, 'cell_id', True), 1))
+
+    cells = _cells_state(conn, {cell_id for _, _, cell_id, _ in changes if cell_id})
+    for sign, column, cell_id, weight in changes:
+        if not weight:
+            continue
+        deltas[_church(cell_id)][column] += sign * weight
+        cell = cells.get(cell_id)
+        if cell is None:
+            continue
+        deltas[('cell', cell.id)][column] += sign * weight
+        if _is_active(cell.is_active):
+            deltas[('network', cell.network_id)][column] += sign * weight
+
+    _apply(conn, deltas)
+    if cell_changes:
+        _refresh_active_networks(conn)
+
+event.listen(db.session, 'after_flush', _after_flush)
+
+def rebuild():
+    """Recalcula todas as estatísticas a partir das tabelas de origem"""
+    members_by_cell = dict(db.session.query(Member.cell_id, func.count(Member.id))
+                           .filter(Member.is_active == True, Member.member_type == 'membro', Member.cell_id.isnot(None))
+                           .group_by(Member.cell_id).all())
+    reports_by_cell = dict(db.session.query(AttendanceReport.cell_id, func.count(AttendanceReport.id))
+                           .group_by(AttendanceReport.cell_id).all())
+
+    rows = {}
+    def row(scope, scope_id):
+        return rows.setdefault((scope, scope_id), Counter())
+
+    church = row(*CHURCH)
+    for shard in range(1, CHURCH_SHARDS):
+        row('church', shard)
+    church['active_members'] = Member.query.filter_by(is_active=True, member_type='membro').count()
+    church['total_reports'] = AttendanceReport.query.count()
+    for (network_id,) in db.session.query(Network.id).all():
+        row('network', network_id)
+    for cell_id, network_id, is_active in db.session.query(Cell.id, Cell.network_id, Cell.is_active).all():
+        cell = row('cell', cell_id)
+        cell['active_members'] = members_by_cell.get(cell_id, 0)
+        cell['total_reports'] = reports_by_cell.get(cell_id, 0)
+        if is_active is not False:
+            cell['active_cells'] = 1
+            church['active_cells'] += 1
+            network = row('network', network_id)
+            network['active_cells'] += 1
+            network['active_members'] += cell['active_members']
+            network['total_reports'] += cell['total_reports']
+    church['active_networks'] = len([key for key, counters in rows.items()
+                                     if key[0] == 'network' and counters['active_cells'] > 0])
+
+    db.session.execute(delete(DashboardStats))
+    db.session.execute(insert(DashboardStats), [
+        dict({column: counters[column] for column in COUNTERS}, scope=scope, scope_id=scope_id)
+        for (scope, scope_id), counters in rows.items()
+    ])
+    db.session.commit()
+    return len(rows)
+
+def get_totals(user):
+    """Lê os totais do dashboard para o escopo do usuário em uma consulta"""
+    if user.role == 'pastor':
+        totals = db.session.query(
+            *[func.coalesce(func.sum(getattr(DashboardStats, column)), 0) for column in COUNTERS]
+        ).filter(DashboardStats.scope == CHURCH[0]).one()
+        stats = dict(zip(COUNTERS, totals))
+        return {
+            'total_cells': stats['active_cells'],
+            'total_members': stats['active_members'],
+            'total_networks': stats['active_networks'],
+            'total_reports': stats['total_reports']
+        }
+
+    if user.role == 'discipulador':
+        row = db.session.query(
+            func.count(DashboardStats.scope_id),
+            func.coalesce(func.sum(DashboardStats.active_cells), 0),
+            func.coalesce(func.sum(DashboardStats.active_members), 0),
+            func.coalesce(func.sum(DashboardStats.total_reports), 0)
+        ).join(Network, Network.id == DashboardStats.scope_id).filter(
+            DashboardStats.scope == 'network', Network.supervisor_id == user.id
+        ).one()
+        total_networks, total_cells, total_members, total_reports = row
+    else:
+        row = db.session.query(
+            func.count(DashboardStats.scope_id),
+            func.count(func.distinct(Cell.network_id)),
+            func.coalesce(func.sum(DashboardStats.active_members), 0),
+            func.coalesce(func.sum(DashboardStats.total_reports), 0)
+        ).join(Cell, Cell.id == DashboardStats.scope_id).filter(
+            DashboardStats.scope == 'cell', Cell.leader_id == user.id, Cell.is_active == True
+        ).one()
+        total_cells, total_networks, total_members, total_reports = row
+
+    return {
+        'total_cells': total_cells,
+        'total_members': total_members,
+        'total_networks': total_networks,
+        'total_reports': total_reports
+    }
@@ -0,0 +1,145 @@
+"""
+Configuração do engine do banco conforme o backend.
+
+SQLite:
+- WAL: leituras não bloqueiam a escrita e vice-versa;
+- synchronous=NORMAL (seguro com WAL), cache de SQLITE_CACHE_MB e
+  busy_timeout de SQLITE_BUSY_TIMEOUT_MS;
+- as transações que podem escrever (requisições POST, PUT, PATCH e DELETE,
+  comandos e tarefas em segundo plano) começam com BEGIN IMMEDIATE. Com a
+  transação adiada do driver, quem leu antes de escrever falha na hora com
+  "database is locked" quando outra escrita termina no meio; pegando o lock
+  de escrita no início, apenas espera a vez (até o busy_timeout). No WAL isso
+  não bloqueia as leituras, que seguem com BEGIN simples.
+
+Postgres:
+- pool dimensionado para o modelo do gunicorn: cada worker é um processo com
+  o seu pool e atende GUNICORN_THREADS requisições ao mesmo tempo (1 no worker
+  síncrono padrão), mais uma conexão para as tarefas em segundo plano. O total
+  no servidor fica em workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW), que deve
+  caber no max_connections;
+- pool_pre_ping descarta conexões derrubadas pelo servidor ou por um proxy e
+  pool_recycle renova as conexões antigas;
+- lock_timeout evita que uma requisição fique presa indefinidamente atrás de
+  um lock.
+
+As estatísticas do pool e das esperas por lock do processo ficam em stats().
+"""
+import os
+import sqlite3
+import threading
+import time
+from flask import has_request_context, request
+from sqlalchemy import event, text
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 15000))
+SQLITE_CACHE_MB = int(os.environ.get('SQLITE_CACHE_MB', 32))
+
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 1))
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', GUNICORN_THREADS + 1))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 2))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_LOCK_TIMEOUT_MS = int(os.environ.get('DB_LOCK_TIMEOUT_MS', 10000))
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_lock = threading.Lock()
+_counters = {
+    'lock_waits': 0,            # transações que precisaram esperar o lock de escrita
+    'lock_wait_seconds': 0.0,
+    'lock_wait_max_seconds': 0.0,
+    'lock_errors': 0,           # "database is locked", lock_timeout e deadlocks
+}
+# Esperas abaixo disso não contam como espera (custo normal do BEGIN)
+LOCK_WAIT_THRESHOLD = 0.005
+
+def backend(uri):
+    return 'sqlite' if uri.startswith('sqlite') else 'postgresql' if uri.startswith('postgres') else 'other'
+
+def engine_options(uri):
+    """SQLALCHEMY_ENGINE_OPTIONS para o banco de `uri`"""
+    if backend(uri) == 'sqlite':
+        return {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    if backend(uri) == 'postgresql':
+        return {
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': DB_MAX_OVERFLOW,
+            'pool_timeout': DB_POOL_TIMEOUT,
+            'pool_recycle': DB_POOL_RECYCLE,
+            'pool_pre_ping': True,
+            'connect_args': {'options': f'-c lock_timeout={DB_LOCK_TIMEOUT_MS}'},
+        }
+    return {}
+
+def _sqlite_connect(dbapi_connection, connection_record):
+    # Sem o BEGIN implícito do driver: a transação é aberta em _sqlite_begin
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.close()
+
+def _record_wait(seconds):
+    if seconds < LOCK_WAIT_THRESHOLD:
+        return
+    with _lock:
+        _counters['lock_waits'] += 1
+        _counters['lock_wait_seconds'] += seconds
+        _counters['lock_wait_max_seconds'] = max(_counters['lock_wait_max_seconds'], seconds)
+
+def _sqlite_begin(conn):
+    if has_request_context() and request.method in READ_METHODS:
+        conn.exec_driver_sql('BEGIN')
+    else:
+        started = time.perf_counter()
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+        _record_wait(time.perf_counter() - started)
+
+def _is_lock_error(exception):
+    if isinstance(exception, sqlite3.OperationalError):
+        return 'locked' in str(exception) or 'busy' in str(exception)
+    # lock_not_available (lock_timeout) e deadlock_detected
+    return getattr(exception, 'pgcode', None) in ('55P03', '40P01')
+
+def _handle_error(context):
+    if _is_lock_error(context.original_exception):
+        with _lock:
+            _counters['lock_errors'] += 1
+
+def install(engine):
+    """Registra os ajustes de conexão e a coleta de estatísticas no engine"""
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _sqlite_connect)
+        event.listen(engine, 'begin', _sqlite_begin)
+    event.listen(engine, 'handle_error', _handle_error)
+
+def process_stats(engine):
+    """Estado do pool e esperas por lock deste processo, sem consultar o banco"""
+    pool = engine.pool
+    result = {'backend': engine.dialect.name}
+    if hasattr(pool, 'checkedout'):
+        result['pool'] = {
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+        }
+    with _lock:
+        result['locks'] = dict(_counters)
+    return result
+
+def stats(engine):
+    """process_stats() e, no Postgres, as sessões esperando um lock no servidor"""
+    result = process_stats(engine)
+    if engine.dialect.name == 'postgresql':
+        # Sessões do banco esperando um lock agora (de todos os workers)
+        with engine.connect() as conn:
+            result['locks']['waiting_now'] = conn.execute(text(
+                "SELECT count(*) FROM pg_stat_activity "
+                "WHERE wait_event_type = 'Lock' AND datname = current_database()"
+            )).scalar()
+    return result
@@ -0,0 +1,154 @@
+"""
+Exportação em CSV e XLSX com memória constante.
+
+As linhas vêm de um cursor do lado do servidor (`yield_per`, que no
+Postgres usa um cursor nomeado) e passam por um gerador que devolve o
+arquivo em pedaços à medida que é escrito. O XLSX é montado em streaming
+com zipfile (planilha com strings inline), sem dependências extras e sem
+arquivo temporário.
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+from flask import Response, stream_with_context
+from src.models.models import db
+
+YIELD_PER = 1000
+# Linhas por pedaço enviado ao cliente
+FLUSH_EVERY = 500
+FORMATS = ('csv', 'xlsx')
+
+def stream_rows(statement):
+    """Executa `statement` com cursor do lado do servidor e gera as linhas"""
+    result = db.session.execute(statement.execution_options(yield_per=YIELD_PER))
+    try:
+        yield from result
+    finally:
+        result.close()
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+def csv_chunks(header, rows):
+    # BOM e ponto e vírgula: abre direto no Excel em português com acentos
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_text(value) for value in row])
+        if count % FLUSH_EVERY == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+class _ChunkSink(io.RawIOBase):
+    """Destino do zip que apenas acumula os bytes até o próximo pedaço"""
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+_XLSX_STATIC = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+def _workbook(sheet_name):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(sheet_name)}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+# Caracteres de controle não são válidos em XML
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _cell(value):
+    if isinstance(value, bool) or value is None:
+        value = '' if value is None else ('Sim' if value else 'Não')
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    text = _INVALID_XML.sub('', escape(_text(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+def _row(values):
+    return '<row>' + ''.join(_cell(value) for value in values) + '</row>'
+
+def xlsx_chunks(header, rows, sheet_name='Dados'):
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC.items():
+            archive.writestr(name, content)
+        archive.writestr('xl/workbook.xml', _workbook(sheet_name))
+        yield sink.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                        b'<sheetData>')
+            sheet.write(_row(header).encode('utf-8'))
+            for count, row in enumerate(rows, 1):
+                sheet.write(_row(row).encode('utf-8'))
+                if count % FLUSH_EVERY == 0:
+                    yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+def export_response(header, rows, export_format, basename, sheet_name='Dados'):
+    """Resposta em streaming com o arquivo `basename.<formato>`"""
+    if export_format == 'xlsx':
+        chunks = xlsx_chunks(header, rows, sheet_name)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        chunks = csv_chunks(header, rows)
+        mimetype = 'text/csv'
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{basename}.{export_format}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
@@ -0,0 +1,164 @@
+"""
+Detecção e junção de membros duplicados.
+
+Em vez de comparar todos os pares, os membros ativos são agrupados por chaves
+de bloqueio: telefone normalizado, email normalizado e a chave fonética do
+primeiro e do último nome. Só os pares dentro de um mesmo bloco são
+pontuados; blocos grandes demais (nomes muito comuns) são ordenados pela
+chave fonética do nome completo e cada membro é comparado apenas com os vizinhos mais próximos.
+
+A pontuação parte da semelhança entre as chaves fonéticas dos nomes (que já
+absorvem acentos, grafias alternativas e a maioria dos erros de digitação) e
+sobe quando telefone ou email coincidem. Os pares acima de MIN_SCORE ficam em `member_duplicates` como
+sugestões; os pares descartados pelo usuário são preservados entre as
+execuções e não voltam a ser sugeridos.
+"""
+from collections import defaultdict
+from sqlalchemy import select, delete, update, insert, or_
+from src.models.models import db, Member, Attendance, AttendanceReport, MemberRetention, MemberDuplicate
+from src.services.normalization import name_tokens, phonetic_key
+from src.services import retention
+
+MIN_SCORE = 0.9
+# Quanto um telefone ou email em comum aproxima o par de 1 (familiares
+# costumam dividir o telefone: o nome continua pesando mais)
+CONTACT_WEIGHTS = {0: 0.0, 1: 0.4, 2: 0.6}
+# Blocos maiores que isso são percorridos em janela deslizante
+MAX_BLOCK_SIZE = 50
+WINDOW = 8
+# Contador do relatório de cada tipo de presença
+REPORT_COUNTERS = {'membro': 'members_present', 'fa': 'fas_present', 'visitante': 'visitors_present'}
+
+def _candidate_pairs(blocks, names):
+    pairs = set()
+    for ids in blocks.values():
+        if len(ids) < 2:
+            continue
+        if len(ids) <= MAX_BLOCK_SIZE:
+            pairs.update((a, b) for index, a in enumerate(ids) for b in ids[index + 1:])
+        else:
+            ids = sorted(ids, key=names.__getitem__)
+            for index, a in enumerate(ids):
+                pairs.update((a, b) for b in ids[index + 1:index + 1 + WINDOW])
+    # Pares sempre como (menor id, maior id), como em member_duplicates
+    return {(min(a, b), max(a, b)) for a, b in pairs}
+
+def name_similarity(keys_a, keys_b):
+    """Semelhança (0 a 1) entre dois nomes dados pelos conjuntos de chaves
+    fonéticas: média entre o coeficiente de Dice e a sobreposição, para que
+    um nome do meio omitido ("Maria Santos" e "Maria Silva Santos") pese pouco"""
+    if keys_a == keys_b:
+        return 1.0
+    common = len(keys_a & keys_b)
+    if not common:
+        return 0.0
+    dice = 2 * common / (len(keys_a) + len(keys_b))
+    overlap = common / min(len(keys_a), len(keys_b))
+    return (dice + overlap) / 2
+
+def detect():
+    """Recalcula as sugestões de duplicados; retorna o número de pares sugeridos"""
+    rows = db.session.execute(
+        select(Member.id, Member.full_name, Member.phone_normalized, Member.email_normalized)
+        .where(Member.is_active == True).order_by(Member.id)
+    ).all()
+
+    names, phonetics, contacts, blocks = {}, {}, {}, defaultdict(list)
+    for member_id, full_name, phone, email in rows:
+        keys = [phonetic_key(token) for token in name_tokens(full_name)]
+        names[member_id] = ' '.join(keys)
+        phonetics[member_id] = frozenset(keys)
+        contacts[member_id] = (phone, email)
+        if phone:
+            blocks[('phone', phone)].append(member_id)
+        if email:
+            blocks[('email', email)].append(member_id)
+        if keys:
+            blocks[('name', keys[0], keys[-1])].append(member_id)
+
+    dismissed = set(db.session.execute(
+        select(MemberDuplicate.member_id, MemberDuplicate.duplicate_id).where(MemberDuplicate.dismissed == True)
+    ).all())
+
+    suggestions = []
+    for a, b in _candidate_pairs(blocks, names):
+        if (a, b) in dismissed:
+            continue
+        (phone_a, email_a), (phone_b, email_b) = contacts[a], contacts[b]
+        reasons = []
+        if phone_a and phone_a == phone_b:
+            reasons.append('phone')
+        if email_a and email_a == email_b:
+            reasons.append('email')
+        # Homônimos: mesmo nome, mas cada um com seu telefone e nenhum contato em comum
+        if not reasons and phone_a and phone_b:
+            continue
+
+        similarity = name_similarity(phonetics[a], phonetics[b])
+        weight = CONTACT_WEIGHTS[len(reasons)]
+        score = similarity + (1 - similarity) * weight
+        if score < MIN_SCORE:
+            continue
+        if similarity >= MIN_SCORE:
+            reasons.append('name')
+        suggestions.append({'member_id': a, 'duplicate_id': b, 'score': round(score, 4),
+                            'reasons': ','.join(reasons), 'dismissed': False})
+
+    db.session.execute(delete(MemberDuplicate).where(MemberDuplicate.dismissed == False))
+    if suggestions:
+        db.session.execute(insert(MemberDuplicate), suggestions)
+    return len(suggestions)
+
+def merge(keep, duplicate):
+    """Junta `duplicate` em `keep`: presenças, contatos faltantes e sugestões.
+
+    O duplicado fica inativo, com merged_into_id apontando para `keep`.
+    """
+    # Relatórios em que os dois aparecem ficam com uma presença só, e os
+    # totais desses relatórios perdem a presença removida
+    shared_reports = select(Attendance.report_id).where(Attendance.member_id == keep.id).scalar_subquery()
+    removed = db.session.execute(select(Attendance.report_id, Attendance.attendance_type).where(
+        Attendance.member_id == duplicate.id, Attendance.report_id.in_(shared_reports)
+    )).all()
+    if removed:
+        db.session.execute(delete(Attendance).where(
+            Attendance.member_id == duplicate.id, Attendance.report_id.in_([report_id for report_id, _ in removed])
+        ), execution_options={'synchronize_session': False})
+        _decrement_counts(removed)
+    moved = db.session.execute(
+        update(Attendance).where(Attendance.member_id == duplicate.id).values(member_id=keep.id),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+
+    if not keep.phone and duplicate.phone:
+        keep.phone = duplicate.phone
+    if not keep.email and duplicate.email:
+        keep.email = duplicate.email
+    if duplicate.created_at and (not keep.created_at or duplicate.created_at < keep.created_at):
+        keep.created_at = duplicate.created_at
+
+    db.session.execute(delete(MemberRetention).where(MemberRetention.member_id == duplicate.id))
+    db.session.execute(delete(MemberDuplicate).where(
+        or_(MemberDuplicate.member_id == duplicate.id, MemberDuplicate.duplicate_id == duplicate.id)
+    ))
+    cell_ids = {cell_id for cell_id in (keep.cell_id, duplicate.cell_id) if cell_id}
+    duplicate.is_active = False
+    duplicate.merged_into_id = keep.id
+    db.session.flush()
+
+    if cell_ids:
+        retention.rebuild(cell_ids)
+    return moved
+
+def _decrement_counts(removed):
+    """Desconta dos relatórios as presenças removidas, dadas como (report_id, tipo)"""
+    by_type = defaultdict(list)
+    for report_id, attendance_type in removed:
+        if attendance_type in REPORT_COUNTERS:
+            by_type[attendance_type].append(report_id)
+    for attendance_type, report_ids in by_type.items():
+        column = getattr(AttendanceReport, REPORT_COUNTERS[attendance_type])
+        db.session.execute(
+            update(AttendanceReport).where(AttendanceReport.id.in_(report_ids), column > 0).values({column: column - 1}),
+            execution_options={'synchronize_session': False}
+        )
@@ -0,0 +1,192 @@
+"""
+Importação de membros a partir de CSV.
+
+O arquivo é lido em streaming e validado de uma vez: as células citadas são
+carregadas em uma consulta e a permissão é verificada uma vez por célula.
+Cada linha é comparada com os membros existentes (no escopo do usuário) e
+com as linhas anteriores do próprio arquivo pelo telefone ou email
+normalizados. Os novos membros e as alterações vão para o banco no mesmo
+flush, que o SQLAlchemy agrupa em INSERTs e UPDATEs em lote.
+"""
+import csv
+import io
+from sqlalchemy import or_
+from src.models.models import db, Member, Cell
+from src.services.normalization import normalize_phone, normalize_email
+from src.services.scope import filter_by_scope, can_access_cell
+from src.services import retention
+
+MAX_ROWS = 5000
+MEMBER_TYPES = ('membro', 'fa', 'visitante')
+# Chunks dos filtros IN
+IN_BATCH = 500
+
+# Cabeçalhos aceitos para cada campo
+COLUMNS = {
+    'full_name': ('full_name', 'nome', 'nome completo'),
+    'phone': ('phone', 'telefone', 'celular'),
+    'email': ('email', 'e-mail'),
+    'member_type': ('member_type', 'tipo'),
+    'cell_id': ('cell_id', 'celula', 'célula', 'celula_id', 'célula_id'),
+}
+
+class InvalidFile(ValueError):
+    pass
+
+def read_rows(stream):
+    """Linhas (campo -> valor) de um CSV com ',' ou ';'; InvalidFile se ilegível"""
+    try:
+        return list(_read_rows(stream))
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise InvalidFile(str(e))
+
+def _read_rows(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    first_line = text.readline()
+    if not first_line.strip():
+        raise InvalidFile('Arquivo vazio')
+    delimiter = ';' if first_line.count(';') > first_line.count(',') else ','
+
+    header = next(csv.reader([first_line], delimiter=delimiter))
+    aliases = {alias: field for field, names in COLUMNS.items() for alias in names}
+    fields = [aliases.get(name.strip().lower()) for name in header]
+    if 'full_name' not in fields:
+        raise InvalidFile('Coluna de nome (full_name ou nome) não encontrada')
+
+    for count, values in enumerate(csv.reader(text, delimiter=delimiter), 1):
+        if count > MAX_ROWS:
+            raise InvalidFile(f'Limite de {MAX_ROWS} linhas por importação')
+        if not any(value.strip() for value in values):
+            continue
+        yield {field: value.strip() for field, value in zip(fields, values) if field}
+
+def _validate(row, default_cell_id):
+    errors = []
+    if not row.get('full_name'):
+        errors.append('Nome completo é obrigatório')
+
+    member_type = (row.get('member_type') or 'membro').lower()
+    if member_type not in MEMBER_TYPES:
+        errors.append('Tipo de membro inválido')
+
+    cell_id = row.get('cell_id') or default_cell_id
+    if cell_id:
+        try:
+            cell_id = int(cell_id)
+        except (TypeError, ValueError):
+            errors.append('Célula inválida')
+            cell_id = None
+
+    if row.get('email') and not normalize_email(row['email']):
+        errors.append('Email inválido')
+
+    return {
+        'full_name': row.get('full_name'),
+        'phone': row.get('phone') or '',
+        'email': row.get('email') or '',
+        'member_type': member_type,
+        'cell_id': cell_id or None,
+        'phone_key': normalize_phone(row.get('phone')),
+        'email_key': normalize_email(row.get('email')),
+    }, errors
+
+def _allowed_cells(user, cell_ids):
+    """Células ativas e no escopo do usuário, verificadas uma vez cada"""
+    if not cell_ids:
+        return set()
+    active = {cell_id for (cell_id,) in db.session.query(Cell.id).filter(
+        Cell.id.in_(cell_ids), Cell.is_active == True
+    )}
+    return {cell_id for cell_id in active if can_access_cell(user, cell_id)}
+
+def _existing_members(user, phones, emails):
+    """Membros ativos do escopo do usuário com algum dos telefones ou emails"""
+    by_phone, by_email = {}, {}
+    phones, emails = sorted(phones), sorted(emails)
+    for start in range(0, max(len(phones), len(emails)), IN_BATCH):
+        conditions = []
+        if phones[start:start + IN_BATCH]:
+            conditions.append(Member.phone_normalized.in_(phones[start:start + IN_BATCH]))
+        if emails[start:start + IN_BATCH]:
+            conditions.append(Member.email_normalized.in_(emails[start:start + IN_BATCH]))
+        query = filter_by_scope(Member.query.filter(Member.is_active == True, or_(*conditions)),
+                                Member.cell_id, user)
+        for member in query.order_by(Member.id):
+            if member.phone_normalized:
+                by_phone.setdefault(member.phone_normalized, member)
+            if member.email_normalized:
+                by_email.setdefault(member.email_normalized, member)
+    return by_phone, by_email
+
+def import_members(user, rows, default_cell_id=None, update_existing=True, dry_run=False):
+    """Valida e grava as linhas; retorna (resumo, relatório por linha)"""
+    parsed = [_validate(row, default_cell_id) for row in rows]
+
+    cell_ids = {data['cell_id'] for data, errors in parsed if data['cell_id'] and not errors}
+    allowed = _allowed_cells(user, cell_ids)
+    for data, errors in parsed:
+        if data['cell_id'] and not errors and data['cell_id'] not in allowed:
+            errors.append('Célula não encontrada ou sem permissão')
+
+    valid = [data for data, errors in parsed if not errors]
+    by_phone, by_email = _existing_members(
+        user, {data['phone_key'] for data in valid if data['phone_key']},
+        {data['email_key'] for data in valid if data['email_key']}
+    )
+
+    report = []
+    seen = {}  # chave normalizada -> linha em que apareceu primeiro
+    pending = []
+    moved, moved_cells = [], set()  # membros que mudaram de célula e as células envolvidas
+    for line, (data, errors) in enumerate(parsed, 1):
+        if errors:
+            report.append({'row': line, 'status': 'error', 'errors': errors})
+            continue
+
+        keys = [key for key in (('phone', data['phone_key']), ('email', data['email_key'])) if key[1]]
+        first = next((seen[key] for key in keys if key in seen), None)
+        if first:
+            report.append({'row': line, 'status': 'duplicate', 'duplicate_of_row': first})
+            continue
+        for key in keys:
+            seen[key] = line
+
+        member = by_phone.get(data['phone_key']) or by_email.get(data['email_key'])
+        if member and not update_existing:
+            report.append({'row': line, 'status': 'skipped', 'member_id': member.id})
+            continue
+
+        if member:
+            member.full_name = data['full_name']
+            member.member_type = data['member_type']
+            if data['cell_id'] and data['cell_id'] != member.cell_id:
+                moved.append(member)
+                moved_cells.update((member.cell_id, data['cell_id']))
+                member.cell_id = data['cell_id']
+            # Não apaga contato já cadastrado com um campo vazio
+            if data['phone']:
+                member.phone = data['phone']
+            if data['email']:
+                member.email = data['email']
+            status = 'updated'
+        else:
+            member = Member(full_name=data['full_name'], phone=data['phone'], email=data['email'],
+                            member_type=data['member_type'], cell_id=data['cell_id'])
+            db.session.add(member)
+            status = 'created'
+        entry = {'row': line, 'status': status}
+        report.append(entry)
+        pending.append((entry, member))
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.flush()
+        for entry, member in pending:
+            entry['member_id'] = member.id
+        if moved:
+            retention.refresh_members([member.id for member in moved], moved_cells)
+
+    summary = {status: sum(1 for entry in report if entry['status'] == status)
+               for status in ('created', 'updated', 'skipped', 'duplicate', 'error')}
+    return summary, report
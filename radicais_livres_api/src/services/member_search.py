@@ -0,0 +1,104 @@
+"""
+Busca de membros por nome, email e telefone (typeahead).
+
+A coluna `members.search_text` guarda o texto já normalizado (sem acentos,
+minúsculo, telefone só com dígitos) e é mantida pelos validadores do modelo.
+O índice depende do banco:
+- SQLite: tabela FTS5 `members_fts` com conteúdo externo, atualizada por
+  triggers em `members`; cada termo é buscado como prefixo e o resultado é
+  ordenado por bm25;
+- Postgres: índice GIN de trigramas (pg_trgm) sobre `search_text`; cada termo
+  é buscado com LIKE '%termo%' e o resultado é ordenado por similaridade.
+
+O índice é criado pela migração v005, que tem a sua própria cópia do DDL
+(e junto com a tabela, quando ela vem do create_all); uma mudança no índice
+precisa de uma migração nova.
+"""
+from sqlalchemy import event, case, func, text, table, column
+from src.models.models import db, Member
+from src.services.normalization import search_terms
+
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS members_fts USING fts5("
+    "search_text, content='members', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')",
+    "CREATE TRIGGER IF NOT EXISTS members_fts_insert AFTER INSERT ON members BEGIN "
+    "INSERT INTO members_fts(rowid, search_text) VALUES (new.id, new.search_text); END",
+    "CREATE TRIGGER IF NOT EXISTS members_fts_delete AFTER DELETE ON members BEGIN "
+    "INSERT INTO members_fts(members_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+    "CREATE TRIGGER IF NOT EXISTS members_fts_update AFTER UPDATE OF search_text ON members BEGIN "
+    "INSERT INTO members_fts(members_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+    "INSERT INTO members_fts(rowid, search_text) VALUES (new.id, new.search_text); END",
+)
+
+POSTGRES_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_members_search_trgm ON members USING gin (search_text gin_trgm_ops)",
+)
+
+def create_index(conn, rebuild=False):
+    """Cria o índice de busca do banco de `conn`; `rebuild` reindexa as linhas existentes"""
+    if conn.dialect.name == 'sqlite':
+        for statement in SQLITE_DDL:
+            conn.exec_driver_sql(statement)
+        if rebuild:
+            conn.exec_driver_sql("INSERT INTO members_fts(members_fts) VALUES ('rebuild')")
+    elif conn.dialect.name == 'postgresql':
+        for statement in POSTGRES_DDL:
+            conn.exec_driver_sql(statement)
+
+def _after_create(target, conn, **kw):
+    create_index(conn)
+
+def _before_drop(target, conn, **kw):
+    if conn.dialect.name == 'sqlite':
+        conn.exec_driver_sql('DROP TABLE IF EXISTS members_fts')
+
+event.listen(Member.__table__, 'after_create', _after_create)
+event.listen(Member.__table__, 'before_drop', _before_drop)
+
+# Acima desse número de resultados a busca não é ordenada por bm25
+RANK_MAX_MATCHES = 2000
+
+# Tabela FTS5 para as consultas (fora do metadata: o create_all não a conhece)
+members_fts = table('members_fts', column('rowid', db.Integer), column('rank'))
+
+def _fts_count(match):
+    return db.session.execute(
+        text('SELECT count(*) FROM members_fts WHERE members_fts MATCH :match'), {'match': match}
+    ).scalar()
+
+def _fts_query(terms):
+    # Cada termo entre aspas (sem operadores do FTS5) e como prefixo
+    return ' '.join('"%s"*' % term for term in terms)
+
+def search(query, text_query, limit, offset=0):
+    """Filtra `query` (sobre Member) pelos termos de `text_query`, ordenada por relevância"""
+    terms = search_terms(text_query)
+    if not terms:
+        return []
+
+    # Nomes que começam com o primeiro termo vêm antes (o texto começa pelo nome)
+    starts_with = case((Member.search_text.like(f'{terms[0]}%'), 0), else_=1)
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        match = _fts_query(terms)
+        query = query.join(members_fts, members_fts.c.rowid == Member.id).filter(
+            text('members_fts MATCH :match').bindparams(match=match)
+        )
+        # O bm25 é calculado para cada resultado: em buscas muito amplas (uma ou
+        # duas letras) a ordem alfabética responde bem mais rápido
+        if _fts_count(match) > RANK_MAX_MATCHES:
+            query = query.order_by(starts_with, Member.full_name, Member.id)
+        else:
+            query = query.order_by(starts_with, members_fts.c.rank, Member.id)
+    else:
+        for term in terms:
+            query = query.filter(Member.search_text.like(f'%{term}%'))
+        if dialect == 'postgresql':
+            query = query.order_by(starts_with, func.similarity(Member.search_text, ' '.join(terms)).desc(),
+                                   Member.id)
+        else:
+            query = query.order_by(starts_with, Member.full_name, Member.id)
+    return query.limit(limit).offset(offset).all()
@@ -0,0 +1,94 @@
+"""
+Normalização de nomes, telefones e emails para comparação.
+
+Usada para reconhecer a mesma pessoa escrita de formas diferentes: na
+importação de membros, na busca e na detecção de duplicados.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+_NON_DIGITS = re.compile(r'\D')
+_SPACES = re.compile(r'\s+')
+
+def strip_accents(text):
+    if text.isascii():
+        return text
+    return ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+
+def normalize_name(name):
+    """Minúsculas, sem acentos e com espaços simples"""
+    if not name:
+        return ''
+    return _SPACES.sub(' ', strip_accents(name).lower()).strip()
+
+def normalize_phone(phone):
+    """Apenas os dígitos de DDD + número, sem o código do país e o zero de longa distância"""
+    if not phone:
+        return None
+    digits = _NON_DIGITS.sub('', phone)
+    if len(digits) in (12, 13) and digits.startswith('55'):
+        digits = digits[2:]
+    digits = digits.lstrip('0')
+    return digits if len(digits) >= 8 else None
+
+def normalize_email(email):
+    if not email:
+        return None
+    email = email.strip().lower()
+    return email if '@' in email else None
+
+_WORDS = re.compile(r'[^\W_]+')
+
+def searchable_text(full_name, email, phone_normalized):
+    """Texto indexado na busca de membros: nome e email sem acentos e o telefone
+    com e sem DDD, para achar o número digitado de qualquer forma"""
+    parts = [normalize_name(full_name), normalize_name(email)]
+    if phone_normalized:
+        parts += [phone_normalized, phone_normalized[2:]]
+    return ' '.join(part for part in parts if part)
+
+def search_terms(query):
+    """Termos de uma busca digitada, normalizados como o texto indexado"""
+    digits = _NON_DIGITS.sub('', query or '')
+    # Telefone digitado com espaços, parênteses ou traço vira um termo só
+    if digits and re.fullmatch(r'[\d\s()+.-]+', query):
+        return [normalize_phone(digits) or digits.lstrip('0') or digits]
+    return _WORDS.findall(normalize_name(query))
+
+# Partículas ignoradas na comparação de nomes
+NAME_PARTICLES = frozenset(('da', 'das', 'de', 'do', 'dos', 'e'))
+
+def name_tokens(name):
+    return [token for token in _WORDS.findall(normalize_name(name)) if token not in NAME_PARTICLES]
+
+# Chave fonética simplificada para o português: grafias que soam igual
+# (Rafael/Raphael, Luiz/Luis, Thiago/Tiago, Souza/Sousa) dão a mesma chave
+_PHONETIC_RULES = tuple((re.compile(pattern), replacement) for pattern, replacement in (
+    (r'ph', 'f'),
+    (r'th', 't'),
+    (r'ch(?=r)', 'k'),
+    (r'[cs]h|x', 'x'),
+    (r'lh', 'l'),
+    (r'nh', 'n'),
+    (r'qu|ck|c(?=[aou])|k', 'k'),
+    (r'g(?=[ei])', 'j'),
+    (r'gu(?=[ei])', 'g'),
+    (r'c(?=[ei])|ss|z', 's'),
+    (r'c', 'k'),
+    (r'y', 'i'),
+    (r'w', 'v'),
+    (r'h', ''),
+    (r'm(?![aeiou])', 'n'),
+    (r'(?<=.)[aeiou]', ''),
+    (r'(.)\1+', r'\1'),
+))
+
+@lru_cache(maxsize=65536)
+def phonetic_key(token):
+    """Chave de um termo já normalizado (sem acentos: ç e c são lidos igual,
+    para que Gonçalves e Goncalves, muito comum, não se separem)"""
+    word = token
+    for pattern, replacement in _PHONETIC_RULES:
+        word = pattern.sub(replacement, word)
+    return word
@@ -0,0 +1,97 @@
+"""
+Paginação por cursor (keyset) das listagens.
+
+O cursor é opaco para o cliente: guarda os valores da chave de ordenação da
+última linha retornada, e a próxima página continua a partir dela com um
+`WHERE (a, b) < (x, y)` que usa o índice, sem OFFSET. As colunas da chave
+precisam ser NOT NULL e terminar no id: uma comparação com NULL não casa com
+nenhuma linha e a listagem pararia ali.
+"""
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import tuple_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+class Keyset:
+    def __init__(self, *columns, descending=False):
+        # columns: pares (coluna, conversor do valor serializado no cursor)
+        self.columns = [column for column, _ in columns]
+        self.parsers = [parser for _, parser in columns]
+        self.descending = descending
+
+    def values(self, row):
+        return [getattr(row, column.key) for column in self.columns]
+
+def parse_date(value):
+    return date.fromisoformat(value)
+
+def parse_datetime(value):
+    return datetime.fromisoformat(value)
+
+def encode_cursor(values):
+    payload = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, keyset):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(payload, list) or len(payload) != len(keyset.parsers):
+            raise ValueError('cursor inválido')
+        return [parser(value) for parser, value in zip(keyset.parsers, payload)]
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError('cursor inválido') from e
+
+def parse_page_args(args, keyset):
+    """Lê `limit` e `cursor` da query string. Lança ValueError se inválidos."""
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except (TypeError, ValueError) as e:
+        raise ValueError('limit inválido') from e
+    if limit < 1:
+        raise ValueError('limit inválido')
+    limit = min(limit, MAX_LIMIT)
+
+    cursor = args.get('cursor')
+    after = decode_cursor(cursor, keyset) if cursor else None
+    return limit, after
+
+def paginate(query, keyset, limit, after=None):
+    """Aplica a ordenação do keyset e retorna (linhas, next_cursor)"""
+    key = tuple_(*keyset.columns)
+    if after is not None:
+        query = query.filter(key < tuple_(*after) if keyset.descending else key > tuple_(*after))
+
+    if keyset.descending:
+        query = query.order_by(*[column.desc() for column in keyset.columns])
+    else:
+        query = query.order_by(*keyset.columns)
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(keyset.values(rows[-1]))
+    return rows, next_cursor
+
+# Resultados ordenados por relevância não têm chave estável para o keyset:
+# o cursor guarda o deslocamento (buscas raramente passam da primeira página)
+OFFSET_CURSOR = Keyset((None, int))
+
+def parse_offset_args(args):
+    """Lê `limit` e o cursor de deslocamento. Lança ValueError se inválidos."""
+    limit, after = parse_page_args(args, OFFSET_CURSOR)
+    offset = after[0] if after else 0
+    if offset < 0:
+        raise ValueError('cursor inválido')
+    return limit, offset
+
+def offset_cursor(rows, limit, offset):
+    """Corta a linha extra e retorna (linhas, next_cursor)"""
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor([offset + limit])
+    return rows, None
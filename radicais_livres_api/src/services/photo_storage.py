@@ -0,0 +1,180 @@
+"""
+Armazenamento das fotos endereçado pelo conteúdo.
+
+Cada conteúdo é gravado uma única vez como `<sha256>.<extensão>` e as fotos
+apontam para ele (photo_blobs), com contagem de referências. A mesma foto
+enviada por vários líderes ocupa espaço uma vez só, e como o nome de um
+arquivo nunca muda de conteúdo ele pode ficar em cache indefinidamente.
+
+Os arquivos só mudam depois do commit da transação que grava a foto (hooks
+da sessão), para que disco e banco não divirjam quando o commit falha:
+- no envio, o arquivo vai para o lugar definitivo depois do commit; se a
+  transação é desfeita, o temporário é apagado;
+- na exclusão da última referência, o arquivo e as variantes são apagados
+  depois do commit, e só se, conferindo em outra conexão, nenhum envio
+  simultâneo do mesmo conteúdo recriou o blob nesse meio tempo.
+"""
+import hashlib
+import os
+import shutil
+import uuid
+from flask import current_app
+from sqlalchemy import event, update, delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from src.models.models import db, Photo, PhotoBlob
+from src.services import photo_variants
+
+BLOCK_SIZE = 64 * 1024
+
+def blob_filename(sha256, extension):
+    return f'{sha256}.{extension}'
+
+def save_stream(stream, folder):
+    """Copia `stream` para um arquivo temporário em `folder`, calculando o hash.
+
+    Retorna (caminho temporário, sha256, tamanho).
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    temp_path = os.path.join(folder, f'.{uuid.uuid4().hex}.tmp')
+    with open(temp_path, 'wb') as target:
+        for block in iter(lambda: stream.read(BLOCK_SIZE), b''):
+            target.write(block)
+            hasher.update(block)
+            size += len(block)
+    return temp_path, hasher.hexdigest(), size
+
+def _add_reference(sha256):
+    result = db.session.execute(
+        update(PhotoBlob).where(PhotoBlob.sha256 == sha256).values(ref_count=PhotoBlob.ref_count + 1)
+    )
+    return result.rowcount > 0
+
+def store(source_path, sha256, extension, size, folder, discard_source=True):
+    """Registra uma referência ao conteúdo; o arquivo vai para o lugar definitivo no commit.
+
+    Retorna (nome do arquivo, True se o conteúdo já existia). Deve ser
+    chamado dentro da transação que grava a foto. Se ela for desfeita,
+    `source_path` é apagado (ou mantido, com discard_source=False).
+    """
+    if discard_source:
+        _on_rollback(lambda: _remove_paths(os.path.dirname(source_path), [os.path.basename(source_path)]))
+
+    existed = _add_reference(sha256)
+    if not existed:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(PhotoBlob).values(
+                    sha256=sha256, filename=blob_filename(sha256, extension), size=size, ref_count=1
+                ))
+        except IntegrityError:
+            # Outro envio do mesmo conteúdo criou o blob primeiro
+            existed = _add_reference(sha256)
+            if not existed:
+                raise
+
+    filename = db.session.query(PhotoBlob.filename).filter_by(sha256=sha256).scalar()
+    _on_commit(lambda: _place(source_path, os.path.join(folder, filename)))
+    return filename, existed
+
+def _place(source_path, target_path):
+    if os.path.exists(target_path):
+        os.remove(source_path)
+    else:
+        shutil.move(source_path, target_path)
+
+def attach(photo, sha256):
+    """Copia para a foto as variantes já geradas para o mesmo conteúdo"""
+    photo.blob_sha256 = sha256
+    existing = db.session.query(Photo.thumbnail_filename, Photo.webp_filename).filter(
+        Photo.blob_sha256 == sha256, Photo.thumbnail_filename.isnot(None)
+    ).first()
+    if existing:
+        photo.thumbnail_filename, photo.webp_filename = existing
+    return existing is not None
+
+def delete_photo(photo, folder):
+    """Exclui a foto; o arquivo é apagado (depois do commit) junto com a última referência"""
+    filenames = [photo.filename]
+    variants = photo_variants.filenames(photo)
+    db.session.delete(photo)
+    if not photo.blob_sha256:
+        # Foto antiga, com arquivo próprio
+        _on_commit(lambda: _remove_files(folder, filenames, variants))
+        return True
+
+    # A foto sai antes do blob por causa da chave estrangeira
+    db.session.flush()
+    sha256 = photo.blob_sha256
+    db.session.execute(
+        update(PhotoBlob).where(PhotoBlob.sha256 == sha256).values(ref_count=PhotoBlob.ref_count - 1)
+    )
+    removed = db.session.execute(
+        delete(PhotoBlob).where(PhotoBlob.sha256 == sha256, PhotoBlob.ref_count <= 0)
+    ).rowcount
+    if removed:
+        _on_commit(lambda: _remove_unreferenced(sha256, folder, filenames, variants))
+    return bool(removed)
+
+def _remove_unreferenced(sha256, folder, filenames, variants):
+    with db.engine.connect() as conn:
+        if conn.scalar(select(PhotoBlob.sha256).where(PhotoBlob.sha256 == sha256)) is not None:
+            return
+    _remove_files(folder, filenames, variants)
+
+def _remove_files(folder, filenames, variants):
+    _remove_paths(folder, filenames)
+    photo_variants.remove(variants, folder)
+
+def _remove_paths(folder, filenames):
+    for filename in filenames:
+        path = os.path.join(folder, filename)
+        if os.path.exists(path):
+            os.remove(path)
+
+def migrate_legacy(photo, folder):
+    """Passa uma foto antiga (nome aleatório) para o armazenamento por conteúdo"""
+    source_path = os.path.join(folder, photo.filename)
+    with open(source_path, 'rb') as source:
+        hasher = hashlib.sha256()
+        for block in iter(lambda: source.read(BLOCK_SIZE), b''):
+            hasher.update(block)
+    sha256 = hasher.hexdigest()
+
+    # As variantes antigas têm o nome do arquivo antigo
+    variants = photo_variants.filenames(photo)
+    _on_commit(lambda: photo_variants.remove(variants, folder))
+    photo.thumbnail_filename = photo.webp_filename = None
+
+    extension = photo.filename.rsplit('.', 1)[1].lower()
+    photo.filename, _ = store(source_path, sha256, extension, os.path.getsize(source_path), folder,
+                              discard_source=False)
+    return attach(photo, sha256)
+
+def _on_commit(action):
+    db.session.info.setdefault('photo_files_commit', []).append(action)
+
+def _on_rollback(action):
+    db.session.info.setdefault('photo_files_rollback', []).append(action)
+
+def _run(actions):
+    for action in actions:
+        try:
+            action()
+        except OSError:
+            current_app.logger.exception('Falha ao mover ou apagar arquivo de foto')
+
+def _after_commit(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('photo_files_rollback', None)
+    _run(session.info.pop('photo_files_commit', ()))
+
+def _after_rollback(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('photo_files_commit', None)
+    _run(session.info.pop('photo_files_rollback', ()))
+
+event.listen(db.session, 'after_commit', _after_commit)
+event.listen(db.session, 'after_rollback', _after_rollback)
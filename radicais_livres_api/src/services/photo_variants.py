@@ -0,0 +1,127 @@
+"""
+Variantes das fotos para a galeria.
+
+Depois do upload, a geração da miniatura e da versão WebP para a web é
+enviada a um pool de processos (o redimensionamento usa CPU e não deve
+prender o worker da requisição). Quando as variantes ficam prontas, os
+nomes dos arquivos são gravados na linha da foto; até lá a galeria usa o
+arquivo original.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from PIL import Image, ImageOps
+from sqlalchemy import update
+from src.models.models import db, Photo
+
+# Nome da variante: (coluna em Photo, maior lado em pixels, qualidade WebP)
+VARIANTS = {
+    'thumb': ('thumbnail_filename', 320, 75),
+    'web': ('webp_filename', 1600, 80),
+}
+
+# Processos do pool por worker da aplicação
+PHOTO_WORKERS = int(os.environ.get('PHOTO_WORKERS', 2))
+
+_executor = None
+
+# Variantes já vistas no disco por este processo
+MAX_CACHED_VARIANTS = 10000
+_existing = set()
+
+def variant_filename(filename, size):
+    return f"{filename.rsplit('.', 1)[0]}_{size}.webp"
+
+def generate(folder, filename):
+    """Gera as variantes de `folder/filename` e retorna {coluna: arquivo}.
+
+    Roda nos processos do pool: usa apenas o Pillow e o sistema de arquivos.
+    """
+    generated = {}
+    with Image.open(os.path.join(folder, filename)) as image:
+        # Para JPEG, decodifica já reduzido (bem mais rápido em fotos de câmera)
+        largest = max(max_side for _, max_side, _ in VARIANTS.values())
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        # Da maior para a menor, reaproveitando a imagem já reduzida
+        for size, (column, max_side, quality) in sorted(VARIANTS.items(), key=lambda item: -item[1][1]):
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            target = variant_filename(filename, size)
+            partial = os.path.join(folder, f'.{target}.tmp')
+            image.save(partial, 'WEBP', quality=quality, method=4)
+            os.replace(partial, os.path.join(folder, target))
+            generated[column] = target
+    return generated
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PHOTO_WORKERS)
+    return _executor
+
+def _store(app, filename, future):
+    with app.app_context():
+        try:
+            generated = future.result()
+        except Exception:
+            app.logger.exception('Falha ao gerar variantes de %s', filename)
+            return
+        try:
+            # Todas as fotos com o mesmo arquivo compartilham as variantes
+            db.session.execute(update(Photo).where(Photo.filename == filename).values(**generated))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Falha ao gravar variantes de %s', filename)
+
+def enqueue(photo, folder):
+    """Agenda a geração das variantes de uma foto já gravada no banco.
+
+    A foto já foi confirmada: uma falha ao agendar (pool quebrado, por
+    exemplo) é só registrada e retorna None, e as variantes podem ser geradas
+    depois com `flask generate-photo-variants`.
+    """
+    global _executor
+    app = current_app._get_current_object()
+    filename = photo.filename
+    try:
+        future = _get_executor().submit(generate, folder, filename)
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            # O próximo envio cria um pool novo
+            _executor = None
+        app.logger.exception('Falha ao agendar variantes de %s', filename)
+        return None
+    future.add_done_callback(lambda done: _store(app, filename, done))
+    return future
+
+def filenames(photo):
+    """Arquivos das variantes já geradas da foto"""
+    return [getattr(photo, column) for column, _, _ in VARIANTS.values() if getattr(photo, column)]
+
+def remove(variant_filenames, folder):
+    """Remove arquivos de variantes (ver filenames)"""
+    for filename in variant_filenames:
+        _existing.discard(filename)
+        path = os.path.join(folder, filename)
+        if os.path.exists(path):
+            os.remove(path)
+
+def resolve(filename, size, folder):
+    """Arquivo a servir para `filename` no tamanho pedido (original se a variante não existe)"""
+    if size not in VARIANTS:
+        return filename
+    variant = variant_filename(filename, size)
+    if variant in _existing:
+        return variant
+    if not os.path.isfile(os.path.join(folder, variant)):
+        return filename
+    # Uma variante gerada não muda mais: só as existentes ficam em cache
+    if len(_existing) >= MAX_CACHED_VARIANTS:
+        _existing.clear()
+    _existing.add(variant)
+    return variant
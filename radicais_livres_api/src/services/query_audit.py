@@ -0,0 +1,151 @@
+"""
+Detector de N+1 e de consultas lentas, para desenvolvimento e testes.
+
+Desligado por padrão; SQL_AUDIT=log liga o registro e SQL_AUDIT=strict (para
+os testes) também faz a requisição falhar quando passa do orçamento de
+consultas da rota.
+
+Durante a requisição os comandos SQL são agrupados pelo texto: o mesmo
+comando repetido com parâmetros diferentes é o sinal de um relacionamento
+lazy percorrido linha a linha. Ao fim da requisição vão para o log do app:
+- comandos repetidos SQL_REPEAT_THRESHOLD vezes ou mais (N+1 provável);
+- comandos acima de SQL_SLOW_MS milissegundos.
+Cada um com o ponto do código (src/) que o disparou.
+
+O orçamento é SQL_QUERY_BUDGET comandos por requisição, ou o valor de
+@query_budget(n) na rota, a única fonte dos orçamentos: os testes (que rodam
+com SQL_AUDIT=strict) e benchmarks/endpoints.py usam o mesmo valor. No modo
+strict a resposta é trocada por um 500 com o relatório dos comandos.
+"""
+import os
+import re
+import sys
+import time
+from contextvars import ContextVar
+from flask import request, current_app, jsonify
+from sqlalchemy import event
+from src.services import database
+
+SQL_AUDIT = os.environ.get('SQL_AUDIT', '').lower()
+SQL_REPEAT_THRESHOLD = int(os.environ.get('SQL_REPEAT_THRESHOLD', 3))
+SQL_SLOW_MS = float(os.environ.get('SQL_SLOW_MS', 100))
+SQL_QUERY_BUDGET = int(os.environ.get('SQL_QUERY_BUDGET', 30))
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_DIR = os.path.dirname(SRC_DIR)
+# Módulos que executam SQL em nome de quem chamou (hooks do engine)
+_INFRASTRUCTURE = {__file__, database.__file__}
+
+# Texto do comando -> [execuções, segundos, maior duração, origem]
+_current = ContextVar('query_audit', default=None)
+
+def enabled():
+    return SQL_AUDIT in ('log', 'strict')
+
+def query_budget(statements):
+    """Orçamento de comandos SQL por requisição da rota (no lugar de SQL_QUERY_BUDGET)"""
+    def decorator(view):
+        # Os decoradores com functools.wraps copiam o atributo para o wrapper
+        view.query_budget = statements
+        return view
+    return decorator
+
+def _origin():
+    """Primeiro quadro da pilha dentro de src/, fora dos hooks do engine"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(SRC_DIR) and filename not in _INFRASTRUCTURE:
+            return f'{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno} em {frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'desconhecida'
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info['audit_started'] = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    statements = _current.get()
+    started = conn.info.pop('audit_started', None)
+    if statements is None or started is None:
+        return
+    duration = time.perf_counter() - started
+    entry = statements.get(statement)
+    if entry is None:
+        statements[statement] = [1, duration, duration, _origin()]
+    else:
+        entry[0] += 1
+        entry[1] += duration
+        entry[2] = max(entry[2], duration)
+
+def _before_request():
+    request._audit_token = _current.set({})
+
+def _teardown_request(exc):
+    token = getattr(request, '_audit_token', None)
+    if token is not None:
+        _current.reset(token)
+
+def _short(statement, size=160):
+    statement = re.sub(r'\s+', ' ', statement).strip()
+    return statement if len(statement) <= size else statement[:size] + '...'
+
+def report(statements):
+    """Comandos repetidos e lentos de uma requisição, dos mais caros aos mais baratos"""
+    result = []
+    for statement, (count, seconds, slowest, origin) in statements.items():
+        repeated = count >= SQL_REPEAT_THRESHOLD
+        slow = slowest * 1000 >= SQL_SLOW_MS
+        if repeated or slow:
+            result.append({
+                'statement': _short(statement), 'count': count, 'origin': origin,
+                'total_ms': round(seconds * 1000, 2), 'max_ms': round(slowest * 1000, 2),
+                'repeated': repeated, 'slow': slow,
+            })
+    result.sort(key=lambda item: item['total_ms'], reverse=True)
+    return result
+
+def _budget():
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, 'query_budget', SQL_QUERY_BUDGET)
+
+def route_budget(app, method, path):
+    """Orçamento da rota que atende `method path` (usado pelos testes e pelo benchmark)"""
+    endpoint, _ = app.url_map.bind('localhost').match(path.split('?')[0], method=method)
+    return getattr(app.view_functions[endpoint], 'query_budget', SQL_QUERY_BUDGET)
+
+def _after_request(response):
+    statements = _current.get()
+    if statements is None:
+        return response
+    total = sum(entry[0] for entry in statements.values())
+    where = f'{request.method} {request.path}'
+    problems = report(statements)
+    for item in problems:
+        kind = 'N+1 provável' if item['repeated'] else 'Consulta lenta'
+        current_app.logger.warning('%s em %s: %dx, %.1f ms (máx. %.1f ms) em %s: %s', kind, where,
+                                   item['count'], item['total_ms'], item['max_ms'], item['origin'],
+                                   item['statement'])
+
+    budget = _budget()
+    if total <= budget:
+        return response
+    message = f'Orçamento de consultas excedido em {where}: {total} comandos SQL (máximo {budget})'
+    current_app.logger.warning(message)
+    if SQL_AUDIT != 'strict':
+        return response
+    failure = jsonify({'error': message, 'statements': problems})
+    failure.status_code = 500
+    return failure
+
+def install(engine):
+    """Acompanha os comandos de `engine` nas requisições (só com SQL_AUDIT ligado)"""
+    if enabled():
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+def init_app(app):
+    if enabled():
+        app.before_request(_before_request)
+        app.after_request(_after_request)
+        app.teardown_request(_teardown_request)
@@ -0,0 +1,198 @@
+"""
+Frequência e retenção dos membros.
+
+Para cada membro ativo guarda a última presença, a sequência atual de
+reuniões seguidas e um histórico em bits das últimas HISTORY_MEETINGS
+reuniões da sua célula (bit 0 = reunião mais recente). A taxa de presença
+em N reuniões e o sinal de "em risco" saem desse histórico na leitura.
+
+A reconstrução monta a matriz membro × reunião de uma vez com NumPy. Um
+relatório novo (o mais recente da célula) apenas desloca o histórico dos
+membros da célula com dois UPDATEs; relatórios retroativos, editados ou
+excluídos reconstroem só a célula afetada, assim como membros que mudam de
+célula (a antiga e a nova) ou são desativados.
+"""
+from datetime import datetime, date, timedelta
+import numpy as np
+from sqlalchemy import select, insert, update, delete, case, func
+from src.models.models import db, Member, AttendanceReport, Attendance, MemberRetention
+from src.services.analytics import epoch_days
+
+HISTORY_MEETINGS = 52
+HISTORY_MASK = (1 << HISTORY_MEETINGS) - 1
+DEFAULT_WEEKS = 12
+DEFAULT_ABSENCES = 3
+
+EPOCH = date(1970, 1, 1)
+# Datas viram dias desde EPOCH; chaves (célula, dia) usam este intervalo
+DAY_RANGE = 1 << 20
+
+def rebuild(cell_ids=None):
+    """Recalcula a retenção dos membros ativos das células (ou de todas)"""
+    joined_day = func.coalesce(epoch_days(func.date(Member.created_at)), 0)
+    members_query = select(Member.id, Member.cell_id, joined_day).where(Member.is_active == True, Member.cell_id.isnot(None))
+    reports_query = select(AttendanceReport.id, AttendanceReport.cell_id, epoch_days(AttendanceReport.meeting_date))
+    attendances_query = select(Attendance.member_id, Attendance.report_id).join(
+        AttendanceReport, AttendanceReport.id == Attendance.report_id
+    ).where(Attendance.member_id.isnot(None))
+    if cell_ids is not None:
+        cell_ids = list(cell_ids)
+        members_query = members_query.where(Member.cell_id.in_(cell_ids))
+        reports_query = reports_query.where(AttendanceReport.cell_id.in_(cell_ids))
+        attendances_query = attendances_query.where(AttendanceReport.cell_id.in_(cell_ids))
+
+    members = np.array([tuple(row) for row in db.session.execute(members_query)], dtype=np.int64).reshape(-1, 3)
+    reports = np.array([tuple(row) for row in db.session.execute(reports_query)], dtype=np.int64).reshape(-1, 3)
+    attendances = np.array([tuple(row) for row in db.session.execute(attendances_query)], dtype=np.int64).reshape(-1, 2)
+
+    if cell_ids is None:
+        db.session.execute(delete(MemberRetention))
+    else:
+        stale = select(Member.id).where(Member.cell_id.in_(cell_ids))
+        db.session.execute(delete(MemberRetention).where(MemberRetention.member_id.in_(stale)))
+    if not len(members):
+        return 0
+
+    # Posição de cada relatório na sua célula, da reunião mais recente (0) para a mais antiga
+    report_ids, report_cells = reports[:, 0], reports[:, 1]
+    report_days = np.clip(reports[:, 2], 0, DAY_RANGE - 1)
+    order = np.lexsort((-report_ids, -report_days, report_cells))
+    report_ids, report_cells, report_days = report_ids[order], report_cells[order], report_days[order]
+    cells, group_start, meetings_per_cell = np.unique(report_cells, return_index=True, return_counts=True)
+    positions = np.arange(len(report_ids)) - np.repeat(group_start, meetings_per_cell)
+
+    members = members[np.argsort(members[:, 0])]
+    member_ids, member_cells = members[:, 0], members[:, 1]
+    joined_days = np.clip(members[:, 2], 0, DAY_RANGE - 1)
+
+    history = np.zeros(len(member_ids), dtype=np.uint64)
+    last_day = np.full(len(member_ids), -1, dtype=np.int64)
+    streak = np.zeros(len(member_ids), dtype=np.int64)
+
+    if len(attendances) and len(report_ids):
+        by_id = np.argsort(report_ids)
+        report_index = by_id[np.searchsorted(report_ids, attendances[:, 1], sorter=by_id)]
+        member_index = np.searchsorted(member_ids, attendances[:, 0])
+        member_index = np.minimum(member_index, len(member_ids) - 1)
+
+        # Apenas presenças de membros ativos em relatórios da própria célula
+        valid = (member_ids[member_index] == attendances[:, 0]) & \
+                (member_cells[member_index] == report_cells[report_index])
+        member_index, report_index = member_index[valid], report_index[valid]
+
+        # Uma presença por (membro, reunião), ordenada por membro e posição
+        _, first_seen = np.unique(member_index * len(report_ids) + positions[report_index], return_index=True)
+        member_index, report_index = member_index[first_seen], report_index[first_seen]
+        pos = positions[report_index]
+
+        recent = pos < HISTORY_MEETINGS
+        np.bitwise_or.at(history, member_index[recent], np.left_shift(np.uint64(1), pos[recent].astype(np.uint64)))
+        np.maximum.at(last_day, member_index, report_days[report_index])
+        # Presenças anteriores ao cadastro contam como entrada na célula
+        np.minimum.at(joined_days, member_index, report_days[report_index])
+
+        # Sequência atual: posições 0, 1, 2... presentes sem interrupção
+        rank = np.arange(len(member_index)) - np.searchsorted(member_index, member_index)
+        streak = np.bincount(member_index[pos == rank], minlength=len(member_ids))
+
+    # Reuniões acompanhadas: as da célula desde a entrada do membro
+    tracked = np.zeros(len(member_ids), dtype=np.int64)
+    if len(cells):
+        report_keys = report_cells * DAY_RANGE + (DAY_RANGE - 1 - report_days)
+        member_keys = member_cells * DAY_RANGE + (DAY_RANGE - 1 - joined_days)
+        cell_index = np.minimum(np.searchsorted(cells, member_cells), len(cells) - 1)
+        has_reports = cells[cell_index] == member_cells
+        since_joined = np.searchsorted(report_keys, member_keys, side='right') - group_start[cell_index]
+        tracked[has_reports] = np.minimum(since_joined[has_reports], HISTORY_MEETINGS)
+
+    # Membros sem reuniões desde a entrada ficam sem linha, como no incremental
+    keep = tracked > 0
+    member_ids, last_day, streak, history, tracked = \
+        member_ids[keep], last_day[keep], streak[keep], history[keep], tracked[keep]
+
+    now = datetime.utcnow()
+    rows = [{
+        'member_id': member_id,
+        'last_attended': EPOCH + timedelta(days=day) if day >= 0 else None,
+        'current_streak': member_streak,
+        'history': member_history,
+        'meetings_tracked': member_tracked,
+        'updated_at': now
+    } for member_id, day, member_streak, member_history, member_tracked in zip(
+        member_ids.tolist(), last_day.tolist(), streak.tolist(), history.tolist(), tracked.tolist()
+    )]
+    if rows:
+        db.session.execute(insert(MemberRetention), rows)
+    return len(rows)
+
+def refresh_members(member_ids, cell_ids):
+    """Recalcula a retenção de membros que mudaram de célula ou foram desativados.
+
+    `cell_ids` são as células antigas e novas; quem ficou sem célula ou
+    inativo fica sem linha, como na reconstrução.
+    """
+    db.session.flush()
+    db.session.execute(delete(MemberRetention).where(MemberRetention.member_id.in_(list(member_ids))))
+    cell_ids = {cell_id for cell_id in cell_ids if cell_id}
+    if cell_ids:
+        rebuild(cell_ids)
+
+def record_report(report, member_ids):
+    """Atualiza a retenção após gravar um relatório com as presenças de `member_ids`.
+
+    Se for a reunião mais recente da célula, desloca o histórico dos membros
+    da célula (membros sem linha entram a partir desta reunião); caso
+    contrário (relatório retroativo) reconstrói a célula.
+    """
+    newer = db.session.query(AttendanceReport.id).filter(
+        AttendanceReport.cell_id == report.cell_id,
+        AttendanceReport.id != report.id,
+        AttendanceReport.meeting_date >= report.meeting_date
+    ).first()
+    if newer:
+        return rebuild([report.cell_id])
+
+    cell_members = select(Member.id).where(Member.cell_id == report.cell_id, Member.is_active == True)
+
+    present = set(member_ids) if member_ids else {-1}
+
+    # Membros da célula sem linha de retenção, cadastrados até a reunião ou presentes nela
+    missing = cell_members.where(
+        Member.id.notin_(select(MemberRetention.member_id)),
+        Member.created_at.is_(None) | (func.date(Member.created_at) <= report.meeting_date) | Member.id.in_(present)
+    )
+    db.session.execute(insert(MemberRetention).from_select(['member_id'], missing))
+
+    attended = MemberRetention.member_id.in_(present)
+    db.session.execute(update(MemberRetention).where(MemberRetention.member_id.in_(cell_members)).values(
+        history=((MemberRetention.history * 2) + case((attended, 1), else_=0)).op('&')(HISTORY_MASK),
+        current_streak=case((attended, MemberRetention.current_streak + 1), else_=0),
+        last_attended=case((attended, report.meeting_date), else_=MemberRetention.last_attended),
+        meetings_tracked=case((MemberRetention.meetings_tracked < HISTORY_MEETINGS, MemberRetention.meetings_tracked + 1),
+                              else_=HISTORY_MEETINGS),
+        updated_at=datetime.utcnow()
+    ).execution_options(synchronize_session=False))
+
+def attendance_rate(history, meetings_tracked, weeks):
+    """Fração das últimas `weeks` reuniões em que o membro esteve presente"""
+    meetings = min(weeks, meetings_tracked)
+    if not meetings:
+        return None
+    return round((history & ((1 << meetings) - 1)).bit_count() / meetings, 2)
+
+def is_at_risk(history, meetings_tracked, absences):
+    """Faltou às últimas `absences` reuniões da célula"""
+    return meetings_tracked >= absences and not history & ((1 << absences) - 1)
+
+def at_risk_condition(absences):
+    return (MemberRetention.meetings_tracked >= absences) & \
+           (MemberRetention.history.op('&')((1 << absences) - 1) == 0)
+
+def describe(retention, weeks, absences):
+    return {
+        'last_attended': retention.last_attended.isoformat() if retention.last_attended else None,
+        'current_streak': retention.current_streak,
+        'attendance_rate': attendance_rate(retention.history, retention.meetings_tracked, weeks),
+        'meetings_tracked': min(weeks, retention.meetings_tracked),
+        'at_risk': is_at_risk(retention.history, retention.meetings_tracked, absences)
+    }
@@ -0,0 +1,109 @@
+"""
+Escopo de permissões dos usuários.
+
+Centraliza o que cada perfil enxerga:
+- pastor: todas as células;
+- discipulador: células das redes que supervisiona;
+- lider: células que lidera.
+
+Para listagens o escopo é expresso como subconsulta SQL (sem consultas
+extras antes da consulta principal). Para verificações pontuais de
+permissão, o conjunto de células visíveis de cada usuário fica em cache no
+processo e é invalidado quando células ou redes mudam.
+"""
+import time
+from flask import g, session, request
+from sqlalchemy import event, inspect
+from src.models.models import db, User, Cell, Network
+from src.services import auth_tokens
+
+# Tempo máximo de vida do cache: cobre alterações feitas por outros workers
+CACHE_TTL = 30
+
+_generation = 0
+_cache = {}
+
+def check_auth():
+    """Usuário autenticado da requisição atual (carregado uma vez por requisição).
+
+    Com um token Bearer o usuário sai do próprio token (ver auth_tokens), sem
+    consulta ao banco; sem ele, vale o cookie de sessão.
+    """
+    if 'current_user' not in g:
+        authorization = request.headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            g.current_user = auth_tokens.authenticate(authorization[len('Bearer '):])
+        else:
+            user_id = session.get('user_id')
+            g.current_user = db.session.get(User, user_id) if user_id else None
+    return g.current_user
+
+def visible_cells(user, active_only=False):
+    """Subconsulta com os ids das células visíveis ao usuário, ou None para o pastor"""
+    if user.role == 'pastor':
+        if not active_only:
+            return None
+        return db.session.query(Cell.id).filter(Cell.is_active == True)
+
+    if user.role == 'discipulador':
+        query = db.session.query(Cell.id).join(Network, Network.id == Cell.network_id).filter(
+            Network.supervisor_id == user.id
+        )
+    else:
+        query = db.session.query(Cell.id).filter(Cell.leader_id == user.id)
+
+    if active_only:
+        query = query.filter(Cell.is_active == True)
+    return query
+
+def filter_by_scope(query, column, user, include_null=False, active_only=False):
+    """Restringe `query` às linhas cuja `column` aponta para uma célula visível"""
+    cells = visible_cells(user, active_only=active_only)
+    if cells is None:
+        return query
+    condition = column.in_(cells)
+    if include_null:
+        condition = condition | column.is_(None)
+    return query.filter(condition)
+
+def visible_cell_ids(user):
+    """Conjunto (em cache) dos ids das células visíveis, ou None para o pastor"""
+    if user.role == 'pastor':
+        return None
+
+    key = (user.id, user.role)
+    cached = _cache.get(key)
+    now = time.monotonic()
+    if cached and cached[0] == _generation and cached[1] > now:
+        return cached[2]
+
+    cell_ids = frozenset(cell_id for (cell_id,) in visible_cells(user).all())
+    _cache[key] = (_generation, now + CACHE_TTL, cell_ids)
+    return cell_ids
+
+def can_access_cell(user, cell_id, roles=('pastor', 'discipulador', 'lider')):
+    """Verifica se o usuário, com um dos perfis em `roles`, tem a célula no seu escopo"""
+    if user.role not in roles:
+        return False
+    cell_ids = visible_cell_ids(user)
+    return cell_ids is None or int(cell_id) in cell_ids
+
+def invalidate():
+    global _generation
+    _generation += 1
+    _cache.clear()
+
+_SCOPE_ATTRS = {Cell: ('leader_id', 'network_id'), Network: ('supervisor_id',)}
+
+def _after_flush(session, flush_context):
+    for obj in list(session.new) + list(session.deleted):
+        if type(obj) in _SCOPE_ATTRS:
+            invalidate()
+            return
+    for obj in session.dirty:
+        attrs = _SCOPE_ATTRS.get(type(obj))
+        if attrs and any(inspect(obj).attrs[attr].history.has_changes() for attr in attrs):
+            invalidate()
+            return
+
+event.listen(db.session, 'after_flush', _after_flush)
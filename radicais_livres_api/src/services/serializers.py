@@ -0,0 +1,100 @@
+"""
+Serialização em lote das listagens da API.
+
+Cada função recebe uma lista de objetos já carregados e monta os dicionários
+com um número fixo de consultas (uma por tabela relacionada), em vez de
+percorrer os relacionamentos lazy de cada linha. O número de consultas de
+cada listagem é verificado em tests/test_query_budgets.py.
+"""
+from sqlalchemy import func
+from sqlalchemy.orm import raiseload
+from src.models.models import db, User, Network, Cell, Member
+
+def list_options():
+    """Estratégia de carregamento das listagens: nenhum relacionamento é
+    carregado por linha; qualquer acesso lazy gera erro em vez de consulta."""
+    return (raiseload('*', sql_only=True),)
+
+def _names_by_id(model, ids, column):
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return {}
+    rows = db.session.query(model.id, column).filter(model.id.in_(ids)).all()
+    return {row_id: value for row_id, value in rows}
+
+def _counts_by(column, ids):
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return {}
+    rows = db.session.query(column, func.count()).filter(column.in_(ids)).group_by(column).all()
+    return {key: count for key, count in rows}
+
+def serialize_reports(reports):
+    """Relatórios: células, redes e usuários (líderes e autores) em 3 consultas"""
+    cell_ids = {report.cell_id for report in reports}
+    cells = {}
+    if cell_ids:
+        rows = db.session.query(Cell.id, Cell.name, Cell.network_id, Cell.leader_id).filter(Cell.id.in_(cell_ids)).all()
+        cells = {row.id: row for row in rows}
+    network_names = _names_by_id(Network, [cell.network_id for cell in cells.values()], Network.name)
+    user_ids = [cell.leader_id for cell in cells.values()] + [report.created_by for report in reports]
+    user_names = _names_by_id(User, user_ids, User.full_name)
+
+    result = []
+    for report in reports:
+        cell = cells.get(report.cell_id)
+        result.append(report.to_dict(related={
+            'cell_name': cell.name if cell else None,
+            'network_name': network_names.get(cell.network_id) if cell else None,
+            'leader_name': user_names.get(cell.leader_id) if cell else None,
+            'creator_name': user_names.get(report.created_by)
+        }))
+    return result
+
+def serialize_cells(cells):
+    """Células: líderes, redes e contagem de membros em 3 consultas"""
+    leader_names = _names_by_id(User, [cell.leader_id for cell in cells], User.full_name)
+    network_names = _names_by_id(Network, [cell.network_id for cell in cells], Network.name)
+    members_counts = _counts_by(Member.cell_id, [cell.id for cell in cells])
+
+    return [cell.to_dict(related={
+        'leader_name': leader_names.get(cell.leader_id),
+        'network_name': network_names.get(cell.network_id),
+        'members_count': members_counts.get(cell.id, 0)
+    }) for cell in cells]
+
+def serialize_members(members):
+    """Membros: nomes das células em 1 consulta"""
+    cell_names = _names_by_id(Cell, [member.cell_id for member in members], Cell.name)
+
+    return [member.to_dict(related={
+        'cell_name': cell_names.get(member.cell_id)
+    }) for member in members]
+
+def serialize_photos(photos):
+    """Fotos: autores e células em 2 consultas"""
+    uploader_names = _names_by_id(User, [photo.uploaded_by for photo in photos], User.full_name)
+    cell_names = _names_by_id(Cell, [photo.cell_id for photo in photos], Cell.name)
+
+    return [photo.to_dict(related={
+        'uploader_name': uploader_names.get(photo.uploaded_by),
+        'cell_name': cell_names.get(photo.cell_id)
+    }) for photo in photos]
+
+def serialize_networks(networks):
+    """Redes: supervisores e contagem de células em 2 consultas"""
+    supervisor_names = _names_by_id(User, [network.supervisor_id for network in networks], User.full_name)
+    cells_counts = _counts_by(Cell.network_id, [network.id for network in networks])
+
+    return [network.to_dict(related={
+        'supervisor_name': supervisor_names.get(network.supervisor_id),
+        'cells_count': cells_counts.get(network.id, 0)
+    }) for network in networks]
+
+def serialize_attendances(attendances):
+    """Presenças: nomes dos membros em 1 consulta"""
+    member_names = _names_by_id(Member, [attendance.member_id for attendance in attendances], Member.full_name)
+
+    return [attendance.to_dict(related={
+        'member_name': member_names.get(attendance.member_id) or attendance.visitor_name
+    }) for attendance in attendances]
@@ -0,0 +1,66 @@
+"""
+Entrega de arquivos estáticos com cache de longa duração.
+
+Arquivos cujo nome muda quando o conteúdo muda (fotos com nome pelo hash ou
+uuid e os assets do build com hash no nome) são servidos com
+`Cache-Control: immutable` de um ano; os demais são revalidados a cada uso.
+Nas fotos endereçadas pelo conteúdo o ETag é o próprio SHA-256, então um
+If-None-Match que confere é respondido com 304 sem tocar no disco. Range e
+If-Range ficam com o send_file do Werkzeug. Quando o cliente aceita, o irmão
+pré-comprimido (`.br`/`.gz`) é enviado no lugar do arquivo.
+"""
+import mimetypes
+import re
+from flask import request, send_from_directory, make_response
+from src.services.compression import COMPRESSIBLE_TYPES, precompressed_sibling
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# <sha256 ou uuid>[_thumb|_web].<ext>
+PHOTO_NAME = re.compile(r'^(?P<digest>[0-9a-f]{64}|[0-9a-f]{32})(?:_(?:thumb|web))?\.\w+$')
+# Assets do Vite: assets/<nome>-<hash de 8 caracteres>.<ext>
+BUILD_ASSET = re.compile(r'^assets/[^/]+-[\w-]{8}\.\w+$')
+
+def content_etag(filename):
+    """ETag forte derivado do nome, para arquivos endereçados pelo conteúdo"""
+    match = PHOTO_NAME.match(filename)
+    if match and len(match.group('digest')) == 64:
+        # As variantes têm conteúdo próprio: o sufixo entra no ETag
+        return filename.rsplit('.', 1)[0]
+    return None
+
+def is_immutable(path):
+    return bool(PHOTO_NAME.match(path) or BUILD_ASSET.match(path))
+
+def send_static(folder, path, immutable=None):
+    """Envia `folder/path` com ETag, 304, Range e o Cache-Control adequado"""
+    if immutable is None:
+        immutable = is_immutable(path)
+    etag = content_etag(path) if immutable else None
+
+    mimetype = mimetypes.guess_type(path)[0]
+    sibling = precompressed_sibling(folder, path, mimetype)
+
+    if etag and request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+    elif sibling:
+        encoding, compressed_path = sibling
+        response = send_from_directory(folder, compressed_path, mimetype=mimetype,
+                                       max_age=IMMUTABLE_MAX_AGE if immutable else None)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_from_directory(folder, path, etag=etag or True,
+                                       max_age=IMMUTABLE_MAX_AGE if immutable else None)
+
+    if mimetype in COMPRESSIBLE_TYPES:
+        response.vary.add('Accept-Encoding')
+
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,102 @@
+"""
+Versões das tabelas para GET condicional.
+
+Cada tabela tem um contador em `table_versions` (as linhas são criadas pelas
+migrações), incrementado depois do commit de qualquer escrita: objetos
+gravados pelo flush da sessão e INSERT/UPDATE/DELETE em lote executados pela
+sessão. O incremento roda em uma transação curta e separada, para que as
+escritas concorrentes não esperem umas pelas outras na linha da tabela até o
+commit. As listagens montam o ETag a partir das versões das tabelas que
+leem, do usuário (o escopo de permissões depende dele) e da URL; um
+If-None-Match igual é respondido com 304 após uma única consulta pequena,
+sem rodar a listagem nem serializar.
+
+Se uma escrita confirmar entre a leitura das versões e a consulta da
+listagem (ou antes do seu incremento), a resposta sai com o ETag antigo e o
+cliente apenas buscará de novo na próxima vez: o erro é sempre para o lado
+seguro.
+"""
+import hashlib
+from functools import wraps
+from flask import request, make_response
+from sqlalchemy import event, select, update
+from src.models.models import db, TableVersion
+from src.services.scope import check_auth
+
+def _bump(conn, tables):
+    tables = sorted(tables - {TableVersion.__tablename__})
+    if tables:
+        conn.execute(update(TableVersion).where(TableVersion.table_name.in_(tables))
+                     .values(version=TableVersion.version + 1))
+
+def _changed(session):
+    # Tabelas escritas na transação em andamento da sessão
+    return session.info.setdefault('changed_tables', set())
+
+def _after_flush(session, flush_context):
+    tables = _changed(session)
+    tables.update(obj.__table__.name for obj in session.new)
+    tables.update(obj.__table__.name for obj in session.deleted)
+    tables.update(obj.__table__.name for obj in session.dirty if session.is_modified(obj))
+
+def _do_orm_execute(orm_execute_state):
+    # Escritas em lote (session.execute(insert/update/delete(...))) não passam pelo flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            _changed(orm_execute_state.session).add(table.name)
+
+def _after_commit(session):
+    # Savepoints (begin_nested) também disparam o evento; só vale o commit final
+    if session.in_nested_transaction():
+        return
+    tables = session.info.pop('changed_tables', None)
+    if tables:
+        with db.engine.begin() as conn:
+            _bump(conn, tables)
+
+def _after_rollback(session):
+    if not session.in_nested_transaction():
+        session.info.pop('changed_tables', None)
+
+event.listen(db.session, 'after_flush', _after_flush)
+event.listen(db.session, 'do_orm_execute', _do_orm_execute)
+event.listen(db.session, 'after_commit', _after_commit)
+event.listen(db.session, 'after_rollback', _after_rollback)
+
+def current(tables):
+    rows = db.session.execute(
+        select(TableVersion.table_name, TableVersion.version).where(TableVersion.table_name.in_(tables))
+    ).all()
+    return dict(rows)
+
+def etag_for(user, tables):
+    versions = current(tables)
+    key = '|'.join([request.full_path, str(user.id), user.role] +
+                   [f'{table}:{versions.get(table, 0)}' for table in tables])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def conditional(*tables):
+    """Responde 304 quando nenhuma das `tables` mudou desde o ETag do cliente"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user = check_auth()
+            if not user:
+                return view(*args, **kwargs)
+
+            etag = etag_for(user, tables)
+            # Comparação fraca: a versão comprimida da resposta tem ETag fraco
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            # O navegador guarda a resposta, mas sempre revalida
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,156 @@
+"""
+Fixtures dos testes: a aplicação roda em um SQLite temporário, com o esquema
+criado pelas migrações a cada teste.
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+# Antes de importar a aplicação, que lê DATABASE_URL e SQL_AUDIT: no modo
+# strict toda requisição dos testes que passar do orçamento da rota vira 500
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='radicais-tests-'), 'app.db')
+os.environ['SQL_AUDIT'] = 'strict'
+
+from sqlalchemy import event
+
+from src.main import app as flask_app
+from src.migrations import runner as migrations
+from src.models.models import db, User, Network, Cell, Member, AttendanceReport, Attendance, Photo, DashboardStats
+from src.services import dashboard_stats, member_dedup, retention
+
+PASSWORD = 'senha'
+USERS = (('pastor', 'pastor'), ('discipulador', 'discipulador'), ('lider', 'lider'), ('lider2', 'lider'))
+
+class Dataset:
+    """Usuários fixos e um número crescente de células com membros, relatórios e fotos"""
+
+    def __init__(self, app):
+        self.app = app
+        self.cells = 0
+        with app.app_context():
+            users = {}
+            for username, role in USERS:
+                user = User(username=username, email=f'{username}@example.com', full_name=username.title(), role=role)
+                user.set_password(PASSWORD)
+                db.session.add(user)
+                users[username] = user
+            db.session.flush()
+            networks = [Network(name='Rede A', supervisor_id=users['discipulador'].id),
+                        Network(name='Rede B', supervisor_id=users['pastor'].id)]
+            db.session.add_all(networks)
+            db.session.commit()
+            self.user_ids = {username: user.id for username, user in users.items()}
+            self.network_ids = [network.id for network in networks]
+
+    def grow(self, cells, members=5, weeks=4):
+        """Acrescenta `cells` células (alternando redes e líderes) e recalcula os derivados"""
+        with self.app.app_context():
+            for _ in range(cells):
+                index = self.cells
+                self.cells += 1
+                leader_id = self.user_ids['lider' if index % 2 == 0 else 'lider2']
+                cell = Cell(name=f'Célula {index}', leader_id=leader_id,
+                            network_id=self.network_ids[index % 2])
+                db.session.add(cell)
+                db.session.flush()
+
+                cell_members = [
+                    Member(full_name=f'Membro {index} {position}', phone=f'(11) 9{index:04d}-{position:04d}',
+                           email=f'membro{index}_{position}@example.com',
+                           member_type=('membro', 'fa', 'visitante')[position % 3], cell_id=cell.id)
+                    for position in range(members)
+                ]
+                # Mesmo nome e telefone do primeiro membro: vira sugestão de duplicado
+                cell_members.append(Member(full_name=f'Membro {index} 0', phone=f'(11) 9{index:04d}-0000',
+                                           member_type='membro', cell_id=cell.id))
+                db.session.add_all(cell_members)
+                db.session.flush()
+
+                for week in range(weeks):
+                    report = AttendanceReport(cell_id=cell.id, meeting_date=date(2024, 1, 7) + timedelta(weeks=week),
+                                              members_present=2, fas_present=1, visitors_present=0,
+                                              created_by=leader_id)
+                    db.session.add(report)
+                    db.session.flush()
+                    db.session.add_all([Attendance(report_id=report.id, member_id=member.id,
+                                                   attendance_type=member.member_type)
+                                        for member in cell_members[:3]])
+
+                db.session.add(Photo(filename=f'foto{index}.jpg', original_filename=f'foto{index}.jpg',
+                                     uploaded_by=leader_id, cell_id=cell.id))
+            db.session.commit()
+
+            dashboard_stats.rebuild()
+            retention.rebuild()
+            member_dedup.detect()
+            db.session.commit()
+        return self
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        migrations.reset()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+
+@pytest.fixture
+def dataset(app):
+    return Dataset(app)
+
+@pytest.fixture
+def login(app):
+    def login(username):
+        client = app.test_client()
+        response = client.post('/api/auth/login', json={'username': username, 'password': PASSWORD})
+        assert response.status_code == 200, response.get_json()
+        return client
+    return login
+
+@pytest.fixture
+def token_for(app):
+    """Token Bearer emitido no login de `username`"""
+    def token_for(username):
+        response = app.test_client().post('/api/auth/login', json={'username': username, 'password': PASSWORD})
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()['token']
+    return token_for
+
+@pytest.fixture
+def count_queries(app):
+    """Gerenciador de contexto que conta os comandos SQL executados dentro dele"""
+    with app.app_context():
+        engine = db.engine
+
+    @contextmanager
+    def count_queries():
+        statements = []
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'after_cursor_execute', after_cursor_execute)
+    return count_queries
+
+@pytest.fixture
+def dashboard_snapshot(app):
+    """Estatísticas do dashboard por escopo, com as faixas da igreja somadas"""
+    def dashboard_snapshot():
+        with app.app_context():
+            rows = {}
+            for row in db.session.query(DashboardStats):
+                key = ('church', 0) if row.scope == 'church' else (row.scope, row.scope_id)
+                counters = rows.setdefault(key, dict.fromkeys(dashboard_stats.COUNTERS, 0))
+                for column in dashboard_stats.COUNTERS:
+                    counters[column] += getattr(row, column)
+            return rows
+    return dashboard_snapshot
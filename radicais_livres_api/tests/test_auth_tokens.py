@@ -0,0 +1,98 @@
+"""
+Tokens de acesso: revogação, reemissão com o perfil atual e validade.
+"""
+import time
+
+from itsdangerous import TimestampSigner
+from sqlalchemy import update
+
+from src.models.models import db, User, TableVersion
+from src.services import auth_tokens
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+def get(app, path, token):
+    return app.test_client().get(path, headers=bearer(token))
+
+def refresh(app, token):
+    return app.test_client().post('/api/auth/refresh', headers=bearer(token))
+
+def change_user(app, username, **values):
+    with app.app_context():
+        user = db.session.query(User).filter_by(username=username).one()
+        for key, value in values.items():
+            setattr(user, key, value)
+        db.session.commit()
+
+def issued_at(monkeypatch, seconds_ago):
+    monkeypatch.setattr(TimestampSigner, 'get_timestamp', lambda self: int(time.time()) - seconds_ago)
+
+def test_logout_revokes_token(app, dataset, token_for):
+    token = token_for('lider')
+    assert get(app, '/api/cells/', token).status_code == 200
+
+    response = app.test_client().post('/api/auth/logout', headers=bearer(token))
+    assert response.status_code == 200
+
+    assert refresh(app, token).status_code == 401
+    assert get(app, '/api/cells/', token).status_code == 401
+
+def test_deactivation_revokes_token(app, dataset, token_for):
+    token = token_for('lider')
+    change_user(app, 'lider', is_active=False)
+
+    assert refresh(app, token).status_code == 401
+    assert get(app, '/api/cells/', token).status_code == 401
+
+def test_revocation_by_other_worker_applies_after_scope_version_bump(app, dataset, token_for):
+    token = token_for('lider')
+    assert get(app, '/api/cells/', token).status_code == 200
+
+    # Outro worker desativa o usuário: este processo não vê o commit
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(update(User).where(User.username == 'lider').values(
+                is_active=False, token_version=User.token_version + 1
+            ))
+            conn.execute(update(TableVersion).where(TableVersion.table_name == 'users')
+                         .values(version=TableVersion.version + 1))
+
+    # Até AUTH_SCOPE_TTL a versão em cache ainda aceita o token; a renovação confere o banco
+    assert get(app, '/api/cells/', token).status_code == 200
+    assert refresh(app, token).status_code == 401
+
+    auth_tokens._scope_version = None
+    assert get(app, '/api/cells/', token).status_code == 401
+
+def test_role_change_reissues_token(app, dataset, token_for):
+    token = token_for('lider')
+    change_user(app, 'lider', role='discipulador')
+
+    response = get(app, '/api/auth/me', token)
+    assert response.status_code == 200
+    assert response.get_json()['user']['role'] == 'discipulador'
+
+    new_token = response.headers['X-Auth-Token']
+    with app.app_context():
+        claims = auth_tokens._load(new_token, auth_tokens.AUTH_TOKEN_TTL)
+    assert claims['role'] == 'discipulador'
+    assert 'X-Auth-Token' not in get(app, '/api/auth/me', new_token).headers
+
+def test_expired_token_refresh_window(app, dataset, token_for, monkeypatch):
+    issued_at(monkeypatch, auth_tokens.AUTH_TOKEN_TTL + 60)
+    expired = token_for('lider')
+    issued_at(monkeypatch, auth_tokens.AUTH_REFRESH_TTL + 60)
+    too_old = token_for('lider')
+    monkeypatch.undo()
+
+    assert get(app, '/api/cells/', expired).status_code == 401
+    assert refresh(app, expired).status_code == 200
+    assert refresh(app, too_old).status_code == 401
+
+def test_register_uses_bearer_token(app, dataset, token_for):
+    new_user = {'username': 'novo', 'email': 'novo@example.com', 'password': 'x', 'full_name': 'Novo'}
+    response = app.test_client().post('/api/auth/register', json=new_user, headers=bearer(token_for('lider')))
+    assert response.status_code == 403
+
+    response = app.test_client().post('/api/auth/register', json=new_user, headers=bearer(token_for('pastor')))
+    assert response.status_code == 201
@@ -0,0 +1,106 @@
+"""
+Estatísticas materializadas do dashboard: as variações aplicadas a cada
+escrita chegam ao mesmo resultado que o rebuild().
+"""
+import pytest
+from sqlalchemy import delete
+
+from src.models.models import db, DashboardStats, Cell, Member, AttendanceReport
+from src.migrations import runner as migrations
+from src.services import dashboard_stats
+
+def first(app, model, **filters):
+    with app.app_context():
+        return db.session.query(model.id).filter_by(**filters).order_by(model.id).first()[0]
+
+def active_cell_ids(app, network_id):
+    with app.app_context():
+        return db.session.scalars(db.select(Cell.id).filter_by(network_id=network_id, is_active=True)).all()
+
+def check(app, dashboard_snapshot):
+    incremental = dashboard_snapshot()
+    with app.app_context():
+        dashboard_stats.rebuild()
+    assert incremental == dashboard_snapshot()
+
+@pytest.fixture
+def client(dataset, login):
+    dataset.grow(4)
+    return login('pastor')
+
+def test_member_changes_match_rebuild(app, dataset, client, dashboard_snapshot):
+    cell_id, other_cell_id = (first(app, Cell, network_id=network_id) for network_id in dataset.network_ids)
+
+    response = client.post('/api/members/', json={'full_name': 'Novo Membro', 'cell_id': cell_id})
+    assert response.status_code == 201
+    member_id = response.get_json()['member']['id']
+    check(app, dashboard_snapshot)
+
+    fa_id = first(app, Member, cell_id=cell_id, member_type='fa')
+    assert client.put(f'/api/members/{fa_id}', json={'member_type': 'membro'}).status_code == 200
+    check(app, dashboard_snapshot)
+
+    assert client.put(f'/api/members/{member_id}', json={'cell_id': other_cell_id}).status_code == 200
+    check(app, dashboard_snapshot)
+
+    assert client.put(f'/api/members/{member_id}', json={'cell_id': None}).status_code == 200
+    check(app, dashboard_snapshot)
+
+    assert client.delete(f'/api/members/{fa_id}').status_code == 200
+    check(app, dashboard_snapshot)
+
+def test_report_changes_match_rebuild(app, dataset, client, dashboard_snapshot):
+    cell_id = first(app, Cell)
+    member_id = first(app, Member, cell_id=cell_id, member_type='membro')
+
+    response = client.post('/api/reports/', json={
+        'cell_id': cell_id, 'meeting_date': '2024-06-02',
+        'attendances': [{'member_id': member_id, 'attendance_type': 'membro'}]
+    })
+    assert response.status_code == 201, response.get_json()
+    check(app, dashboard_snapshot)
+
+    report_id = first(app, AttendanceReport, cell_id=cell_id)
+    assert client.delete(f'/api/reports/{report_id}').status_code == 200
+    check(app, dashboard_snapshot)
+
+def test_cell_changes_match_rebuild(app, dataset, client, dashboard_snapshot):
+    network_a, network_b = dataset.network_ids
+    response = client.post('/api/cells/', json={'name': 'Célula Nova', 'leader_id': dataset.user_ids['lider'],
+                                                'network_id': network_a})
+    assert response.status_code == 201
+    new_cell_id = response.get_json()['cell']['id']
+    assert client.post('/api/members/', json={'full_name': 'Membro Novo', 'cell_id': new_cell_id}).status_code == 201
+    check(app, dashboard_snapshot)
+
+    # Mudança de rede leva junto os membros e relatórios da célula
+    cell_id = first(app, Cell, network_id=network_a)
+    assert client.put(f'/api/cells/{cell_id}', json={'network_id': network_b}).status_code == 200
+    check(app, dashboard_snapshot)
+
+    # Rede que fica sem células ativas deixa de contar
+    for remaining_id in active_cell_ids(app, network_a):
+        assert client.delete(f'/api/cells/{remaining_id}').status_code == 200
+    check(app, dashboard_snapshot)
+    assert client.get('/api/reports/dashboard').get_json()['total_networks'] == 1
+
+def test_dashboard_read_does_not_rebuild(app, dataset, client):
+    with app.app_context():
+        db.session.execute(delete(DashboardStats))
+        db.session.commit()
+
+    response = client.get('/api/reports/dashboard')
+    assert response.status_code == 200
+    assert response.get_json()['total_cells'] == 0
+    with app.app_context():
+        assert db.session.query(DashboardStats).count() == 0
+
+def test_migration_builds_missing_rows(app, dataset, client, dashboard_snapshot):
+    expected = dashboard_snapshot()
+    with app.app_context():
+        db.session.execute(delete(DashboardStats))
+        db.session.execute(delete(migrations.schema_migrations).where(migrations.schema_migrations.c.version == 10))
+        db.session.commit()
+
+        assert migrations.upgrade() == [(10, 'dashboard_stats_rows')]
+    assert dashboard_snapshot() == expected
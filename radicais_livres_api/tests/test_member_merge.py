@@ -0,0 +1,60 @@
+"""
+Junção de membros duplicados.
+"""
+from src.models.models import db, Member, Attendance, AttendanceReport
+from src.services import dashboard_stats
+
+def pair(app):
+    """O primeiro membro da primeira célula e o seu duplicado (mesmo nome e telefone)"""
+    with app.app_context():
+        keep = db.session.query(Member).order_by(Member.id).first()
+        duplicate = db.session.query(Member).filter(
+            Member.full_name == keep.full_name, Member.id != keep.id
+        ).one()
+        return keep.id, duplicate.id
+
+def test_merge_deactivates_duplicate_and_fixes_report_counts(app, dataset, login, dashboard_snapshot):
+    dataset.grow(1)
+    keep_id, duplicate_id = pair(app)
+    with app.app_context():
+        # Os dois presentes na primeira reunião; o duplicado sozinho na segunda
+        first, second = db.session.query(AttendanceReport).order_by(AttendanceReport.meeting_date).limit(2).all()
+        first_id, second_id = first.id, second.id
+        db.session.query(Attendance).filter_by(report_id=second_id, member_id=keep_id).delete()
+        second.members_present -= 1
+        db.session.add_all([Attendance(report_id=first_id, member_id=duplicate_id, attendance_type='membro'),
+                            Attendance(report_id=second_id, member_id=duplicate_id, attendance_type='membro')])
+        first.members_present += 1
+        second.members_present += 1
+        db.session.commit()
+        counts = {report.id: report.members_present for report in (first, second)}
+
+    response = login('pastor').post(f'/api/members/{keep_id}/merge', json={'duplicate_id': duplicate_id})
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['attendances_moved'] == 1
+
+    with app.app_context():
+        duplicate = db.session.get(Member, duplicate_id)
+        assert not duplicate.is_active
+        assert duplicate.merged_into_id == keep_id
+        assert db.session.query(Attendance).filter_by(member_id=duplicate_id).count() == 0
+
+        for report_id in (first_id, second_id):
+            present = db.session.query(Attendance).filter_by(report_id=report_id, member_id=keep_id).count()
+            assert present == 1
+        assert db.session.get(AttendanceReport, first_id).members_present == counts[first_id] - 1
+        assert db.session.get(AttendanceReport, second_id).members_present == counts[second_id]
+
+    incremental = dashboard_snapshot()
+    with app.app_context():
+        dashboard_stats.rebuild()
+    assert incremental == dashboard_snapshot()
+
+def test_merged_duplicate_cannot_be_merged_again(app, dataset, login):
+    dataset.grow(1)
+    keep_id, duplicate_id = pair(app)
+    client = login('pastor')
+    assert client.post(f'/api/members/{keep_id}/merge', json={'duplicate_id': duplicate_id}).status_code == 200
+
+    response = client.post(f'/api/members/{keep_id}/merge', json={'duplicate_id': duplicate_id})
+    assert response.status_code == 400
@@ -0,0 +1,39 @@
+"""
+Edição de membros: cell_id enviado como texto é tratado como o número.
+"""
+from src.models.models import db, Cell, Member
+from src.services import retention
+
+def member_and_cells(app):
+    with app.app_context():
+        cells = [cell_id for (cell_id,) in db.session.query(Cell.id).order_by(Cell.id)]
+        member_id = db.session.query(Member.id).filter_by(cell_id=cells[0]).order_by(Member.id).first()[0]
+        return member_id, cells
+
+def test_same_cell_as_string_is_not_a_move(app, dataset, login, monkeypatch):
+    dataset.grow(2)
+    member_id, cells = member_and_cells(app)
+    refreshed = []
+    monkeypatch.setattr(retention, 'refresh_members', lambda *args: refreshed.append(args))
+
+    response = login('pastor').put(f'/api/members/{member_id}', json={'cell_id': str(cells[0]), 'phone': '1'})
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['member']['cell_id'] == cells[0]
+    assert refreshed == []
+
+def test_cell_id_as_string_moves_member(app, dataset, login):
+    dataset.grow(2)
+    member_id, cells = member_and_cells(app)
+
+    response = login('pastor').put(f'/api/members/{member_id}', json={'cell_id': str(cells[1])})
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['member']['cell_id'] == cells[1]
+    with app.app_context():
+        assert db.session.get(Member, member_id).cell_id == cells[1]
+
+def test_invalid_cell_id_is_rejected(app, dataset, login):
+    dataset.grow(1)
+    member_id, _ = member_and_cells(app)
+
+    response = login('pastor').put(f'/api/members/{member_id}', json={'cell_id': 'abc'})
+    assert response.status_code == 400
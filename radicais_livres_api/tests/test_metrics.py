@@ -0,0 +1,59 @@
+"""
+Agregação das métricas dos workers em /api/metrics.
+"""
+import json
+import os
+
+import pytest
+
+from src.services import metrics
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    return tmp_path
+
+def snapshot(pid, started, requests):
+    stats = metrics._new_route()
+    stats['statuses'] = {'200': requests}
+    stats['duration_buckets'][0] = requests
+    return {'pid': pid, 'started': started, 'routes': [['cells', '/api/cells/', 'GET', stats]],
+            'database': [{'locks': {'lock_waits': requests}}]}
+
+def write(folder, name, content):
+    (folder / name).write_text(json.dumps(content))
+
+def requests_total(routes):
+    stats = routes.get(('cells', '/api/cells/', 'GET'))
+    return stats['statuses'].get('200', 0) if stats else 0
+
+def test_dead_worker_files_are_compacted_without_losing_counts(metrics_dir):
+    pid, started = metrics._instance
+    # Arquivo de um processo que terminou e de outro que usou o mesmo pid antes deste
+    write(metrics_dir, '999999999-1.json', snapshot(999999999, '1', 5))
+    write(metrics_dir, f'{pid}-antigo.json', snapshot(pid, 'antigo', 7))
+    write(metrics_dir, f'{pid}-{started}.json', snapshot(pid, started, 3))
+
+    routes, _, locks = metrics.collect()
+    assert requests_total(routes) == 15
+    assert locks['lock_waits'] == 15
+    assert sorted(os.listdir(metrics_dir)) == ['.lock', f'{pid}-{started}.json', metrics.TOTALS_FILE]
+
+    # Nova coleta: os totais não diminuem nem são somados duas vezes
+    routes, _, _ = metrics.collect()
+    assert requests_total(routes) == 15
+
+def test_compaction_interrupted_before_delete_is_not_counted_twice(metrics_dir):
+    write(metrics_dir, '999999999-1.json', snapshot(999999999, '1', 5))
+    totals = snapshot(None, None, 5)
+    totals['compacted'] = ['999999999-1.json']
+    write(metrics_dir, metrics.TOTALS_FILE, totals)
+
+    routes, _, _ = metrics.collect()
+    assert requests_total(routes) == 5
+    assert not (metrics_dir / '999999999-1.json').exists()
+
+def test_flush_writes_file_per_process_instance(metrics_dir):
+    metrics.flush()
+    pid, started = metrics._instance
+    assert os.listdir(metrics_dir) == [f'{pid}-{started}.json']
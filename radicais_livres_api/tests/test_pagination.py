@@ -0,0 +1,75 @@
+"""
+Paginação por cursor: percorrer todas as páginas devolve cada linha uma vez,
+na ordem da listagem.
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import inspect, insert, text, update
+
+from src.models.models import db, Photo, Member, AttendanceReport
+from src.migrations import runner as migrations
+
+from conftest import Dataset
+
+def pages(client, path, key, limit=3):
+    """Ids de todas as páginas de `path` e o número de páginas"""
+    ids, cursor, count = [], None, 0
+    while True:
+        query = {'limit': limit, 'cursor': cursor} if cursor else {'limit': limit}
+        response = client.get(path, query_string=query)
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        ids += [row['id'] for row in body[key]]
+        count += 1
+        cursor = body['next_cursor']
+        if cursor is None:
+            return ids, count
+
+@pytest.mark.parametrize('path, key, model, order', [
+    ('/api/photos/', 'photos', Photo, (Photo.created_at.desc(), Photo.id.desc())),
+    ('/api/reports/', 'reports', AttendanceReport, (AttendanceReport.meeting_date.desc(), AttendanceReport.id.desc())),
+    ('/api/members/', 'members', Member, (Member.full_name, Member.id)),
+])
+def test_cursor_round_trip(app, dataset, login, path, key, model, order):
+    dataset.grow(4)
+    with app.app_context():
+        # Empates na primeira coluna da chave são desfeitos pelo id
+        db.session.execute(update(Photo).values(created_at=datetime(2024, 1, 7)))
+        db.session.commit()
+        query = db.session.query(model.id).order_by(*order)
+        if model is Member:
+            query = query.filter(Member.is_active == True)
+        expected = [row.id for row in query]
+
+    ids, count = pages(login('pastor'), path, key)
+    assert count > 1
+    assert ids == expected
+
+def test_migration_fills_null_photo_dates(app):
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        with db.engine.begin() as conn:
+            migrations.schema_migrations.drop(conn, checkfirst=True)
+            migrations.applied_versions(conn)
+            for version, _, module in migrations.available_migrations():
+                if version < 11:
+                    module.upgrade(conn)
+                    conn.execute(insert(migrations.schema_migrations).values(
+                        version=version, name=module.__name__, applied_at=datetime.utcnow()))
+            conn.execute(text("INSERT INTO photos (filename, original_filename, uploaded_by, created_at) "
+                              "VALUES ('a.jpg', 'a.jpg', 1, '2024-01-07 10:00:00'), "
+                              "('b.jpg', 'b.jpg', 1, NULL), ('c.jpg', 'c.jpg', 1, NULL)"))
+
+        assert migrations.upgrade() == [(11, 'photos_created_at_not_null')]
+        columns = {column['name']: column for column in inspect(db.engine).get_columns('photos')}
+        assert not columns['created_at']['nullable']
+        assert db.session.query(Photo).filter(Photo.created_at.is_(None)).count() == 0
+
+    client = app.test_client()
+    Dataset(app)
+    assert client.post('/api/auth/login', json={'username': 'pastor', 'password': 'senha'}).status_code == 200
+    ids, count = pages(client, '/api/photos/', 'photos', limit=1)
+    assert count == 3
+    assert len(set(ids)) == 3
@@ -0,0 +1,86 @@
+"""
+Armazenamento das fotos: os arquivos só mudam depois do commit.
+"""
+import io
+import os
+
+import pytest
+
+from src.models.models import db, Photo, PhotoBlob
+from src.services import photo_storage
+
+CONTENT = b'conteudo da foto'
+
+@pytest.fixture
+def folder(tmp_path):
+    return str(tmp_path)
+
+def upload(folder, user_id, content=CONTENT):
+    """Grava uma foto como o envio da rota, sem o commit"""
+    temp_path, sha256, size = photo_storage.save_stream(io.BytesIO(content), folder)
+    filename, _ = photo_storage.store(temp_path, sha256, 'jpg', size, folder)
+    photo = Photo(filename=filename, original_filename='foto.jpg', uploaded_by=user_id)
+    photo_storage.attach(photo, sha256)
+    db.session.add(photo)
+    return photo, temp_path
+
+def files(folder):
+    return sorted(os.listdir(folder))
+
+def test_upload_moves_file_on_commit(app, dataset, folder):
+    with app.app_context():
+        photo, temp_path = upload(folder, dataset.user_ids['pastor'])
+        assert files(folder) == [os.path.basename(temp_path)]
+
+        db.session.commit()
+        assert files(folder) == [photo.filename]
+
+def test_rolled_back_upload_leaves_no_files(app, dataset, folder):
+    with app.app_context():
+        upload(folder, dataset.user_ids['pastor'])
+        db.session.rollback()
+
+        assert files(folder) == []
+        assert db.session.query(PhotoBlob).count() == 0
+
+def test_last_reference_delete_removes_files_after_commit(app, dataset, folder):
+    with app.app_context():
+        photo, _ = upload(folder, dataset.user_ids['pastor'])
+        db.session.commit()
+        variant = photo.filename.replace('.jpg', '_thumb.webp')
+        open(os.path.join(folder, variant), 'wb').close()
+        photo.thumbnail_filename = variant
+        db.session.commit()
+
+        assert photo_storage.delete_photo(photo, folder)
+        assert len(files(folder)) == 2
+        db.session.commit()
+
+        assert files(folder) == []
+        assert db.session.query(PhotoBlob).count() == 0
+
+def test_rolled_back_delete_keeps_files(app, dataset, folder):
+    with app.app_context():
+        photo, _ = upload(folder, dataset.user_ids['pastor'])
+        db.session.commit()
+        filename = photo.filename
+
+        photo_storage.delete_photo(photo, folder)
+        db.session.rollback()
+
+        assert files(folder) == [filename]
+        assert db.session.query(PhotoBlob.ref_count).scalar() == 1
+
+def test_delete_keeps_content_used_by_other_photo(app, dataset, folder):
+    with app.app_context():
+        first, _ = upload(folder, dataset.user_ids['pastor'])
+        db.session.commit()
+        upload(folder, dataset.user_ids['lider'])
+        db.session.commit()
+        filename = first.filename
+
+        assert not photo_storage.delete_photo(first, folder)
+        db.session.commit()
+
+        assert files(folder) == [filename]
+        assert db.session.query(PhotoBlob.ref_count).scalar() == 1
@@ -0,0 +1,26 @@
+"""
+Envio de fotos pela rota.
+"""
+import io
+from concurrent.futures.process import BrokenProcessPool
+
+from src.models.models import db, Photo
+from src.routes import photos
+from src.services import photo_variants
+
+class BrokenExecutor:
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool('pool quebrado')
+
+def test_upload_succeeds_when_variants_cannot_be_enqueued(app, dataset, login, tmp_path, monkeypatch):
+    monkeypatch.setattr(photos, 'UPLOAD_PATH', str(tmp_path))
+    monkeypatch.setattr(photo_variants, '_executor', BrokenExecutor())
+
+    response = login('pastor').post('/api/photos/upload', data={
+        'file': (io.BytesIO(b'conteudo da foto'), 'foto.jpg'), 'description': 'Culto',
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 201, response.get_json()
+    assert photo_variants._executor is None
+    with app.app_context():
+        assert db.session.query(Photo).filter_by(description='Culto').count() == 1
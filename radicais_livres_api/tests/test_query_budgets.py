@@ -0,0 +1,68 @@
+"""
+Número de comandos SQL das listagens: constante no tamanho dos dados (sem
+N+1) e dentro do orçamento da rota (@query_budget ou SQL_QUERY_BUDGET), que
+o modo strict do SQL_AUDIT também aplica a todas as requisições dos testes.
+"""
+import pytest
+
+from src.models.models import db, Cell, Member
+from src.services.query_audit import route_budget
+
+LISTINGS = (
+    '/api/cells/',
+    '/api/networks/',
+    '/api/members/',
+    '/api/members/search?q=membro',
+    '/api/members/retention',
+    '/api/members/duplicates',
+    '/api/reports/',
+    '/api/reports/dashboard',
+    '/api/photos/',
+)
+
+ROLES = ('pastor', 'discipulador', 'lider')
+
+def measure(client, count_queries, path):
+    # A primeira requisição preenche os caches do processo (escopo, versões)
+    assert client.get(path).status_code == 200
+    with count_queries() as statements:
+        response = client.get(path)
+    assert response.status_code == 200, response.get_json()
+    return len(statements)
+
+@pytest.mark.parametrize('role', ROLES)
+@pytest.mark.parametrize('path', LISTINGS)
+def test_listing_queries_do_not_grow_with_data(app, dataset, login, count_queries, path, role):
+    client = login(role)
+    dataset.grow(2)
+    small = measure(client, count_queries, path)
+    dataset.grow(10)
+    large = measure(client, count_queries, path)
+
+    budget = route_budget(app, 'GET', path)
+    assert small == large, f'{path} ({role}): {small} comandos com poucos dados, {large} com mais dados'
+    assert large <= budget, f'{path} ({role}): {large} comandos, orçamento {budget}'
+
+def test_create_report_within_budget(app, dataset, login, count_queries):
+    dataset.grow(2)
+    client = login('lider')
+    with app.app_context():
+        cell = db.session.query(Cell).filter_by(leader_id=dataset.user_ids['lider']).first()
+        attendances = [{'member_id': member.id, 'attendance_type': member.member_type}
+                       for member in db.session.query(Member).filter_by(cell_id=cell.id)]
+
+    with count_queries() as statements:
+        response = client.post('/api/reports/', json={
+            'cell_id': cell.id, 'meeting_date': '2030-01-05', 'attendances': attendances,
+        })
+    assert response.status_code == 201, response.get_json()
+    assert len(statements) <= route_budget(app, 'POST', '/api/reports/')
+
+def test_strict_mode_fails_request_over_budget(app, dataset, login, monkeypatch):
+    dataset.grow(2)
+    client = login('pastor')
+    monkeypatch.setattr(app.view_functions['cells.get_cells'], 'query_budget', 1)
+
+    response = client.get('/api/cells/')
+    assert response.status_code == 500
+    assert 'Orçamento de consultas excedido em GET /api/cells/' in response.get_json()['error']
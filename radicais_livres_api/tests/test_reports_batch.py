@@ -0,0 +1,78 @@
+"""
+Envio de relatórios em lote: no modo best_effort cada item falha sozinho.
+"""
+from datetime import date
+
+import pytest
+from sqlalchemy import insert
+
+from src.models.models import db, AttendanceReport, Cell, Member
+from src.routes import reports
+
+@pytest.fixture
+def cell(app, dataset):
+    dataset.grow(1)
+    with app.app_context():
+        cell = db.session.query(Cell).first()
+        members = db.session.query(Member.id, Member.member_type).filter_by(cell_id=cell.id).all()
+        return cell.id, [{'member_id': member_id, 'attendance_type': member_type} for member_id, member_type in members]
+
+def post_batch(client, items, mode='best_effort'):
+    return client.post('/api/reports/batch', json={'reports': items, 'mode': mode})
+
+def test_invalid_items_fail_alone(app, login, cell):
+    cell_id, attendances = cell
+    response = post_batch(login('pastor'), [
+        {'cell_id': cell_id, 'meeting_date': '2030-01-05', 'attendances': attendances},
+        {'cell_id': cell_id, 'meeting_date': '2030-01-12', 'attendances': ['presente']},
+        {'cell_id': cell_id, 'meeting_date': '2030-01-19', 'attendances': [{'member_id': 999999, 'attendance_type': 'membro'}]},
+        {'cell_id': cell_id, 'meeting_date': '2030-01-26', 'attendances': [{'visitor_name': 'Ana', 'attendance_type': 'amigo'}]},
+        {'cell_id': 'abc', 'meeting_date': '2030-02-02'},
+        {'cell_id': cell_id, 'meeting_date': '02/02/2030'},
+    ])
+    assert response.status_code == 201, response.get_json()
+    body = response.get_json()
+    assert body['created'] == 1
+    results = body['results']
+    assert results[0]['status'] == 'created'
+    assert results[0]['report']['members_present'] == sum(a['attendance_type'] == 'membro' for a in attendances)
+    assert [result['code'] for result in results[1:]] == [400] * 5
+    assert results[1]['error'] == 'Presença inválida'
+    assert results[2]['error'] == 'Membro não encontrado na lista de presenças'
+    assert results[3]['error'].startswith('Tipo de presença inválido')
+    assert results[4]['error'] == 'Célula inválida'
+    assert results[5]['error'].startswith('Formato de data inválido')
+
+def test_atomic_rejects_whole_batch(app, login, cell):
+    cell_id, attendances = cell
+    response = post_batch(login('pastor'), [
+        {'cell_id': cell_id, 'meeting_date': '2030-01-05', 'attendances': attendances},
+        {'cell_id': cell_id, 'meeting_date': '2030-01-12', 'attendances': [None]},
+    ], mode='atomic')
+    assert response.status_code == 400
+    assert response.get_json()['created'] == 0
+    with app.app_context():
+        assert db.session.query(AttendanceReport).filter(AttendanceReport.meeting_date >= '2030-01-01').count() == 0
+
+def test_concurrent_conflict_fails_only_its_item(app, login, cell, monkeypatch):
+    cell_id, attendances = cell
+    can_access_cell = reports.can_access_cell
+
+    def with_concurrent_report(user, checked_cell_id, *args, **kwargs):
+        # O relatório de 12/01 aparece depois da consulta de duplicados, como se
+        # gravado por outro envio (o SQLite não deixa outra conexão escrever aqui)
+        db.session.execute(insert(AttendanceReport).prefix_with('OR IGNORE'), {
+            'cell_id': cell_id, 'meeting_date': date(2030, 1, 12), 'created_by': user.id,
+            'members_present': 0, 'fas_present': 0, 'visitors_present': 0,
+        })
+        return can_access_cell(user, checked_cell_id, *args, **kwargs)
+    monkeypatch.setattr(reports, 'can_access_cell', with_concurrent_report)
+
+    response = post_batch(login('pastor'), [
+        {'cell_id': cell_id, 'meeting_date': '2030-01-05', 'attendances': attendances},
+        {'cell_id': cell_id, 'meeting_date': '2030-01-12', 'attendances': attendances},
+    ])
+    assert response.status_code == 201, response.get_json()
+    results = response.get_json()['results']
+    assert results[0]['status'] == 'created'
+    assert results[1]['code'] == 409